@@ -3,7 +3,10 @@ from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import math
+import time
+import ctypes
 import numpy as np  
+import Transform_3D
 
 # Constants
 LARGURA_JANELA = 800
@@ -12,6 +15,11 @@ FPS = 60
 LARGURA_3D = 600
 ALTURA_3D = 500
 
+# Anti-aliasing of the 3D FBO: MSAA samples (2/4/8, 0 = off) or a
+# supersampling factor (render at N x the size, filtered down on resolve)
+FBO_SAMPLES = 0
+FBO_SUPERSAMPLE = 1
+
 # Transformation step sizes
 ROTATION_STEP = 5.0  # degrees
 TRANSLATION_STEP = 0.2  # units  
@@ -22,6 +30,22 @@ MATERIAL_COLORS = {
     'red': {'ambient': [0.2, 0.0, 0.0, 1.0], 'diffuse': [0.8, 0.2, 0.2, 1.0], 'specular': [1.0, 1.0, 1.0, 1.0], 'shininess': 30.0},
     'blue': {'ambient': [0.0, 0.0, 0.2, 1.0], 'diffuse': [0.2, 0.2, 0.8, 1.0], 'specular': [1.0, 1.0, 1.0, 1.0], 'shininess': 50.0},}
 
+# Options for the enum-like Estado3D fields
+SHAPES = ['sphere', 'cube', 'torus', 'pyramid']
+CAMERA_ANGLES = ['front', 'top', 'side', 'diagonal']
+LIGHTING_MODELS = ['flat', 'gouraud', 'phong']
+
+# Camera (eye, up) for each camera angle, all looking at the origin
+CAMERA_VIEWS = {
+    'front': ((0, 0, 8), (0, 1, 0)),
+    'top': ((0, 8, 0.1), (0, 0, -1)),
+    'side': ((8, 0, 0), (0, 1, 0)),
+    'diagonal': ((5, 5, 5), (0, 1, 0)),
+}
+FOV_Y = 45
+Z_NEAR = 0.1
+Z_FAR = 50.0
+
 LIGHT_AMBIENT = [0.2, 0.2, 0.2, 1.0]
 LIGHT_DIFFUSE = [1.0, 1.0, 1.0, 1.0]
 
@@ -40,14 +64,98 @@ class Estado3D:
         self.translation_x = 0.0
         self.translation_y = 0.0
         self.translation_z = 0.0
+        # Optional many-object scene (Scene_3D.InstanceList or SceneGraph) drawn instead of shape.
+        # Local to one process: not part of the GUI <-> 3D state sync
+        self.scene = None
+        # Optional extra point lights (Lights_3D.LightList), used by Phong. Also local
+        self.lights = None
+
+# Estado3D fields the GUI process keeps in sync with the 3D process
+SYNC_FIELDS = ['light_pos', 'material', 'shape', 'camera_angle', 'lighting_model',
+               'rotation_x', 'rotation_y', 'rotation_z',
+               'translation_x', 'translation_y', 'translation_z']
+
+def estado_snapshot(estado):
+    """Copy of the synced fields of an Estado3D"""
+    return {field: list(getattr(estado, field)) if field == 'light_pos' else getattr(estado, field)
+            for field in SYNC_FIELDS}
+
+class StateSender:
+    """
+    GUI side of the state sync protocol!!
+
+    Instead of one message per button press / key repeat, flush() sends (at
+    most once per GUI frame) a single message with every field that changed
+    since the last flush, tagged with an increasing sequence number and the
+    time.monotonic_ns() of the input that caused it (for latency tracking).
+    """
+    def __init__(self, cmd_queue, estado):
+        self.cmd_queue = cmd_queue
+        self.estado = estado
+        self.sent = estado_snapshot(estado)
+        self.seq = 0
+
+    def flush(self, timestamp_ns=None):
+        current = estado_snapshot(self.estado)
+        delta = {field: value for field, value in current.items() if self.sent[field] != value}
+        if not delta:
+            return False
+        self.seq += 1
+        self.cmd_queue.put({'type': 'state', 'seq': self.seq, 'fields': delta,
+                            't': timestamp_ns or time.monotonic_ns()})
+        self.sent = current
+        return True
+
+class StateReceiver:
+    """
+    3D side of the state sync protocol: last writer wins per field.
+    A field is only written by a message newer than the one that last wrote
+    it, so stale (older sequence number) updates are dropped.
+    """
+    def __init__(self, estado):
+        self.estado = estado
+        self.field_seq = {field: 0 for field in SYNC_FIELDS}
+        self.dropped = 0
+
+    def apply(self, msg):
+        """Applies a 'state' message, returns True if Estado3D changed"""
+        changed = False
+        for field, value in msg['fields'].items():
+            if field not in self.field_seq:
+                continue
+            if msg['seq'] <= self.field_seq[field]:
+                self.dropped += 1
+                continue
+            self.field_seq[field] = msg['seq']
+            if getattr(self.estado, field) != value:
+                setattr(self.estado, field, value)
+                changed = True
+        return changed
 
 class FBO:
-    def __init__(self, width, height):
+    """
+    Render target of the 3D view: a GL_RGBA texture (what gets displayed and
+    read back) of width x height.
+
+    With samples > 1 (MSAA) or else supersample > 1 the scene is drawn into
+    a separate render FBO instead (multisampled renderbuffers, or
+    supersample x the size) and resolve() copies it into the texture with
+    glBlitFramebuffer. Samples above GL_MAX_SAMPLES are clamped.
+    """
+    def __init__(self, width, height, readback_buffers=3, samples=None, supersample=None):
         self.width = width
         self.height = height
+        self.nbytes = width * height * 4
+        # Asynchronous readback ring (PBOs are created on first use)
+        self.readback_buffers = readback_buffers
+        self.pbos = None
+        self.fences = [None] * readback_buffers
+        self.next_pbo = 0
+        self.frame = np.empty((height, width, 4), dtype=np.uint8)  # Persistent top-down frame
+        self.frame_ready = False        # self.frame holds a frame (from either readback)
+        self.async_frame_ready = False  # ... and a PBO copy has landed since the ring was created
         self.fbo = glGenFramebuffers(1)
         self.texture = glGenTextures(1)
-        self.depth_buffer = glGenRenderbuffers(1)
         
         glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
         
@@ -57,33 +165,202 @@ class FBO:
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+
+        # Anti-aliasing: draw into a render FBO, resolved into the texture
+        # (one or the other: a multisampled blit cannot scale)
+        samples = FBO_SAMPLES if samples is None else samples
+        self.samples = min(samples, int(glGetIntegerv(GL_MAX_SAMPLES))) if samples > 1 else 0
+        self.supersample = 1 if self.samples else max(int(FBO_SUPERSAMPLE if supersample is None else supersample), 1)
+        self.render_width = width * self.supersample
+        self.render_height = height * self.supersample
+        self.render_fbo = None
+        self.color_buffer = None
+        self.depth_buffer = glGenRenderbuffers(1)
+
+        if self.samples or self.supersample > 1:
+            self.render_fbo = glGenFramebuffers(1)
+            self.color_buffer = glGenRenderbuffers(1)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.render_fbo)
+            glBindRenderbuffer(GL_RENDERBUFFER, self.color_buffer)
+            glRenderbufferStorageMultisample(GL_RENDERBUFFER, self.samples, GL_RGBA8, self.render_width, self.render_height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color_buffer)
+            if self.samples:
+                self.samples = int(glGetRenderbufferParameteriv(GL_RENDERBUFFER, GL_RENDERBUFFER_SAMPLES))  # What the driver gave
         
-        # Depth buffer
+        # Depth buffer (of the render FBO when there is one)
         glBindRenderbuffer(GL_RENDERBUFFER, self.depth_buffer)
-        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT, width, height)
+        glRenderbufferStorageMultisample(GL_RENDERBUFFER, self.samples, GL_DEPTH_COMPONENT, self.render_width, self.render_height)
         glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth_buffer)
         
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
+    def get_mode(self):
+        """Anti-aliasing mode name: 'off', '4x MSAA' or '2x2 SSAA'"""
+        if self.samples:
+            return f"{self.samples}x MSAA"
+        if self.supersample > 1:
+            return f"{self.supersample}x{self.supersample} SSAA"
+        return "off"
+
     def bind(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
-        glViewport(0, 0, self.width, self.height)
+        """Binds the FBO to draw into (the render FBO when anti-aliased)"""
+        glBindFramebuffer(GL_FRAMEBUFFER, self.render_fbo or self.fbo)
+        glViewport(0, 0, self.render_width, self.render_height)
 
     def unbind(self):
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
-    def get_texture_surface(self):
+    def resolve(self):
+        """
+        Copies the render FBO into the texture: MSAA samples averaged by the
+        blit, supersampling filtered down with GL_LINEAR (an exact 2x2 box for
+        a factor of 2). Nothing to do without anti-aliasing.
+        """
+        if self.render_fbo is None:
+            return
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.render_fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.fbo)
+        glBlitFramebuffer(0, 0, self.render_width, self.render_height, 0, 0, self.width, self.height,
+                          GL_COLOR_BUFFER_BIT, GL_LINEAR if self.supersample > 1 else GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def read_pixels(self):
+        """
+        Synchronous readback (stalls until the GPU is done).
+        Returns the persistent top-down (height, width, 4) frame array.
+        """
         glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
         pixels = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        # Convert to numpy array and reshape for flipping
+        # Flip vertically for Pygame (OpenGL origin is bottom-left) while copying into the frame
         pixels = np.frombuffer(pixels, dtype=np.uint8).reshape((self.height, self.width, 4))
-        # Flip vertically for Pygame (OpenGL origin is bottom-left)
-        pixels = np.flipud(pixels)
-        # Flatten back to bytes
-        pixels_bytes = pixels.tobytes()
-        image = pygame.image.frombuffer(pixels_bytes, (self.width, self.height), "RGBA")
-        return image
+        np.copyto(self.frame, pixels[::-1])
+        self.frame_ready = True
+        return self.frame
+
+    def read_pixels_async(self):
+        """
+        Asynchronous readback through a ring of pixel buffer objects + fences.
+
+        Queues a glReadPixels of the current frame into the next PBO and returns
+        the newest frame whose copy has already finished (a few frames old), as
+        the persistent top-down frame array. Returns None until the first copy lands.
+        Only blocks when every PBO in the ring is still in flight.
+        """
+        if self.pbos is None:
+            self.pbos = [int(pbo) for pbo in np.atleast_1d(glGenBuffers(self.readback_buffers))]
+            for pbo in self.pbos:
+                glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+                glBufferData(GL_PIXEL_PACK_BUFFER, self.nbytes, None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        # Ring is full: the slot we are about to reuse must be collected first
+        slot = self.next_pbo
+        if self.fences[slot] is not None:
+            self._collect(slot, wait=True)
+
+        # Queue the copy (returns immediately, the GPU writes into the PBO)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[slot])
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        self.fences[slot] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.next_pbo = (slot + 1) % self.readback_buffers
+
+        # Collect, oldest first, every copy that already finished
+        for k in range(1, self.readback_buffers):
+            older = (slot + k) % self.readback_buffers
+            if self.fences[older] is not None and not self._collect(older, wait=False):
+                break
+        return self.frame if self.async_frame_ready else None
+
+    def _collect(self, slot, wait):
+        """Copies a finished PBO into the frame (flipping on the fly). False if not finished yet."""
+        fence = self.fences[slot]
+        timeout = GL_TIMEOUT_IGNORED if wait else 0
+        if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, timeout) == GL_TIMEOUT_EXPIRED:
+            return False
+        glDeleteSync(fence)
+        self.fences[slot] = None
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[slot])
+        address = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.nbytes, GL_MAP_READ_BIT)
+        mapped = np.ctypeslib.as_array((ctypes.c_ubyte * self.nbytes).from_address(address))
+        np.copyto(self.frame, mapped.reshape((self.height, self.width, 4))[::-1])
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.frame_ready = self.async_frame_ready = True
+        return True
+
+    def get_texture_surface(self, asynchronous=False):
+        """
+        Current frame as a pygame Surface sharing memory with self.frame
+        (no extra copies). With asynchronous=True the frame is a few frames
+        old and None is returned until the first readback completes.
+        """
+        pixels = self.read_pixels_async() if asynchronous else self.read_pixels()
+        if pixels is None:
+            return None
+        return pygame.image.frombuffer(pixels, (self.width, self.height), "RGBA")
+
+    def delete(self):
+        """Frees the GL objects (FBO, texture, depth buffer and readback PBOs)"""
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        self.fences = [None] * self.readback_buffers
+        if self.pbos is not None:
+            glDeleteBuffers(len(self.pbos), self.pbos)
+            self.pbos = None
+        self.async_frame_ready = False
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures([self.texture])
+        glDeleteRenderbuffers(1, [self.depth_buffer])
+        if self.render_fbo is not None:
+            glDeleteFramebuffers(1, [self.render_fbo])
+            glDeleteRenderbuffers(1, [self.color_buffer])
+
+class DepthFBO:
+    """
+    Depth-only variant of FBO (shadow maps): a single depth texture set up
+    for sampler2DShadow lookups, with linear filtering so every lookup
+    already compares 2x2 texels. Outside the map counts as lit.
+    """
+    def __init__(self, width, height=None):
+        self.width = width
+        self.height = height or width
+        self.fbo = glGenFramebuffers(1)
+        self.texture = glGenTextures(1)
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_DEPTH_COMPONENT24, self.width, self.height, 0,
+                     GL_DEPTH_COMPONENT, GL_FLOAT, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_BORDER)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_BORDER)
+        glTexParameterfv(GL_TEXTURE_2D, GL_TEXTURE_BORDER_COLOR, [1.0, 1.0, 1.0, 1.0])
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_COMPARE_MODE, GL_COMPARE_REF_TO_TEXTURE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_COMPARE_FUNC, GL_LEQUAL)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_TEXTURE_2D, self.texture, 0)
+        glDrawBuffer(GL_NONE)  # No color attachment
+        glReadBuffer(GL_NONE)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def unbind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures([self.texture])
 
 def init_opengl():
     glEnable(GL_DEPTH_TEST)
@@ -94,21 +371,38 @@ def init_opengl():
     glShadeModel(GL_SMOOTH)
     glEnable(GL_NORMALIZE)
 
-def draw_shape(shape_name='sphere', material_name='orange'):
-    """Draw the specified shape with the given material"""
+def release_opengl():
+    """
+    Deletes every GL object cached at module level (programs, UBOs, light
+    buffers, shadow map, meshes) while the context is still current, so a
+    new context (e.g. a second headless renderer) starts from scratch!!
+    """
+    import Scene_3D
+    from Object import Mesh
+    from Light import ShaderManager, UniformBlocks, LightBuffers, ShadowMap, LightingPhong
+    ShaderManager.release()
+    UniformBlocks.release()
+    LightBuffers.release()
+    ShadowMap.release()
+    LightingPhong.release()
+    Mesh.release()
+    Scene_3D.release_lod()
+
+def draw_shape(shape_name='sphere', material_name='orange', smooth=True):
+    """Draw the specified shape with the given material (smooth: GL_SMOOTH quad split)"""
     # Import shape modules dynamically
     if shape_name == 'sphere':
         from Object import Sphere
         Sphere.draw_sphere(MATERIAL_COLORS, material_name)
     elif shape_name == 'cube':
         from Object import Cube
-        Cube.draw_cube(MATERIAL_COLORS, material_name)
+        Cube.draw_cube(MATERIAL_COLORS, material_name, smooth)
     elif shape_name == 'torus':
         from Object import Torus
         Torus.draw_torus(MATERIAL_COLORS, material_name)
     elif shape_name == 'pyramid':
         from Object import Pyramid
-        Pyramid.draw_pyramid(MATERIAL_COLORS, material_name)
+        Pyramid.draw_pyramid(MATERIAL_COLORS, material_name, smooth)
     else:
         # Default to sphere
         from Object import Sphere
@@ -118,70 +412,135 @@ def draw_shape(shape_name='sphere', material_name='orange'):
 def draw_sphere(material_name='orange'):
     draw_shape('sphere', material_name)
 
+def set_material(material_name='orange'):
+    """Fixed-function material from MATERIAL_COLORS"""
+    material = MATERIAL_COLORS.get(material_name, MATERIAL_COLORS['orange'])
+    glMaterialfv(GL_FRONT, GL_AMBIENT, material['ambient'])
+    glMaterialfv(GL_FRONT, GL_DIFFUSE, material['diffuse'])
+    glMaterialfv(GL_FRONT, GL_SPECULAR, material['specular'])
+    glMaterialf(GL_FRONT, GL_SHININESS, material['shininess'])
+
+_camera_cache = {}
+
+def camera_matrices(estado, aspect=LARGURA_3D / ALTURA_3D):
+    """
+    Row-major (projection, view) of estado's camera, computed with NumPy
+    (cached per camera angle, unknown angles use the front view).
+    """
+    key = (estado.camera_angle if estado.camera_angle in CAMERA_VIEWS else 'front', aspect)
+    if key not in _camera_cache:
+        eye, up = CAMERA_VIEWS[key[0]]
+        _camera_cache[key] = (Transform_3D.perspective(FOV_Y, aspect, Z_NEAR, Z_FAR),
+                              Transform_3D.look_at(eye, (0, 0, 0), up))
+    return _camera_cache[key]
+
+def get_lighting(model_name='gouraud'):
+    """Light module (LightingFlat / LightingGouraud / LightingPhong) of a lighting model"""
+    from Light.ShaderManager import LIGHTING_MODULES
+    return LIGHTING_MODULES.get(model_name, LIGHTING_MODULES['gouraud'])
+
+def load_fixed_function_matrices(estado, projection, view, modelview):
+    """GL matrix stack and GL_LIGHT0 for the fixed-function fallback (row-major NumPy matrices)"""
+    glMatrixMode(GL_PROJECTION)
+    glLoadMatrixf(Transform_3D.to_gl(projection))
+    glMatrixMode(GL_MODELVIEW)
+    glLoadMatrixf(Transform_3D.to_gl(view))
+
+    # Set light position BEFORE transformations!!
+    update_light(estado)
+
+    # Apply 3D transformations to the object!!
+    glLoadMatrixf(Transform_3D.to_gl(modelview))
+
+def draw_scene(estado, lighting, projection, view, modelview, viewport_height):
+    """
+    Draws estado.scene with the lighting module's instanced program, or one
+    draw per instance in the fixed-function fallback (which cannot read
+    per-instance attributes). Either way only the visible instances are
+    drawn, at their LOD level. Matrices are row-major.
+    """
+    import Scene_3D
+    from Light import LightingPhong, LightingGouraud
+    Scene_3D.preload_lod()
+    scene = estado.scene.instances()  # InstanceList, or a SceneGraph flattened into one
+    if lighting.enable(instanced=True):
+        lighting.draw_instanced(estado, scene, projection, view, modelview, viewport_height)
+        return
+    load_fixed_function_matrices(estado, projection, view, modelview)
+    set_lighting_model(estado.lighting_model)
+    records, batches, _ = scene.cull(modelview, projection, viewport_height)
+    materials = list(MATERIAL_COLORS)
+    quad_params = {} if estado.lighting_model == 'flat' else LightingGouraud.SMOOTH_QUAD_PARAMS
+    scene.triangles = 0
+    for shape, params, first, count in batches:
+        mesh = LightingPhong.get_mesh(shape, quad_params.get(shape, params))
+        for record in records[first:first + count]:
+            glPushMatrix()
+            glMultMatrixf(record['model'])  # Records are column-major already
+            set_material(materials[record['material']])
+            mesh.draw()
+            glPopMatrix()
+        scene.triangles += mesh.index_count // 3 * count
+
 def update_light(estado):
     glLightfv(GL_LIGHT0, GL_POSITION, estado.light_pos)
 
 def set_lighting_model(model_name='gouraud'):  # Defaut Shading = gouraud!!
     """
-    Configura o modelo de iluminação (flat, gouraud ou phong)
+    Configura o modelo de iluminação (flat, gouraud ou phong) do pipeline
+    fixo, usado so quando os shaders nao compilam (phong vira gouraud)
     
     So um ifelse normal!!
     """
-    if model_name == 'phong':
-        return  # Handled separately because of custom OpenGL implementation!!
     if model_name == 'flat':
         from Light import LightingFlat
-        LightingFlat.enable()
-    elif model_name == 'gouraud':
-        from Light import LightingGouraud
-        LightingGouraud.enable()
+        LightingFlat.enable_fixed_function()
     else:
         from Light import LightingGouraud
-        LightingGouraud.enable()
+        LightingGouraud.enable_fixed_function()
+
+def render_3d_to_texture(estado, fbo, gpu_timer=None):
+    """Renders the scene into fbo (gpu_timer: Profiler_3D.GPUTimer for the shadow / clear / geometry / resolve stages)"""
+    # Camera and object transform on the CPU, sent to the shaders as uniforms
+    projection, view = camera_matrices(estado)
+    modelview = view @ Transform_3D.estado_model_matrix(estado)
+
+    # Every lighting model is a GLSL program over the same VAOs and UBOs:
+    # switching model is a program bind
+    lighting = get_lighting(estado.lighting_model)
+    if estado.lighting_model == 'phong':
+        from Light import LightBuffers, ShadowMap
+        # Point lights assigned to screen tiles on the CPU (see Lights_3D)
+        LightBuffers.update(estado.lights, view, projection, fbo.render_width, fbo.render_height)
+        # Depth pre-pass into its own FBO, only when the light or the geometry changed
+        ShadowMap.update(estado, gpu_timer)
 
-def render_3d_to_texture(estado, fbo):
     fbo.bind()
+    if gpu_timer:
+        gpu_timer.begin('clear')
     glClearColor(0.1, 0.1, 0.2, 1.0)  # Dark background!!
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    if gpu_timer:
+        gpu_timer.end('clear')
+        gpu_timer.begin('geometry')
 
-    # Set up projection matrix
-    glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-    gluPerspective(45, LARGURA_3D / ALTURA_3D, 0.1, 50.0)
-
-    # Set up modelview matrix with camera position
-    glMatrixMode(GL_MODELVIEW)
-    glLoadIdentity()
-
-    # Camera positions for different angles
-    if estado.camera_angle == 'front':
-        gluLookAt(0, 0, 8, 0, 0, 0, 0, 1, 0)  # Front view
-    elif estado.camera_angle == 'top':
-        gluLookAt(0, 8, 0.1, 0, 0, 0, 0, 0, -1)  # Top view
-    elif estado.camera_angle == 'side':
-        gluLookAt(8, 0, 0, 0, 0, 0, 0, 1, 0)  # Side view
-    elif estado.camera_angle == 'diagonal':
-        gluLookAt(5, 5, 5, 0, 0, 0, 0, 1, 0)  # Diagonal view
-    else:
-        gluLookAt(0, 0, 8, 0, 0, 0, 0, 1, 0)  # Default front
-
-    # Set light position BEFORE transformations!!
-    update_light(estado)
-
-    # Apply 3D transformations to the object!!
-    glTranslatef(estado.translation_x, estado.translation_y, estado.translation_z)
-    glRotatef(estado.rotation_x, 1, 0, 0)
-    glRotatef(estado.rotation_y, 0, 1, 0)
-    glRotatef(estado.rotation_z, 0, 0, 1)
-
-    # Handle lighting and drawing
-    if estado.lighting_model == 'phong':
-        from Light import LightingPhong
-        LightingPhong.enable(estado)
-        LightingPhong.draw_phong(estado)
-        LightingPhong.disable()
+    if estado.scene is not None:
+        draw_scene(estado, lighting, projection, view, modelview, fbo.render_height)
+    elif lighting.enable():
+        lighting.draw(estado, projection, view, modelview)
     else:
+        load_fixed_function_matrices(estado, projection, view, modelview)
         set_lighting_model(estado.lighting_model)
-        draw_shape(estado.shape, estado.material)
-    
+        draw_shape(estado.shape, estado.material, estado.lighting_model != 'flat')
+    glUseProgram(0)  # The blit and the overlay use the fixed pipeline
+
+    if gpu_timer:
+        gpu_timer.end('geometry')
+    if fbo.render_fbo is not None:
+        # MSAA / supersampled render FBO -> display texture
+        if gpu_timer:
+            gpu_timer.begin('resolve')
+        fbo.resolve()
+        if gpu_timer:
+            gpu_timer.end('resolve')
     fbo.unbind()
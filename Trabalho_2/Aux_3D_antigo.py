@@ -98,21 +98,21 @@ def init_opengl():
     glShadeModel(GL_SMOOTH)
     glEnable(GL_NORMALIZE)
 
-def draw_shape(shape_name='sphere', material_name='orange'):
-    """Draw the specified shape with the given material"""
+def draw_shape(shape_name='sphere', material_name='orange', smooth=True):
+    """Draw the specified shape with the given material (smooth: GL_SMOOTH quad split)"""
     # Import shape modules dynamically
     if shape_name == 'sphere':
         from Object import Sphere
         Sphere.draw_sphere(MATERIAL_COLORS, material_name)
     elif shape_name == 'cube':
         from Object import Cube
-        Cube.draw_cube(MATERIAL_COLORS, material_name)
+        Cube.draw_cube(MATERIAL_COLORS, material_name, smooth)
     elif shape_name == 'torus':
         from Object import Torus
         Torus.draw_torus(MATERIAL_COLORS, material_name)
     elif shape_name == 'pyramid':
         from Object import Pyramid
-        Pyramid.draw_pyramid(MATERIAL_COLORS, material_name)
+        Pyramid.draw_pyramid(MATERIAL_COLORS, material_name, smooth)
     else:
         # Default to sphere
         from Object import Sphere
@@ -154,15 +154,16 @@ def set_lighting_model(model_name='gouraud'):  # Defaut Shading = gouraud!!
     """
     if model_name == 'phong':
         return  # Handled separately because of custom OpenGL implementation!!
+    # enable() binds the GLSL programs now: this path draws with the fixed pipeline
     if model_name == 'flat':
         from Light import LightingFlat
-        LightingFlat.enable()
+        LightingFlat.enable_fixed_function()
     elif model_name == 'gouraud':
         from Light import LightingGouraud
-        LightingGouraud.enable()
+        LightingGouraud.enable_fixed_function()
     else:
         from Light import LightingGouraud
-        LightingGouraud.enable()
+        LightingGouraud.enable_fixed_function()
 
 def render_3d_to_texture(estado, fbo):
     fbo.bind()
@@ -207,11 +208,13 @@ def render_3d_to_texture(estado, fbo):
     # Handle lighting and drawing
     if estado.lighting_model == 'phong':
         from Light import LightingPhong
-        LightingPhong.enable(estado)
-        LightingPhong.draw_phong(estado)
+        # draw_phong takes row-major matrices: read back the ones built on the GL stack above
+        projection = np.asarray(glGetFloatv(GL_PROJECTION_MATRIX), dtype=np.float64).reshape(4, 4).T
+        modelview = np.asarray(glGetFloatv(GL_MODELVIEW_MATRIX), dtype=np.float64).reshape(4, 4).T
+        LightingPhong.draw_phong(estado, projection, modelview)
         LightingPhong.disable()
     else:
         set_lighting_model(estado.lighting_model)
-        draw_shape(estado.shape, estado.material)
+        draw_shape(estado.shape, estado.material, estado.lighting_model != 'flat')
 
     fbo.unbind()
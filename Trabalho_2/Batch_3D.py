@@ -0,0 +1,120 @@
+"""
+Batch render farm
+
+Renders many Estado3D configurations (shape x material x camera x lighting)
+across a multiprocessing pool. Each worker owns its own headless GL context
+and FBO and writes PNG (or raw .npy) frames straight to disk!!
+
+    python3 Batch_3D.py [output_dir] [processes]
+"""
+import Headless_3D  # Must come first: picks the headless GL platform
+import os
+import sys
+import time
+import itertools
+import multiprocessing as mp
+import numpy as np
+import pygame
+
+from Aux_3D import (Estado3D, MATERIAL_COLORS, LARGURA_3D, ALTURA_3D,
+                    SHAPES, CAMERA_ANGLES, LIGHTING_MODELS, SYNC_FIELDS)
+
+# Estado3D fields a parameter set may override
+SCENE_FIELDS = SYNC_FIELDS
+
+def scene_grid(shapes=SHAPES, materials=tuple(MATERIAL_COLORS), cameras=CAMERA_ANGLES, lighting_models=LIGHTING_MODELS):
+    """Every shape x material x camera x lighting combination, as parameter dicts"""
+    return [{'shape': shape, 'material': material, 'camera_angle': camera, 'lighting_model': lighting}
+            for shape, material, camera, lighting in itertools.product(shapes, materials, cameras, lighting_models)]
+
+def scene_params(scene):
+    """Estado3D or dict -> plain dict of scene fields (cheap to pickle)"""
+    if isinstance(scene, Estado3D):
+        return {field: getattr(scene, field) for field in SCENE_FIELDS}
+    return dict(scene)
+
+def make_estado(params):
+    estado = Estado3D()
+    for field, value in params.items():
+        if field not in SCENE_FIELDS:
+            raise ValueError(f"Unknown Estado3D field '{field}'")
+        setattr(estado, field, value)
+    return estado
+
+def frame_name(index, params):
+    parts = [params.get(field, getattr(Estado3D(), field)) for field in ('shape', 'material', 'camera_angle', 'lighting_model')]
+    return f"{index:05d}_" + "_".join(parts)
+
+# Per-worker state (set by init_worker in each process)
+worker_renderer = None
+
+def init_worker(width, height):
+    """Pool initializer: one headless context + FBO per worker process"""
+    global worker_renderer
+    # One rasterizer thread per process: the pool provides the parallelism
+    os.environ.setdefault('LP_NUM_THREADS', '1')
+    worker_renderer = Headless_3D.HeadlessRenderer(width, height)
+
+def render_task(task):
+    """Renders one scene and writes it to disk. Returns (index, path, render seconds, pid)."""
+    index, params, output_dir, fmt = task
+    start = time.perf_counter()
+    frame = worker_renderer.render(make_estado(params))
+    elapsed = time.perf_counter() - start
+
+    path = os.path.join(output_dir, frame_name(index, params))
+    if fmt == 'png':
+        path += '.png'
+        surface = pygame.image.frombuffer(frame, (frame.shape[1], frame.shape[0]), "RGBA")
+        pygame.image.save(surface, path)
+    else:
+        path += '.npy'
+        np.save(path, frame)
+    return index, path, elapsed, os.getpid()
+
+def render_batch(scenes, output_dir, processes=None, fmt='png', width=LARGURA_3D, height=ALTURA_3D, chunksize=4):
+    """
+    Renders every scene (Estado3D objects or parameter dicts) across a pool.
+
+    Returns a dict with the written paths (in input order), the total frames
+    per second (wall clock) and frames / FPS per worker (render time only).
+    """
+    if fmt not in ('png', 'raw'):
+        raise ValueError("fmt must be 'png' or 'raw'")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(index, scene_params(scene), output_dir, fmt) for index, scene in enumerate(scenes)]
+    processes = processes or os.cpu_count()
+
+    paths = [None] * len(tasks)
+    workers = {}  # pid -> [frames, render seconds]
+    # spawn: every worker starts clean and builds its own GL context
+    context = mp.get_context('spawn')
+    start = time.perf_counter()
+    with context.Pool(processes, initializer=init_worker, initargs=(width, height)) as pool:
+        for index, path, elapsed, pid in pool.imap_unordered(render_task, tasks, chunksize):
+            paths[index] = path
+            worker = workers.setdefault(pid, [0, 0.0])
+            worker[0] += 1
+            worker[1] += elapsed
+    wall = time.perf_counter() - start
+
+    return {
+        'paths': paths,
+        'frames': len(tasks),
+        'seconds': wall,
+        'fps': len(tasks) / wall if wall > 0 else 0.0,
+        'workers': {pid: {'frames': frames, 'fps': frames / busy if busy > 0 else 0.0}
+                    for pid, (frames, busy) in workers.items()},
+    }
+
+def main():
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else 'batch_output'
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    scenes = scene_grid()
+    stats = render_batch(scenes, output_dir, processes)
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f} s -> {stats['fps']:.1f} FPS total")
+    for pid, worker in sorted(stats['workers'].items()):
+        print(f"  worker {pid}: {worker['frames']} frames, {worker['fps']:.1f} FPS")
+
+if __name__ == "__main__":
+    main()
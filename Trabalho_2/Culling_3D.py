@@ -0,0 +1,123 @@
+"""
+View-frustum culling
+
+Instances are bounded by spheres (the mesh's local bounding sphere moved by
+the model matrix) and grouped in a bounding volume hierarchy of boxes. Each
+frame the BVH is walked one level at a time against the six frustum planes,
+all nodes of a level tested at once with NumPy: subtrees fully outside are
+dropped, subtrees fully inside are accepted whole and only the leaves that
+straddle a plane test their spheres one by one!!
+"""
+import numpy as np
+
+BVH_LEAF_SIZE = 32
+
+def frustum_planes(clip):
+    """
+    The 6 planes (a, b, c, d), normalized and pointing inside, of the frustum
+    of clip = projection @ modelview (row-major). A point p is inside a plane
+    when a*x + b*y + c*z + d >= 0 (Gribb / Hartmann extraction).
+    """
+    clip = np.asarray(clip, dtype=np.float64)
+    rows = clip[3] + np.array([clip[0], -clip[0], clip[1], -clip[1], clip[2], -clip[2]])
+    return rows / np.linalg.norm(rows[:, :3], axis=1, keepdims=True)
+
+def transform_spheres(matrices, centers, radii):
+    """
+    World bounding spheres of local spheres (centers (N,3), radii (N,)) under
+    model matrices (N,4,4): the radius grows with the largest axis scale.
+    """
+    world_centers = np.einsum('nij,nj->ni', matrices[:, :3, :3], centers) + matrices[:, :3, 3]
+    axis_scale = np.sqrt((matrices[:, :3, :3] ** 2).sum(axis=1)).max(axis=1)
+    return world_centers, radii * axis_scale
+
+def spheres_visible(centers, radii, planes):
+    """Boolean mask of the spheres that are not completely behind a frustum plane"""
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return (distances >= -radii[:, None]).all(axis=1)
+
+def _ranges(starts, ends):
+    """Concatenation of arange(start, end) for each pair, without a Python loop"""
+    lengths = ends - starts
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return shifts + np.arange(lengths.sum())
+
+class BVH:
+    """
+    Binary tree of axis-aligned boxes over bounding spheres, split at the
+    median along the longest axis. Every node covers the contiguous range
+    order[start:end], so a subtree that is fully visible is a single range.
+    """
+    def __init__(self, centers, radii, leaf_size=BVH_LEAF_SIZE):
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.order = np.arange(len(self.radii))
+        lo_all = self.centers - self.radii[:, None]
+        hi_all = self.centers + self.radii[:, None]
+
+        lo, hi, starts, ends, lefts, rights = [], [], [], [], [], []
+        stack = [(0, len(self.radii), -1, 0)]  # (start, end, parent, is right child)
+        while stack:
+            start, end, parent, right = stack.pop()
+            node = len(starts)
+            items = self.order[start:end]
+            lo.append(lo_all[items].min(axis=0) if len(items) else np.zeros(3))
+            hi.append(hi_all[items].max(axis=0) if len(items) else np.zeros(3))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            if parent >= 0:
+                (rights if right else lefts)[parent] = node
+            if end - start > leaf_size:
+                centers = self.centers[items]
+                axis = np.argmax(centers.max(axis=0) - centers.min(axis=0))
+                mid = (end - start) // 2
+                self.order[start:end] = items[np.argpartition(centers[:, axis], mid)]
+                stack.append((start + mid, end, node, 1))
+                stack.append((start, start + mid, node, 0))
+
+        self.lo = np.array(lo)
+        self.hi = np.array(hi)
+        self.starts = np.array(starts)
+        self.ends = np.array(ends)
+        self.lefts = np.array(lefts)
+        self.rights = np.array(rights)
+        self.nodes_tested = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def cull(self, planes):
+        """Indices (sorted) of the spheres inside the frustum planes"""
+        normals, offsets = planes[:, :3], planes[:, 3]
+        positive = normals >= 0
+        accepted = []   # Node ranges entirely inside
+        candidates = []  # Leaves crossing a plane
+        self.nodes_tested = 0
+
+        frontier = np.zeros(1, dtype=np.int64) if len(self.radii) else np.zeros(0, dtype=np.int64)
+        while len(frontier):
+            self.nodes_tested += len(frontier)
+            lo, hi = self.lo[frontier][:, None, :], self.hi[frontier][:, None, :]
+            # Box corner farthest along / against each plane normal
+            far = np.where(positive, hi, lo)
+            near = np.where(positive, lo, hi)
+            outside = ((far * normals).sum(axis=2) + offsets < 0).any(axis=1)
+            inside = ((near * normals).sum(axis=2) + offsets >= 0).all(axis=1)
+
+            accepted.append(frontier[~outside & inside])
+            crossing = frontier[~outside & ~inside]
+            leaf = self.lefts[crossing] < 0
+            candidates.append(crossing[leaf])
+            inner = crossing[~leaf]
+            frontier = np.concatenate([self.lefts[inner], self.rights[inner]])
+
+        accepted = np.concatenate(accepted) if accepted else np.zeros(0, dtype=np.int64)
+        candidates = np.concatenate(candidates) if candidates else np.zeros(0, dtype=np.int64)
+        visible = self.order[_ranges(self.starts[accepted], self.ends[accepted])]
+        tested = self.order[_ranges(self.starts[candidates], self.ends[candidates])]
+        tested = tested[spheres_visible(self.centers[tested], self.radii[tested], planes)]
+        return np.sort(np.concatenate([visible, tested]))
@@ -0,0 +1,244 @@
+"""
+Headless (offscreen) rendering of Estado3D scenes
+
+No window and no display: an EGL (surfaceless) or OSMesa software context
+renders into the usual FBO and frames come back as NumPy arrays!!
+
+The GL platform has to be chosen before anything imports OpenGL, so import
+this module first (or set PYOPENGL_PLATFORM yourself):
+
+    PYOPENGL_PLATFORM=egl     (defaut, Mesa llvmpipe or a GPU driver)
+    PYOPENGL_PLATFORM=osmesa  (pure software, needs libOSMesa)
+"""
+import os
+os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+os.environ.setdefault('EGL_PLATFORM', 'surfaceless')  # Mesa: no X11/Wayland needed
+
+import ctypes
+import time
+import numpy as np
+from OpenGL.GL import *
+
+from Aux_3D import Estado3D, FBO, init_opengl, release_opengl, render_3d_to_texture, LARGURA_3D, ALTURA_3D
+from Profiler_3D import GPUTimer
+from Light import ShaderManager
+
+class HeadlessContext:
+    """GL context without any window (EGL surfaceless or OSMesa)"""
+    def __init__(self, width=LARGURA_3D, height=ALTURA_3D):
+        self.backend = os.environ['PYOPENGL_PLATFORM']
+        if self.backend == 'egl':
+            self._create_egl()
+        elif self.backend == 'osmesa':
+            self._create_osmesa(width, height)
+        else:
+            raise RuntimeError(f"Headless rendering needs PYOPENGL_PLATFORM=egl or osmesa, got '{self.backend}' "
+                               "(import Headless_3D before anything imports OpenGL)")
+
+    def _create_egl(self):
+        from OpenGL import EGL
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("eglInitialize failed")
+
+        attributes = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                      EGL.EGL_NONE]
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, (EGL.EGLint * len(attributes))(*attributes),
+                            ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value < 1:
+            raise RuntimeError("No EGL config with desktop OpenGL support")
+
+        # Desktop GL (compatibility profile: Flat/Gouraud still use the fixed pipeline)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        # Surfaceless: everything is drawn into our own FBO
+        if not EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context):
+            raise RuntimeError("eglMakeCurrent failed")
+
+    def _create_osmesa(self, width, height):
+        from OpenGL import osmesa
+        self.osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("OSMesaCreateContextExt failed")
+        # OSMesa always needs a color buffer, even if we only draw into the FBO
+        self.buffer = np.zeros((height, width, 4), dtype=np.uint8)
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+
+    def renderer(self):
+        """Driver string, e.g. 'llvmpipe (LLVM 15.0.6, 256 bits)'"""
+        return glGetString(GL_RENDERER).decode()
+
+    def release(self):
+        if self.backend == 'egl':
+            EGL = self.egl
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        else:
+            self.osmesa.OSMesaDestroyContext(self.context)
+        self.context = None
+
+class HeadlessRenderer:
+    """Renders Estado3D scenes into an FBO of a headless context"""
+    def __init__(self, width=LARGURA_3D, height=ALTURA_3D):
+        self.width = width
+        self.height = height
+        self.context = HeadlessContext(width, height)
+        init_opengl()
+        self.fbo = FBO(width, height)
+
+    def render(self, estado):
+        """Renders one frame, returns a new top-down (height, width, 4) uint8 array"""
+        render_3d_to_texture(estado, self.fbo)
+        return self.fbo.read_pixels().copy()
+
+    def set_antialiasing(self, samples=0, supersample=1):
+        """Recreates the FBO with MSAA samples or a supersampling factor, returns the mode it got"""
+        self.fbo.delete()
+        self.fbo = FBO(self.width, self.height, samples=samples, supersample=supersample)
+        return self.fbo.get_mode()
+
+    def reference(self, estado, factor=4):
+        """
+        Anti-aliasing ground truth: estado rendered at factor x the size and
+        box-filtered down in NumPy. Returns a float (height, width, 3) RGB frame.
+        """
+        fbo = FBO(self.width * factor, self.height * factor)
+        render_3d_to_texture(estado, fbo)
+        frame = fbo.read_pixels()[..., :3].astype(np.float32)
+        fbo.delete()
+        return frame.reshape(self.height, factor, self.width, factor, 3).mean(axis=(1, 3))
+
+    def benchmark(self, estado, frames=100):
+        """
+        Pure render throughput (no vsync, no window manager, no readback).
+        Returns frames per second.
+        """
+        render_3d_to_texture(estado, self.fbo)  # Warm up (shaders, mesh upload)
+        glFinish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            render_3d_to_texture(estado, self.fbo)
+        glFinish()
+        return frames / (time.perf_counter() - start)
+
+    def gpu_times(self, estado, frames=100):
+        """GPU time (ms, p50/p95/p99) of the clear and geometry stages, from timer queries"""
+        timer = GPUTimer()
+        key = (estado.lighting_model, estado.shape)
+        for _ in range(frames):
+            timer.begin_frame(key)
+            render_3d_to_texture(estado, self.fbo, timer)
+            timer.end_frame()
+        glFinish()
+        for _ in range(timer.latency):  # Pick up the last frames (the GPU is idle now)
+            timer.begin_frame(None)
+            timer.end_frame()
+        result = timer.summary().get('/'.join(key), {})
+        timer.delete()
+        return result
+
+    def close(self):
+        """Frees the FBO and every cached GL object, then the context (another renderer can follow)"""
+        self.fbo.delete()
+        release_opengl()
+        self.context.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def render_headless(estados, width=LARGURA_3D, height=ALTURA_3D):
+    """Renders each Estado3D and yields its frame as a NumPy array"""
+    with HeadlessRenderer(width, height) as renderer:
+        for estado in estados:
+            yield renderer.render(estado)
+
+def main():
+    with HeadlessRenderer() as renderer:
+        print(f"Headless renderer: {renderer.context.renderer()}")
+        print(ShaderManager.summary(ShaderManager.warm_up()))
+        for lighting in ['flat', 'gouraud', 'phong']:
+            for shape in ['sphere', 'cube', 'torus', 'pyramid']:
+                estado = Estado3D()
+                estado.lighting_model = lighting
+                estado.shape = shape
+                fps = renderer.benchmark(estado)
+                gpu = renderer.gpu_times(estado)
+                print(f"{lighting:8s} {shape:8s} {fps:8.1f} FPS  {1000.0 / fps:6.2f} ms/frame  "
+                      f"GPU geometry p50 {gpu['geometry']['p50']:6.2f} ms")
+
+        # Instanced load test (every shape, Phong)
+        from Scene_3D import random_scene
+        for count in [1000, 10000]:
+            estado = Estado3D()
+            estado.lighting_model = 'phong'
+            estado.scene = random_scene(count, extent=8.0, scale_range=(0.02, 0.08))
+            fps = renderer.benchmark(estado, frames=5)
+            print(f"scene    {count:6d} instances {fps:8.1f} FPS  {1000.0 / fps:6.2f} ms/frame")
+
+        # Tiled point lights (Phong): FPS and lights per 16x16 tile
+        from Lights_3D import random_lights
+        for count in [16, 64, 256]:
+            estado = Estado3D()
+            estado.lighting_model = 'phong'
+            estado.shape = 'torus'
+            estado.lights = random_lights(count, extent=4.0, range_span=(0.5, 2.0))
+            fps = renderer.benchmark(estado, frames=20)
+            stats = estado.lights.tile_stats()
+            print(f"lights   {count:6d} point     {fps:8.1f} FPS  {1000.0 / fps:6.2f} ms/frame  lights/tile "
+                  f"mean {stats['mean']:5.1f} p95 {stats['p95']:5.1f} max {stats['max']:3d}")
+
+        # Shadow map (Phong): static light (map reused) vs a light moving every frame (map re-rendered)
+        from Light import ShadowMap
+        default_size = ShadowMap.SHADOW_MAP_SIZE
+        for size in [512, 1024, 2048]:
+            ShadowMap.set_resolution(size)
+            estado = Estado3D()
+            estado.lighting_model = 'phong'
+            estado.shape = 'torus'
+            static = renderer.benchmark(estado, frames=20)
+            render_3d_to_texture(estado, renderer.fbo)
+            glFinish()
+            start = time.perf_counter()
+            for frame in range(20):
+                estado.light_pos[0] = 3.0 + 0.01 * frame
+                render_3d_to_texture(estado, renderer.fbo)
+            glFinish()
+            moving = 20 / (time.perf_counter() - start)
+            print(f"shadows  {size:6d} texels    {static:8.1f} FPS static  {moving:8.1f} FPS moving light")
+        ShadowMap.set_resolution(default_size)
+
+        # Anti-aliasing (Phong scene): frame time per sample count and RMSE (0-255)
+        # against a 4x4 supersampled reference, to pick the best quality per ms
+        estado = Estado3D()
+        estado.lighting_model = 'phong'
+        estado.camera_angle = 'diagonal'
+        estado.scene = random_scene(200, extent=4.0, scale_range=(0.1, 0.5))
+        reference = renderer.reference(estado)
+        baseline = None
+        modes = set()
+        for samples, supersample in [(0, 1), (2, 1), (4, 1), (8, 1), (0, 2)]:
+            mode = renderer.set_antialiasing(samples, supersample)
+            if mode in modes:  # Clamped / rounded by the driver to a mode already measured
+                continue
+            modes.add(mode)
+            ms = 1000.0 / renderer.benchmark(estado, frames=20)
+            resolve = renderer.gpu_times(estado, frames=20).get('resolve', {'p50': 0.0})
+            error = np.sqrt(((renderer.render(estado)[..., :3] - reference) ** 2).mean())
+            baseline = ms if baseline is None else baseline
+            print(f"aa       {mode:16s} {ms:8.2f} ms/frame ({ms - baseline:+6.2f})  "
+                  f"GPU resolve p50 {resolve['p50']:5.2f} ms  RMSE {error:5.2f}")
+        renderer.set_antialiasing()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Texture buffers with the point lights of estado.lights
+
+Three buffer textures (GLSL 330 samplerBuffer / isamplerBuffer, so no SSBO
+and OpenGL 4.3 needed): the lights in view space, the [offset, count] of
+every screen tile and the light indices of all tiles back to back. They are
+filled from a Lights_3D.LightList.assign() result and re-uploaded only when
+it changed!!
+"""
+from OpenGL.GL import *
+import numpy as np
+
+# Texture units of the buffer textures (unit 0 is left for regular textures)
+LIGHT_DATA_UNIT = 1
+LIGHT_TILES_UNIT = 2
+LIGHT_INDEX_UNIT = 3
+
+# GLSL: declarations and the per-fragment loop, for a shader that has a Material m
+LIGHT_LIST_GLSL = """
+uniform samplerBuffer lightData;     // 2 texels per light: view position + range, color
+uniform isamplerBuffer lightTiles;   // [offset, count] per tile
+uniform isamplerBuffer lightIndices;
+uniform int lightTileSize;           // 0 = no point lights
+uniform int lightTilesX;
+
+vec3 pointLights(vec3 P, vec3 N, vec3 V, Material m) {
+    vec3 result = vec3(0.0);
+    if (lightTileSize == 0) {
+        return result;
+    }
+    ivec2 tile = ivec2(gl_FragCoord.xy) / lightTileSize;
+    ivec2 range = texelFetch(lightTiles, tile.y * lightTilesX + tile.x).xy;
+    for (int i = 0; i < range.y; i++) {
+        int light = texelFetch(lightIndices, range.x + i).x;
+        vec4 position = texelFetch(lightData, 2 * light);
+        vec3 color = texelFetch(lightData, 2 * light + 1).rgb;
+
+        vec3 toLight = position.xyz - P;
+        float distance = length(toLight);
+        float falloff = clamp(1.0 - (distance * distance) / (position.w * position.w), 0.0, 1.0);
+        if (falloff == 0.0) {
+            continue;
+        }
+        vec3 L = toLight / distance;
+        float diff = max(dot(N, L), 0.0);
+        float spec = 0.0;
+        if (diff > 0.0) {
+            spec = pow(max(dot(reflect(-L, N), V), 0.0), m.shininess);
+        }
+        result += falloff * falloff * color * (m.diffuse.rgb * diff + m.specular.rgb * spec);
+    }
+    return result;
+}
+"""
+
+class TextureBuffer:
+    """Buffer object seen as a buffer texture of one internal format; update() skips unchanged data"""
+    def __init__(self, internal_format, unit):
+        self.internal_format = internal_format
+        self.unit = unit
+        self.capacity = 0
+        self.data = None
+        self.uploads = 0
+        self.buffer = int(np.atleast_1d(glGenBuffers(1))[0])
+        self.texture = int(np.atleast_1d(glGenTextures(1))[0])
+
+    def update(self, data):
+        raw = np.ascontiguousarray(data).tobytes() or bytes(16)  # Never an empty buffer
+        if raw == self.data:
+            return
+        glBindBuffer(GL_TEXTURE_BUFFER, self.buffer)
+        if len(raw) > self.capacity:
+            self.capacity = max(len(raw), 2 * self.capacity)
+            glBufferData(GL_TEXTURE_BUFFER, self.capacity, None, GL_DYNAMIC_DRAW)
+        glBufferSubData(GL_TEXTURE_BUFFER, 0, len(raw), raw)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+        glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+        glTexBuffer(GL_TEXTURE_BUFFER, self.internal_format, self.buffer)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+        self.data = raw
+        self.uploads += 1
+
+    def bind(self):
+        glActiveTexture(GL_TEXTURE0 + self.unit)
+        glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+        glActiveTexture(GL_TEXTURE0)
+
+    def delete(self):
+        glDeleteTextures([self.texture])
+        glDeleteBuffers(1, [self.buffer])
+        self.texture = self.buffer = 0
+        self.data = None
+
+# Shared buffers (created on first use, once a GL context exists)
+light_data = None
+light_tiles = None
+light_indices = None
+
+# Assignment being drawn: (tile size, tiles per row), None = no point lights
+active = None
+_version = None
+
+def init_buffers():
+    global light_data, light_tiles, light_indices
+    if light_data is None:
+        light_data = TextureBuffer(GL_RGBA32F, LIGHT_DATA_UNIT)
+        light_tiles = TextureBuffer(GL_RG32I, LIGHT_TILES_UNIT)
+        light_indices = TextureBuffer(GL_R32I, LIGHT_INDEX_UNIT)
+
+def release():
+    """Deletes the buffer textures and forgets the uploaded assignment"""
+    global light_data, light_tiles, light_indices, active, _version
+    for buffer in (light_data, light_tiles, light_indices):
+        if buffer is not None:
+            buffer.delete()
+    light_data = light_tiles = light_indices = None
+    active = None
+    _version = None
+
+def update(lights, view, projection, width, height):
+    """
+    Assigns lights (Lights_3D.LightList, or None to switch the point lights
+    off) to the tiles of a width x height target and uploads the result.
+    """
+    global active, _version
+    if lights is None or not len(lights):
+        active = None
+        return
+    data, tiles, indices, version = lights.assign(view, projection, width, height)
+    init_buffers()
+    if version != _version:
+        light_data.update(data)
+        light_tiles.update(tiles)
+        light_indices.update(indices)
+        _version = version
+    active = (lights.tile_size, lights.tiles_x)
+
+def bind(program):
+    """Points the program (in use) at the light buffers, or turns its point lights off"""
+    # Always on their own units: sampler types may not share one, even unused
+    program.set_uniform('lightData', LIGHT_DATA_UNIT)
+    program.set_uniform('lightTiles', LIGHT_TILES_UNIT)
+    program.set_uniform('lightIndices', LIGHT_INDEX_UNIT)
+    if active is None:
+        program.set_uniform('lightTileSize', 0)
+        return
+    for buffer in (light_data, light_tiles, light_indices):
+        buffer.bind()
+    program.set_uniform('lightTileSize', active[0])
+    program.set_uniform('lightTilesX', active[1])
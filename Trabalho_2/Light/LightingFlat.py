@@ -1,11 +1,36 @@
 """
 Flat Shading Implementation
 
-In OpenGL: GL_FLAT shading model
+Gouraud's per-vertex lighting with 'flat' interpolation: every triangle
+takes the color of its provoking (last) vertex, like GL_FLAT!!
 """
+from functools import partial
 from OpenGL.GL import *
+from .Shader import ProgramCache
+from . import LightingGouraud, LightingPhong, UniformBlocks
+from .LightingGouraud import vertex_lighting_sources
 
-def enable():
+# Gouraud's tessellation, with the quads split for GL_FLAT (both triangles end on the provoking vertex)
+SHAPE_PARAMS = dict(LightingGouraud.SHAPE_PARAMS, cube=(), pyramid=())
+
+# Both variants, compiled on first use and bound to the light / material UBOs
+programs = ProgramCache("Flat", partial(vertex_lighting_sources, 'flat'), UniformBlocks.bind_program)
+
+def get_program(instanced=False):
+    """Flat program (compiled on first use), False if it failed to compile (not retried)"""
+    return programs.get(instanced)
+
+def enable(instanced=False):
+    """
+    Binds the flat program. Returns it, or False when GLSL 330 is not
+    available (the caller then falls back to enable_fixed_function).
+    """
+    program = get_program(instanced)
+    if program:
+        program.use()
+    return program
+
+def enable_fixed_function():
     """
     Ativate flat (faceted) shader
     """
@@ -17,6 +42,16 @@ def enable():
 
     glShadeModel(GL_FLAT)     # Configurar para flat shading
 
+def draw(estado, projection, view, modelview):
+    """Draws estado's shape (program in use; row-major NumPy matrices)"""
+    LightingPhong.upload_light(estado, view)  # Light set before the object transform, like glLightfv
+    LightingPhong.draw_mesh(get_program(), estado, projection, modelview, SHAPE_PARAMS)
+
+def draw_instanced(estado, scene, projection, view, modelview, viewport_height):
+    """Draws the visible instances of scene, modelview applied on top of each model matrix"""
+    LightingPhong.upload_light(estado, view)
+    LightingPhong.draw_instances(get_program(True), scene, projection, modelview, viewport_height)
+
 def get_name():
     return "Flat"
 
@@ -1,11 +1,110 @@
 """
 Gouraud Shading Implementation
 
-In OpenGL: GL_SMOOTH shading model
+Lighting at the vertices in the vertex shader, colors interpolated across
+the faces (what GL_SMOOTH does in the fixed pipeline). Same VAOs and UBOs
+as Phong, so switching between the models is just a program bind!!
 """
+from functools import partial
 from OpenGL.GL import *
+from .Shader import ProgramCache
+from .UniformBlocks import LIGHT_BLOCK_GLSL, MATERIAL_BLOCK_GLSL
+from . import LightingPhong, UniformBlocks
 
-def enable():
+# Cube / pyramid quads split on the same diagonal as GL_QUADS under GL_SMOOTH
+SMOOTH_QUAD_PARAMS = {'cube': (True,), 'pyramid': (True,)}
+
+# Same tessellation as the fixed-function draw_* functions (torus differs from Phong)
+SHAPE_PARAMS = dict(LightingPhong.SHAPE_PARAMS, torus=(32, 32, 0.5), **SMOOTH_QUAD_PARAMS)
+
+# Fixed-function lighting equation for GL_LIGHT0, evaluated per vertex:
+# GL_LIGHT_MODEL_AMBIENT default, non-local viewer (half vector towards +z),
+# no attenuation. SHADE is the interpolation qualifier (smooth or flat).
+VERTEX_LIGHTING_BODY = LIGHT_BLOCK_GLSL + MATERIAL_BLOCK_GLSL + """
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec3 aNormal;
+
+uniform mat4 projection;
+
+SHADE out vec4 vertColor;
+
+const vec3 LIGHT_MODEL_AMBIENT = vec3(0.2);
+
+void main() {
+    Material m = materials[MATERIAL_INDEX];
+    vec4 viewPos = MODEL_VIEW * vec4(aPos, 1.0);
+    gl_Position = projection * viewPos;
+
+    vec3 N = normalize(NORMAL_MATRIX * aNormal);
+    vec3 L = lightPos.w == 0.0 ? normalize(lightPos.xyz) : normalize(lightPos.xyz - viewPos.xyz);
+    vec3 H = normalize(L + vec3(0.0, 0.0, 1.0));
+
+    float diff = max(dot(N, L), 0.0);
+    float spec = 0.0;
+    if (diff > 0.0) {
+        spec = pow(max(dot(N, H), 0.0), m.shininess);
+    }
+
+    vec3 color = (LIGHT_MODEL_AMBIENT + lightAmbient.rgb) * m.ambient.rgb
+               + lightDiffuse.rgb * m.diffuse.rgb * diff
+               + lightSpecular.rgb * m.specular.rgb * spec;
+    vertColor = vec4(clamp(color, 0.0, 1.0), m.diffuse.a);
+}
+"""
+
+# One object: transform and material from uniforms
+VERTEX_UNIFORMS = """
+uniform mat4 modelView;
+uniform mat3 normalMatrix;
+#define MODEL_VIEW modelView
+#define NORMAL_MATRIX normalMatrix
+#define MATERIAL_INDEX materialIndex
+"""
+
+# Instanced: model matrix and material from the instance VBO (uniform scale assumed)
+VERTEX_INSTANCED = """
+layout (location = 2) in mat4 aModel;
+layout (location = 6) in int aMaterial;
+uniform mat4 view;
+#define MODEL_VIEW (view * aModel)
+#define NORMAL_MATRIX mat3(view * aModel)
+#define MATERIAL_INDEX aMaterial
+"""
+
+FRAGMENT_BODY = """
+SHADE in vec4 vertColor;
+
+out vec4 FragColor;
+
+void main() {
+    FragColor = vertColor;
+}
+"""
+
+def vertex_lighting_sources(shade='smooth', instanced=False):
+    """(vertex, fragment) sources of the per-vertex lighting program with this interpolation qualifier"""
+    header = "#version 330 core\n#define SHADE %s\n" % shade
+    vertex = header + (VERTEX_INSTANCED if instanced else VERTEX_UNIFORMS) + VERTEX_LIGHTING_BODY
+    return vertex, header + FRAGMENT_BODY
+
+# Both variants, compiled on first use and bound to the light / material UBOs
+programs = ProgramCache("Gouraud", partial(vertex_lighting_sources, 'smooth'), UniformBlocks.bind_program)
+
+def get_program(instanced=False):
+    """Gouraud program (compiled on first use), False if it failed to compile (not retried)"""
+    return programs.get(instanced)
+
+def enable(instanced=False):
+    """
+    Binds the Gouraud program. Returns it, or False when GLSL 330 is not
+    available (the caller then falls back to enable_fixed_function).
+    """
+    program = get_program(instanced)
+    if program:
+        program.use()
+    return program
+
+def enable_fixed_function():
     """
     Ativate defaut OpenGL Gouraud (smooth)
     """
@@ -16,6 +115,16 @@ def enable():
 
     glShadeModel(GL_SMOOTH)   # Use internal OpenGL Implementation
 
+def draw(estado, projection, view, modelview):
+    """Draws estado's shape (program in use; row-major NumPy matrices)"""
+    LightingPhong.upload_light(estado, view)  # Light set before the object transform, like glLightfv
+    LightingPhong.draw_mesh(get_program(), estado, projection, modelview, SHAPE_PARAMS)
+
+def draw_instanced(estado, scene, projection, view, modelview, viewport_height):
+    """Draws the visible instances of scene, modelview applied on top of each model matrix"""
+    LightingPhong.upload_light(estado, view)
+    LightingPhong.draw_instances(get_program(True), scene, projection, modelview, viewport_height, SMOOTH_QUAD_PARAMS)
+
 def get_name():
     return "Gouraud"
 
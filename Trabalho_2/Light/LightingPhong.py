@@ -3,13 +3,25 @@ Phong Shading Implementation
 """
 
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
 import numpy as np
-import math
-from Aux_3D import MATERIAL_COLORS, LIGHT_AMBIENT, LIGHT_DIFFUSE
-
-# Global shader program
-shaderprogram = None
+from Aux_3D import LIGHT_AMBIENT, LIGHT_DIFFUSE
+from Object import Sphere, Cube, Torus, Pyramid, Mesh
+from Transform_3D import normal_matrix, to_gl
+from .Shader import ProgramCache
+from . import UniformBlocks, LightBuffers, ShadowMap
+from .UniformBlocks import LIGHT_BLOCK_GLSL, MATERIAL_BLOCK_GLSL
+from .LightBuffers import LIGHT_LIST_GLSL
+from .ShadowMap import SHADOW_GLSL
+
+instance_buffer = None     # Mesh.InstanceBuffer with the records of estado.scene
+
+# Tessellation used for each shape in the Phong path (the sphere's comes
+# from Sphere.SPHERE_LOD[Sphere.sphere_lod] at draw time, see get_mesh)
+SHAPE_PARAMS = {
+    'cube': (),
+    'torus': (24, 48),
+    'pyramid': (),
+}
 
 # Core profile GLSL shader sources
 VERTEX_SHADER_SOURCE = """
@@ -32,385 +44,254 @@ void main() {
 }
 """
 
-FRAGMENT_SHADER_SOURCE = """
+# Instanced draws: the model matrix and the material come from the instance VBO
+# (normals assume uniform scale, they are re-normalized per fragment)
+INSTANCED_VERTEX_SHADER_SOURCE = """
 #version 330 core
 
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec3 aNormal;
+layout (location = 2) in mat4 aModel;
+layout (location = 6) in int aMaterial;
+
+uniform mat4 view;
+uniform mat4 projection;
+
+out vec3 fragPos;
+out vec3 fragNormal;
+flat out int fragMaterial;
+
+void main() {
+    mat4 modelView = view * aModel;
+    vec4 viewPos = modelView * vec4(aPos, 1.0);
+    gl_Position = projection * viewPos;
+    fragPos = viewPos.xyz;
+    fragNormal = mat3(modelView) * aNormal;
+    fragMaterial = aMaterial;
+}
+"""
+
+# MATERIAL_INDEX is defined by each program (uniform or per instance)
+FRAGMENT_SHADER_BODY = LIGHT_BLOCK_GLSL + MATERIAL_BLOCK_GLSL + LIGHT_LIST_GLSL + SHADOW_GLSL + """
 in vec3 fragPos;
 in vec3 fragNormal;
 
-uniform vec3 lightPos;
-uniform vec3 lightAmbient;
-uniform vec3 lightDiffuse;
-uniform vec3 lightSpecular;
-uniform vec4 Ka;
-uniform vec4 Kd;
-uniform vec4 Ks;
-uniform float shininess;
-
 out vec4 FragColor;
 
 void main() {
+    Material m = materials[MATERIAL_INDEX];
     vec3 N = normalize(fragNormal);
-    vec3 L = normalize(lightPos - fragPos);
+    vec3 L = lightPos.w == 0.0 ? normalize(lightPos.xyz) : normalize(lightPos.xyz - fragPos);
     vec3 V = normalize(-fragPos);
     vec3 R = reflect(-L, N);
 
     // Ambient
-    vec3 ambient = lightAmbient * Ka.rgb;
+    vec3 ambient = lightAmbient.rgb * m.ambient.rgb;
 
     // Diffuse
     float diff = max(dot(N, L), 0.0);
-    vec3 diffuse = lightDiffuse * Kd.rgb * diff;
+    vec3 diffuse = lightDiffuse.rgb * m.diffuse.rgb * diff;
 
     // Specular (only when surface is lit)
     float spec = 0.0;
     if (diff > 0.0) {
-        spec = pow(max(dot(R, V), 0.0), shininess);
+        spec = pow(max(dot(R, V), 0.0), m.shininess);
     }
-    vec3 specular = lightSpecular * Ks.rgb * spec;
+    vec3 specular = lightSpecular.rgb * m.specular.rgb * spec;
 
-    vec3 result = ambient + diffuse + specular;
-    FragColor = vec4(result, Kd.a);
+    // Main light blocked by the shadow map, plus the point lights of this screen tile (estado.lights)
+    vec3 result = ambient + shadowFactor(fragPos) * (diffuse + specular) + pointLights(fragPos, N, V, m);
+    FragColor = vec4(result, m.diffuse.a);
 }
 """
 
-def compile_phong_shaders():
-    """
-    Compiles the vertex and fragment shaders for Phong shading.
-    """
-    try:
-        vertex_shader = compileShader(VERTEX_SHADER_SOURCE, GL_VERTEX_SHADER)
-        fragment_shader = compileShader(FRAGMENT_SHADER_SOURCE, GL_FRAGMENT_SHADER)
-        program = compileProgram(vertex_shader, fragment_shader)
-        print("Phong shaders compiled successfully!")
-        return program
-    except Exception as e:
-        print(f"Error compiling Phong shaders: {e}")
-        return None
-
-def enable(estado=None):
+FRAGMENT_SHADER_SOURCE = """
+#version 330 core
+#define MATERIAL_INDEX materialIndex
+""" + FRAGMENT_SHADER_BODY
+
+INSTANCED_FRAGMENT_SHADER_SOURCE = """
+#version 330 core
+#define MATERIAL_INDEX fragMaterial
+flat in int fragMaterial;
+""" + FRAGMENT_SHADER_BODY
+
+def program_sources(instanced=False):
+    """(vertex, fragment) sources of the single-object or instanced Phong program"""
+    if instanced:
+        return INSTANCED_VERTEX_SHADER_SOURCE, INSTANCED_FRAGMENT_SHADER_SOURCE
+    return VERTEX_SHADER_SOURCE, FRAGMENT_SHADER_SOURCE
+
+# Both variants, compiled on first use and bound to the light / material UBOs
+programs = ProgramCache("Phong", program_sources, UniformBlocks.bind_program)
+
+def get_program(instanced=False):
+    """Phong program (compiled on first use), False if it failed to compile (not retried)"""
+    return programs.get(instanced)
+
+def release():
+    """Deletes the scene's instance buffer (the programs are released by ShaderManager)"""
+    global instance_buffer
+    if instance_buffer is not None:
+        instance_buffer.delete()
+        instance_buffer = None
+
+def enable(instanced=False):
     """
-    Enables the Phong shader program.
+    Binds the Phong program. Returns it, or False when GLSL 330 is not
+    available (the caller then falls back to fixed-function smooth shading).
     """
-    global shaderprogram
-    if shaderprogram is None:
-        shaderprogram = compile_phong_shaders()
-        if not shaderprogram:
-            print("Warning: Phong shader compilation failed, falling back to smooth shading")
-            glShadeModel(GL_SMOOTH)
-            glEnable(GL_LIGHTING)
-            return
-    glUseProgram(shaderprogram)
-    glDisable(GL_LIGHTING)
+    program = get_program(instanced)
+    if program:
+        program.use()
+    return program
 
 def disable():
     """
-    Disables the Phong shader program and re-enables fixed pipeline lighting.
+    Unbinds the shader programs (back to the fixed pipeline, e.g. for the 2D blit).
     """
-    global shaderprogram
-    if shaderprogram:
-        glUseProgram(0)
-    glEnable(GL_LIGHTING)
-    glShadeModel(GL_SMOOTH)
+    glUseProgram(0)
+
+SHAPE_MESHES = {
+    'sphere': Sphere.get_sphere_mesh,
+    'cube': Cube.get_cube_mesh,
+    'torus': Torus.get_torus_mesh,
+    'pyramid': Pyramid.get_pyramid_mesh,
+}
 
-def generate_sphere_triangles(slices=32, stacks=32):
+def get_mesh(shape, params=None):
     """
-    Generates vertex positions and normals for a unit sphere using triangles.
-    Returns lists of [x,y,z] for positions and normals.
+    Returns the GPU mesh for a shape, uploading it only if it is not cached yet.
+    Unknown shapes default to the sphere, which without params follows
+    Sphere.set_lod().
     """
-    pos = []
-    norm = []
-    for i in range(stacks + 1):
-        lat0 = math.pi * (-0.5 + float(i) / stacks)
-        z0 = math.sin(lat0)
-        zr0 = math.cos(lat0)
-        lat1 = math.pi * (-0.5 + float(i + 1) / stacks)
-        z1 = math.sin(lat1)
-        zr1 = math.cos(lat1)
-        for j in range(slices):
-            lng0 = 2 * math.pi * float(j) / slices
-            x0 = math.cos(lng0)
-            y0 = math.sin(lng0)
-            lng1 = 2 * math.pi * float(j + 1) / slices
-            x1 = math.cos(lng1)
-            y1 = math.sin(lng1)
-            # Triangle 1: Reversed order for CCW (v0, v2, v1 instead of v0,v1,v2 for southern hemisphere)
-            if i < stacks:
-                # Bottom triangle (pointing outward)
-                pos.extend([[x0 * zr0, y0 * zr0, z0], [x1 * zr1, y1 * zr1, z1], [x1 * zr0, y1 * zr0, z0]])
-                norm.extend([[x0 * zr0, y0 * zr0, z0], [x1 * zr1, y1 * zr1, z1], [x1 * zr0, y1 * zr0, z0]])
-                # Top triangle
-                pos.extend([[x0 * zr0, y0 * zr0, z0], [x0 * zr1, y0 * zr1, z1], [x1 * zr1, y1 * zr1, z1]])
-                norm.extend([[x0 * zr0, y0 * zr0, z0], [x0 * zr1, y0 * zr1, z1], [x1 * zr1, y1 * zr1, z1]])
-    return pos, norm
-
-def generate_cube_triangles():
+    if shape not in SHAPE_MESHES:
+        shape = 'sphere'
+    if params is None:
+        params = Sphere.SPHERE_LOD[Sphere.sphere_lod] if shape == 'sphere' else SHAPE_PARAMS[shape]
+    return SHAPE_MESHES[shape](*params)
+
+def draw_mesh(program, estado, projection, modelview, shape_params=SHAPE_PARAMS):
     """
-    Generates vertex positions and normals for a cube using triangles (duplicated verts for flat shading).
-    Returns lists of [x,y,z] for positions and normals.
+    Draws estado's shape with one of the lighting programs (Flat, Gouraud or
+    Phong all read the same uniforms and UBOs). projection / modelview are
+    the row-major NumPy matrices (Transform_3D).
     """
-    pos = []
-    norm = []
-    half = 1.0
-    # Back face (z = -half), viewed from back: CCW [0,3,2,1] -> triangles [0,3,2] and [0,2,1]
-    n = [0, 0, -1]
-    # Tri 1: bottom-left, top-left, top-right
-    pos.extend([[-half, -half, -half], [-half, half, -half], [half, half, -half]])
-    norm.extend([n, n, n])
-    # Tri 2: bottom-left, top-right, bottom-right
-    pos.extend([[-half, -half, -half], [half, half, -half], [half, -half, -half]])
-    norm.extend([n, n, n])
-    # Front face (z = half), viewed from front: CCW [4,5,7,6] -> [4,5,7] [4,7,6]
-    n = [0, 0, 1]
-    pos.extend([[-half, -half, half], [half, -half, half], [half, half, half]])
-    norm.extend([n, n, n])
-    pos.extend([[-half, -half, half], [half, half, half], [-half, half, half]])
-    norm.extend([n, n, n])
-    # Bottom face (y = -half), viewed from below: CCW [0,4,5,1] but reverse for outward -> [0,1,5,4]
-    n = [0, -1, 0]
-    pos.extend([[half, -half, -half], [half, -half, half], [-half, -half, half]])
-    norm.extend([n, n, n])
-    pos.extend([[half, -half, -half], [-half, -half, half], [-half, -half, -half]])
-    norm.extend([n, n, n])
-    # Top face (y = half), viewed from above: CCW [3,2,6,7]
-    n = [0, 1, 0]
-    pos.extend([[-half, half, -half], [half, half, -half], [half, half, half]])
-    norm.extend([n, n, n])
-    pos.extend([[-half, half, -half], [half, half, half], [-half, half, half]])
-    norm.extend([n, n, n])
-    # Left face (x = -half), viewed from left: CCW [0,4,7,3]
-    n = [-1, 0, 0]
-    pos.extend([[-half, -half, -half], [-half, -half, half], [-half, half, half]])
-    norm.extend([n, n, n])
-    pos.extend([[-half, -half, -half], [-half, half, half], [-half, half, -half]])
-    norm.extend([n, n, n])
-    # Right face (x = half), viewed from right: CCW [1,5,6,2]
-    n = [1, 0, 0]
-    pos.extend([[half, -half, half], [half, -half, -half], [half, half, -half]])
-    norm.extend([n, n, n])
-    pos.extend([[half, -half, half], [half, half, -half], [half, half, half]])
-    norm.extend([n, n, n])
-    return pos, norm
-
-def generate_torus_triangles(rings=24, sides=48):
+    if not program:
+        return
+    program.use()
+
+    # Disable culling to show all sides fully
+    glDisable(GL_CULL_FACE)
+
+    # Set matrix uniforms (column-major, unchanged values are not re-sent)
+    program.set_uniform('modelView', to_gl(modelview))
+    program.set_uniform('projection', to_gl(projection))
+    program.set_uniform('normalMatrix', to_gl(normal_matrix(modelview)))
+    program.set_uniform('materialIndex', UniformBlocks.material_index(estado.material))
+
+    # Fetch the resident mesh (built and uploaded only on first use)
+    mesh = get_mesh(estado.shape, shape_params.get(estado.shape))
+    mesh.draw()
+
+    # Re-enable culling after draw
+    glEnable(GL_CULL_FACE)
+
+def draw_instances(program, scene, projection, view, viewport_height, shape_params=None):
     """
-    Generates vertex positions and normals for a torus using triangles.
-    Returns lists of [x,y,z] for positions and normals.
+    Draws the instances of scene (Scene_3D.InstanceList) inside the view
+    frustum with an instanced lighting program: one glDrawElementsInstanced
+    per shape and LOD level. view (row-major) is applied on top of each
+    instance's model matrix. shape_params replaces the mesh params of the
+    shapes it names (e.g. Gouraud's quad split).
     """
-    pos = []
-    norm = []
-    inner_radius = 0.4
-    outer_radius = 1.0
-    for i in range(rings):
-        theta0 = i * 2.0 * math.pi / rings
-        theta1 = (i + 1) * 2.0 * math.pi / rings
-        for j in range(sides):
-            phi0 = j * 2.0 * math.pi / sides
-            phi1 = (j + 1) * 2.0 * math.pi / sides
-            
-            # Quad vertices (v0 bottom-left, v1 bottom-right, v2 top-right, v3 top-left)
-            # v0
-            x0 = (outer_radius + inner_radius * math.cos(phi0)) * math.cos(theta0)
-            y0 = (outer_radius + inner_radius * math.cos(phi0)) * math.sin(theta0)
-            z0 = inner_radius * math.sin(phi0)
-            n0 = [math.cos(phi0) * math.cos(theta0), math.cos(phi0) * math.sin(theta0), math.sin(phi0)]
-            # v1
-            x1 = (outer_radius + inner_radius * math.cos(phi1)) * math.cos(theta0)
-            y1 = (outer_radius + inner_radius * math.cos(phi1)) * math.sin(theta0)
-            z1 = inner_radius * math.sin(phi1)
-            n1 = [math.cos(phi1) * math.cos(theta0), math.cos(phi1) * math.sin(theta0), math.sin(phi1)]
-            # v2
-            x2 = (outer_radius + inner_radius * math.cos(phi1)) * math.cos(theta1)
-            y2 = (outer_radius + inner_radius * math.cos(phi1)) * math.sin(theta1)
-            z2 = inner_radius * math.sin(phi1)
-            n2 = [math.cos(phi1) * math.cos(theta1), math.cos(phi1) * math.sin(theta1), math.sin(phi1)]
-            # v3
-            x3 = (outer_radius + inner_radius * math.cos(phi0)) * math.cos(theta1)
-            y3 = (outer_radius + inner_radius * math.cos(phi0)) * math.sin(theta1)
-            z3 = inner_radius * math.sin(phi0)
-            n3 = [math.cos(phi0) * math.cos(theta1), math.cos(phi0) * math.sin(theta1), math.sin(phi0)]
-            
-            # Triangle 1: v0, v1, v2 (CCW when viewed from outside)
-            pos.extend([[x0, y0, z0], [x1, y1, z1], [x2, y2, z2]])
-            norm.extend([n0, n1, n2])
-            # Triangle 2: v0, v2, v3 (CCW)
-            pos.extend([[x0, y0, z0], [x2, y2, z2], [x3, y3, z3]])
-            norm.extend([n0, n2, n3])
-    return pos, norm
-
-def generate_pyramid_triangles():
+    global instance_buffer
+    if not program:
+        return
+    if instance_buffer is None:
+        instance_buffer = Mesh.InstanceBuffer()
+
+    glDisable(GL_CULL_FACE)
+    program.use()
+    program.set_uniform('view', to_gl(view))
+    program.set_uniform('projection', to_gl(projection))
+
+    # Visible instances only, re-uploaded only when that set (or their LOD) changed
+    records, batches, version = scene.cull(view, projection, viewport_height)
+    instance_buffer.upload(records, version)
+    scene.triangles = 0
+    for shape, params, first, count in batches:
+        mesh = get_mesh(shape, (shape_params or {}).get(shape, params))
+        mesh.draw_instanced(instance_buffer, first, count)
+        scene.triangles += mesh.index_count // 3 * count
+
+    glEnable(GL_CULL_FACE)
+
+def draw_phong(estado, projection, modelview):
     """
-    Generates vertex positions and normals for a pyramid using triangles.
-    Returns lists of [x,y,z] for positions and normals.
+    Draws the selected shape using Phong shader with indexed VBO rendering.
+    projection / modelview are the row-major NumPy matrices (Transform_3D).
     """
-    pos = []
-    norm = []
-    apex = [0, -1.5, 0]
-    base = [
-        [-1, 1, 1],   # 0 front left (now at y=1)
-        [1, 1, 1],    # 1 front right
-        [1, 1, -1],   # 2 back right
-        [-1, 1, -1]   # 3 back left
-    ]
-    # Base (quad as two triangles) now on top, normal pointing up
-    n_base = [0, 1, 0]
-    pos.extend([base[0], base[1], base[2]])
-    norm.extend([n_base, n_base, n_base])
-    pos.extend([base[0], base[2], base[3]])
-    norm.extend([n_base, n_base, n_base])
-    # Front face: ensure outward normal points toward +Z
-    n_front = [0, -0.5, 1]
-    pos.extend([apex, base[1], base[0]])
-    norm.extend([n_front, n_front, n_front])
-    # Right face: outward normal toward +X
-    n_right = [1, -0.5, 0]
-    pos.extend([apex, base[2], base[1]])
-    norm.extend([n_right, n_right, n_right])
-    # Back face: outward normal toward -Z
-    n_back = [0, -0.5, -1]
-    pos.extend([apex, base[3], base[2]])
-    norm.extend([n_back, n_back, n_back])
-    # Left face: outward normal toward -X
-    n_left = [-1, -0.5, 0]
-    pos.extend([apex, base[0], base[3]])
-    norm.extend([n_left, n_left, n_left])
-    return pos, norm
-
-def draw_phong(estado):
+    upload_light(estado, modelview)
+    program = get_program()
+    if program:
+        program.use()
+        LightBuffers.bind(program)
+        ShadowMap.bind(program, modelview)
+    draw_mesh(program, estado, projection, modelview)
+
+def draw_phong_instanced(estado, scene, projection, view, viewport_height):
     """
-    Draws the selected shape using Phong shader with VBO rendering.
+    Draws every visible instance of scene with Phong shading. view (row-major
+    camera and estado transform) is applied on top of each instance's model matrix.
     """
-    global shaderprogram
-    if not shaderprogram:
-        return
-    
-    # Disable culling to show all sides fully
-    glDisable(GL_CULL_FACE)
-    
-    # Get uniform locations (get once per draw for simplicity)
-    modelView_loc = glGetUniformLocation(shaderprogram, "modelView")
-    projection_loc = glGetUniformLocation(shaderprogram, "projection")
-    normalMatrix_loc = glGetUniformLocation(shaderprogram, "normalMatrix")
-    lightPos_loc = glGetUniformLocation(shaderprogram, "lightPos")
-    lightAmbient_loc = glGetUniformLocation(shaderprogram, "lightAmbient")
-    lightDiffuse_loc = glGetUniformLocation(shaderprogram, "lightDiffuse")
-    lightSpecular_loc = glGetUniformLocation(shaderprogram, "lightSpecular")
-    Ka_loc = glGetUniformLocation(shaderprogram, "Ka")
-    Kd_loc = glGetUniformLocation(shaderprogram, "Kd")
-    Ks_loc = glGetUniformLocation(shaderprogram, "Ks")
-    shininess_loc = glGetUniformLocation(shaderprogram, "shininess")
-    
-    # Get current matrices
-    modelview = np.zeros((4, 4), dtype=np.float32)
-    projection = np.zeros((4, 4), dtype=np.float32)
-    glGetFloatv(GL_MODELVIEW_MATRIX, modelview)
-    glGetFloatv(GL_PROJECTION_MATRIX, projection)
-
-    # OpenGL matrices are column-major. Reshape to 4x4 matrix (already column-major)
-    modelview_mat = modelview.reshape(4, 4)
-
-    # For numpy calculations, we need row-major
-    modelview_rm = modelview_mat.T
-
-    # Compute normal matrix: transpose(inverse(upper-left 3x3))
-    # Extract upper-left 3x3 from row-major version
-    modelview_3x3 = modelview_rm[:3, :3]
-    # Compute transpose(inverse(M)) which equals inverse(M).T
-    normal_mat_rm = np.linalg.inv(modelview_3x3).T
-    # Convert back to column-major for OpenGL
-    normal_mat = normal_mat_rm.T.astype(np.float32)
-
-    # Set matrix uniforms (all matrices should be in column-major format for OpenGL)
-    glUniformMatrix4fv(modelView_loc, 1, GL_FALSE, modelview)
-    glUniformMatrix4fv(projection_loc, 1, GL_FALSE, projection)
-    glUniformMatrix3fv(normalMatrix_loc, 1, GL_FALSE, normal_mat.flatten())
-
+    upload_light(estado, view)
+    program = get_program(True)
+    if program:
+        program.use()
+        LightBuffers.bind(program)
+        ShadowMap.bind(program, view)
+    draw_instances(program, scene, projection, view, viewport_height)
+
+def draw(estado, projection, view, modelview):
+    """Same interface as LightingFlat / LightingGouraud.draw"""
+    draw_phong(estado, projection, modelview)
+
+def draw_instanced(estado, scene, projection, view, modelview, viewport_height):
+    """Same interface as LightingFlat / LightingGouraud.draw_instanced"""
+    draw_phong_instanced(estado, scene, projection, modelview, viewport_height)
+
+def upload_light(estado, modelview_rm):
+    """Light (estado.light_pos moved to view space by modelview_rm) into the light UBO"""
     # Light properties - transform light position from world to view space
     # In the fixed-function pipeline (Flat/Gouraud), glLightfv transforms the light
     # position by the current modelview matrix. We need to replicate that here.
     light_pos_world = np.array(estado.light_pos, dtype=np.float32)
 
-    # Transform using the modelview matrix (column-major from OpenGL)
-    # Reshape and transpose to get row-major, then multiply
+    # Transform using the row-major modelview matrix
     # For a point light (w=1), this transforms it to view space
     light_pos_view_homogeneous = modelview_rm @ light_pos_world
 
-    # Extract xyz and normalize if it's a directional light, or just take xyz for point light
+    # Point light: divide by w (w = 1 in the block). Directional light: keep the
+    # direction with w = 0, the shaders then ignore the fragment position
     if light_pos_world[3] != 0.0:  # Point light
-        light_pos = (light_pos_view_homogeneous[:3] / light_pos_view_homogeneous[3]).astype(np.float32)
+        light_pos = np.append(light_pos_view_homogeneous[:3] / light_pos_view_homogeneous[3], 1.0).astype(np.float32)
     else:  # Directional light
-        light_pos = light_pos_view_homogeneous[:3].astype(np.float32)
-    light_ambient = np.array(LIGHT_AMBIENT[:3], dtype=np.float32)
-    light_diffuse = np.array(LIGHT_DIFFUSE[:3], dtype=np.float32)
-    light_specular = np.array([1.0, 1.0, 1.0], dtype=np.float32)
-    
-    glUniform3fv(lightPos_loc, 1, light_pos)
-    glUniform3fv(lightAmbient_loc, 1, light_ambient)
-    glUniform3fv(lightDiffuse_loc, 1, light_diffuse)
-    glUniform3fv(lightSpecular_loc, 1, light_specular)
-    
-    # Material properties
-    material = MATERIAL_COLORS.get(estado.material, MATERIAL_COLORS['orange'])
-    Ka = np.array(material['ambient'], dtype=np.float32)
-    Kd = np.array(material['diffuse'], dtype=np.float32)
-    Ks = np.array(material['specular'], dtype=np.float32)
-    shininess_val = material['shininess']
-    
-    glUniform4fv(Ka_loc, 1, Ka)
-    glUniform4fv(Kd_loc, 1, Kd)
-    glUniform4fv(Ks_loc, 1, Ks)
-    glUniform1f(shininess_loc, shininess_val)
-    
-    # Generate vertices based on shape
-    shape = estado.shape
-    if shape == 'sphere':
-        pos_list, norm_list = generate_sphere_triangles(32, 32)
-    elif shape == 'cube':
-        pos_list, norm_list = generate_cube_triangles()
-    elif shape == 'torus':
-        pos_list, norm_list = generate_torus_triangles(24, 48)
-    elif shape == 'pyramid':
-        pos_list, norm_list = generate_pyramid_triangles()
-    else:
-        pos_list, norm_list = generate_sphere_triangles(32, 32)  # Default to sphere
-    
-    # Create numpy arrays
-    pos_data = np.array(pos_list, dtype=np.float32)
-    norm_data = np.array(norm_list, dtype=np.float32)
-    
-    # Create and bind VBOs
-    vbo_pos = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, vbo_pos)
-    glBufferData(GL_ARRAY_BUFFER, pos_data.nbytes, pos_data, GL_STATIC_DRAW)
-    
-    vbo_norm = glGenBuffers(1)
-    glBindBuffer(GL_ARRAY_BUFFER, vbo_norm)
-    glBufferData(GL_ARRAY_BUFFER, norm_data.nbytes, norm_data, GL_STATIC_DRAW)
-    
-    # Attribute locations
-    pos_loc = glGetAttribLocation(shaderprogram, "aPos")
-    norm_loc = glGetAttribLocation(shaderprogram, "aNormal")
-    
-    # Position attribute
-    glEnableVertexAttribArray(pos_loc)
-    glBindBuffer(GL_ARRAY_BUFFER, vbo_pos)
-    glVertexAttribPointer(pos_loc, 3, GL_FLOAT, GL_FALSE, 0, None)
-    
-    # Normal attribute
-    glEnableVertexAttribArray(norm_loc)
-    glBindBuffer(GL_ARRAY_BUFFER, vbo_norm)
-    glVertexAttribPointer(norm_loc, 3, GL_FLOAT, GL_FALSE, 0, None)
-    
-    # Draw
-    glDrawArrays(GL_TRIANGLES, 0, len(pos_data))
-    
-    # Clean up
-    glDisableVertexAttribArray(pos_loc)
-    glDisableVertexAttribArray(norm_loc)
-    glDeleteBuffers(2, [vbo_pos, vbo_norm])
-    
-    # Re-enable culling after draw
-    glEnable(GL_CULL_FACE)
+        light_pos = light_pos_view_homogeneous.astype(np.float32)
+    light_specular = [1.0, 1.0, 1.0]
+
+    # Light block is re-uploaded only when it changed (the material table is
+    # already resident, draws only pick a material index)
+    UniformBlocks.update_light(light_pos, LIGHT_AMBIENT, LIGHT_DIFFUSE, light_specular)
+
+def get_stats():
+    """Uniform calls issued vs skipped by the Phong program, plus light UBO uploads"""
+    program = programs.compiled()
+    stats = program.get_stats() if program else {'issued': 0, 'skipped': 0}
+    if UniformBlocks.light_buffer is not None:
+        stats['light_uploads'] = UniformBlocks.light_buffer.uploads
+        stats['light_skipped'] = UniformBlocks.light_buffer.skipped
+    return stats
 
 def get_name():
     """Return the display name of this lighting model."""
@@ -0,0 +1,279 @@
+"""
+Shader program wrapper
+
+Resolves every uniform location once after linking and remembers the last
+value sent to each uniform, so redundant glUniform* calls are skipped!!
+
+Linked programs are also saved with glGetProgramBinary in SHADER_CACHE_DIR,
+keyed by a hash of the sources and the driver, and reloaded with
+glProgramBinary on the next launch instead of compiling the GLSL again.
+ProgramCache keeps the single-object / instanced variants of each lighting
+(or shadow) program, so every module only provides its sources.
+"""
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileShader
+import ctypes
+import hashlib
+import os
+import struct
+import numpy as np
+
+# Program binaries (None disables the disk cache)
+SHADER_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shader_cache')
+BINARY_HEADER = '<I'  # Binary format enum, then the blob
+
+def _vector(setter, components, dtype=np.float32):
+    return dtype, components, lambda loc, n, v: setter(loc, n, v)
+
+def _matrix(setter, components):
+    return np.float32, components, lambda loc, n, v: setter(loc, n, GL_FALSE, v)
+
+# Sampler (and image unit) uniforms: a texture unit, set with glUniform1iv
+SAMPLER_TYPES = (
+    GL_SAMPLER_1D, GL_SAMPLER_2D, GL_SAMPLER_3D, GL_SAMPLER_CUBE, GL_SAMPLER_2D_RECT,
+    GL_SAMPLER_1D_ARRAY, GL_SAMPLER_2D_ARRAY, GL_SAMPLER_2D_MULTISAMPLE, GL_SAMPLER_BUFFER,
+    GL_SAMPLER_1D_SHADOW, GL_SAMPLER_2D_SHADOW, GL_SAMPLER_CUBE_SHADOW, GL_SAMPLER_2D_ARRAY_SHADOW,
+    GL_INT_SAMPLER_2D, GL_INT_SAMPLER_3D, GL_INT_SAMPLER_CUBE, GL_INT_SAMPLER_2D_ARRAY, GL_INT_SAMPLER_BUFFER,
+    GL_UNSIGNED_INT_SAMPLER_2D, GL_UNSIGNED_INT_SAMPLER_3D, GL_UNSIGNED_INT_SAMPLER_CUBE,
+    GL_UNSIGNED_INT_SAMPLER_2D_ARRAY, GL_UNSIGNED_INT_SAMPLER_BUFFER,
+)
+
+# GL uniform type -> (NumPy dtype, components, setter)
+UNIFORM_SETTERS = {
+    GL_FLOAT: _vector(glUniform1fv, 1),
+    GL_FLOAT_VEC2: _vector(glUniform2fv, 2),
+    GL_FLOAT_VEC3: _vector(glUniform3fv, 3),
+    GL_FLOAT_VEC4: _vector(glUniform4fv, 4),
+    GL_FLOAT_MAT2: _matrix(glUniformMatrix2fv, 4),
+    GL_FLOAT_MAT3: _matrix(glUniformMatrix3fv, 9),
+    GL_FLOAT_MAT4: _matrix(glUniformMatrix4fv, 16),
+    GL_FLOAT_MAT2x3: _matrix(glUniformMatrix2x3fv, 6),
+    GL_FLOAT_MAT2x4: _matrix(glUniformMatrix2x4fv, 8),
+    GL_FLOAT_MAT3x2: _matrix(glUniformMatrix3x2fv, 6),
+    GL_FLOAT_MAT3x4: _matrix(glUniformMatrix3x4fv, 12),
+    GL_FLOAT_MAT4x2: _matrix(glUniformMatrix4x2fv, 8),
+    GL_FLOAT_MAT4x3: _matrix(glUniformMatrix4x3fv, 12),
+    GL_INT: _vector(glUniform1iv, 1, np.int32),
+    GL_INT_VEC2: _vector(glUniform2iv, 2, np.int32),
+    GL_INT_VEC3: _vector(glUniform3iv, 3, np.int32),
+    GL_INT_VEC4: _vector(glUniform4iv, 4, np.int32),
+    GL_BOOL: _vector(glUniform1iv, 1, np.int32),
+    GL_BOOL_VEC2: _vector(glUniform2iv, 2, np.int32),
+    GL_BOOL_VEC3: _vector(glUniform3iv, 3, np.int32),
+    GL_BOOL_VEC4: _vector(glUniform4iv, 4, np.int32),
+    GL_UNSIGNED_INT: _vector(glUniform1uiv, 1, np.uint32),
+    GL_UNSIGNED_INT_VEC2: _vector(glUniform2uiv, 2, np.uint32),
+    GL_UNSIGNED_INT_VEC3: _vector(glUniform3uiv, 3, np.uint32),
+    GL_UNSIGNED_INT_VEC4: _vector(glUniform4uiv, 4, np.uint32),
+}
+UNIFORM_SETTERS.update({gl_type: _vector(glUniform1iv, 1, np.int32) for gl_type in SAMPLER_TYPES})
+INT_TYPES = tuple(gl_type for gl_type, (dtype, _, _) in UNIFORM_SETTERS.items() if dtype != np.float32)
+
+def driver_string():
+    """Vendor, renderer and version of the current context (program binaries only load on the same driver)"""
+    return ' / '.join(glGetString(name).decode(errors='replace')
+                      for name in (GL_VENDOR, GL_RENDERER, GL_VERSION, GL_SHADING_LANGUAGE_VERSION))
+
+def binary_cache_path(vertex_source, fragment_source, cache_dir=SHADER_CACHE_DIR):
+    """Cache file of a program: sha256 of both sources and the driver string"""
+    key = hashlib.sha256('\0'.join((vertex_source, fragment_source, driver_string())).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.bin')
+
+def binaries_supported():
+    """True if the driver can save at least one program binary format"""
+    try:
+        return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+    except GLError:
+        return False
+
+def link_program(vertex_source, fragment_source, retrievable=False):
+    """
+    Compiles and links the program. With retrievable (only pass it when
+    binaries_supported()) the driver is asked to keep its binary for
+    save_program_binary.
+    """
+    shaders = [compileShader(vertex_source, GL_VERTEX_SHADER), compileShader(fragment_source, GL_FRAGMENT_SHADER)]
+    program = glCreateProgram()
+    for shader in shaders:
+        glAttachShader(program, shader)
+    if retrievable and bool(glProgramParameteri):  # GL 4.1 / ARB_get_program_binary
+        glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+    glLinkProgram(program)
+    for shader in shaders:
+        glDetachShader(program, shader)
+        glDeleteShader(shader)
+    if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+        log = glGetProgramInfoLog(program)
+        glDeleteProgram(program)
+        raise RuntimeError(f"Shader link failure: {log}")
+    return program
+
+def load_program_binary(path):
+    """Program rebuilt from a cached binary, or None if missing or rejected by the driver"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    header = struct.calcsize(BINARY_HEADER)
+    if len(data) <= header:
+        return None
+    binary_format, = struct.unpack_from(BINARY_HEADER, data)
+    blob = np.frombuffer(data, dtype=np.uint8, offset=header)
+    program = glCreateProgram()
+    try:
+        glProgramBinary(program, binary_format, blob, len(blob))
+        linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+    except GLError:  # Unknown format (corrupt file)
+        linked = False
+    if not linked:  # Also e.g. a driver update: recompiled and saved again
+        glDeleteProgram(program)
+        return None
+    return program
+
+def save_program_binary(program, path):
+    """Writes the program binary to path (atomically); returns False if the driver gave none"""
+    length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+    if length <= 0:
+        return False
+    blob = (ctypes.c_ubyte * length)()
+    written = GLsizei(0)
+    binary_format = GLenum(0)
+    glGetProgramBinary(program, length, ctypes.byref(written), ctypes.byref(binary_format), blob)
+    if written.value <= 0:
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(struct.pack(BINARY_HEADER, binary_format.value))
+        f.write(bytes(blob)[:written.value])
+    os.replace(temporary, path)
+    return True
+
+class ShaderProgram:
+    """
+    Linked GLSL program with cached uniform locations and values.
+
+    issued / skipped count the glUniform* calls made and avoided; from_cache
+    tells whether the program came from the binary cache.
+    """
+    def __init__(self, vertex_source, fragment_source, cache_dir=SHADER_CACHE_DIR):
+        self.program = None
+        self.from_cache = False
+        path = None
+        if cache_dir and binaries_supported():
+            path = binary_cache_path(vertex_source, fragment_source, cache_dir)
+            self.program = load_program_binary(path)
+            self.from_cache = self.program is not None
+        if self.program is None:
+            self.program = link_program(vertex_source, fragment_source, retrievable=path is not None)
+            if path:
+                try:
+                    save_program_binary(self.program, path)
+                except OSError as e:  # Read-only checkout: just compile every launch
+                    print(f"Warning: could not cache shader binary: {e}")
+        self.uniforms = {}  # name -> (location, type)
+        self.values = {}    # name -> bytes of the last value sent
+        self.issued = 0
+        self.skipped = 0
+
+        # Resolve all active uniforms once, at link time
+        for index in range(glGetProgramiv(self.program, GL_ACTIVE_UNIFORMS)):
+            name, size, gl_type = glGetActiveUniform(self.program, index)
+            name = name.decode() if isinstance(name, bytes) else name
+            name = name.split('[')[0]  # Arrays are reported as "name[0]"
+            location = glGetUniformLocation(self.program, name)
+            if location >= 0:
+                self.uniforms[name] = (location, gl_type)
+
+    def __bool__(self):
+        return bool(self.program)
+
+    def use(self):
+        glUseProgram(self.program)
+
+    def set_uniform(self, name, value):
+        """
+        Sends value to the uniform (the program must be in use).
+        Skipped when the uniform is inactive or already holds this value.
+        Matrices are expected in column-major (OpenGL) order. Raises
+        TypeError for types without a setter (e.g. doubles).
+        """
+        if name not in self.uniforms:
+            return
+        location, gl_type = self.uniforms[name]
+        if gl_type not in UNIFORM_SETTERS:
+            raise TypeError(f"Uniform '{name}' has an unsupported GL type 0x{int(gl_type):04X}")
+        dtype, components, setter = UNIFORM_SETTERS[gl_type]
+        data = np.ascontiguousarray(value, dtype=dtype).reshape(-1)
+        raw = data.tobytes()
+        if self.values.get(name) == raw:
+            self.skipped += 1
+            return
+        setter(location, len(data) // components, data)
+        self.values[name] = raw
+        self.issued += 1
+
+    def bind_uniform_block(self, block_name, binding):
+        """Connects a uniform block to a UBO binding point (ignored if the block is unused)"""
+        index = glGetUniformBlockIndex(self.program, block_name)
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(self.program, index, binding)
+
+    def get_stats(self):
+        """Uniform calls issued vs skipped since the last reset"""
+        return {'issued': self.issued, 'skipped': self.skipped}
+
+    def reset_stats(self):
+        self.issued = 0
+        self.skipped = 0
+
+    def delete(self):
+        glDeleteProgram(self.program)
+        self.program = 0
+        self.values.clear()
+
+def compile_program(vertex_source, fragment_source, label, setup=None):
+    """
+    ShaderProgram from the sources (or the binary cache), with setup(program)
+    run once linked, e.g. UniformBlocks.bind_program. Returns None and prints
+    the error if it does not compile.
+    """
+    try:
+        program = ShaderProgram(vertex_source, fragment_source)
+        if setup:
+            setup(program)
+        print(f"{label} shaders {'loaded from cache' if program.from_cache else 'compiled successfully'}!")
+        return program
+    except Exception as e:
+        print(f"Error compiling {label} shaders: {e}")
+        return None
+
+class ProgramCache:
+    """
+    The single-object and instanced variants of one program, compiled on
+    first use. sources(instanced) returns the (vertex, fragment) sources.
+    A variant that failed to compile is stored as False and not retried.
+    """
+    def __init__(self, label, sources, setup=None):
+        self.label = label
+        self.sources = sources
+        self.setup = setup
+        self.programs = {}
+
+    def get(self, instanced=False):
+        instanced = bool(instanced)
+        if instanced not in self.programs:
+            self.programs[instanced] = compile_program(*self.sources(instanced), self.label, self.setup) or False
+        return self.programs[instanced]
+
+    def compiled(self, instanced=False):
+        """The variant if it was already built (without compiling it), else None"""
+        return self.programs.get(bool(instanced)) or None
+
+    def clear(self):
+        """Deletes the compiled variants; the next get() builds them again (e.g. on a new context)"""
+        for program in self.programs.values():
+            if program:
+                program.delete()
+        self.programs.clear()
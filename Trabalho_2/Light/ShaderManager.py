@@ -0,0 +1,46 @@
+"""
+Shader manager
+
+Builds every lighting program (Flat, Gouraud and Phong, single object and
+instanced) and the shadow map's depth programs in one warm-up pass at startup, so the first switch to a model
+never stalls on a GLSL compile. With the binary cache of Shader.py later
+launches only reload the programs!!
+"""
+import time
+from . import LightingFlat, LightingGouraud, LightingPhong, ShadowMap
+
+LIGHTING_MODULES = {'flat': LightingFlat, 'gouraud': LightingGouraud, 'phong': LightingPhong}
+# Everything warm_up builds (same get_program(instanced) interface)
+PROGRAM_MODULES = dict(LIGHTING_MODULES, shadow=ShadowMap)
+
+def warm_up():
+    """
+    Compiles (or loads from the binary cache) all PROGRAM_MODULES programs on the
+    current context. Returns {'phong/instanced': {'ms', 'cached', 'ok'}, ...}.
+    """
+    report = {}
+    for name, module in PROGRAM_MODULES.items():
+        for instanced in (False, True):
+            start = time.perf_counter()
+            program = module.get_program(instanced)
+            report[name + ('/instanced' if instanced else '')] = {
+                'ms': (time.perf_counter() - start) * 1000.0,
+                'cached': bool(program) and program.from_cache,
+                'ok': bool(program),
+            }
+    return report
+
+def release():
+    """Deletes every PROGRAM_MODULES program (e.g. before the GL context goes away)"""
+    for module in PROGRAM_MODULES.values():
+        module.programs.clear()
+
+def summary(report):
+    """One line for the console, e.g. 'shaders: 6 programs in 12.3 ms (6 from cache)'"""
+    total = sum(entry['ms'] for entry in report.values())
+    cached = sum(entry['cached'] for entry in report.values())
+    failed = [name for name, entry in report.items() if not entry['ok']]
+    line = f"shaders: {len(report)} programs in {total:.1f} ms ({cached} from cache)"
+    if failed:
+        line += f", failed: {', '.join(failed)}"
+    return line
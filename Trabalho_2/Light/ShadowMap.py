@@ -0,0 +1,246 @@
+"""
+Shadow map of the main light (estado.light_pos)
+
+A depth-only pre-pass renders the geometry from the light into a DepthFBO
+and the Phong shader compares against it with 3x3 PCF. Like the Phong
+light, the light lives in the object / scene frame, so the map depends only
+on the light position and the geometry: it is re-rendered only when one of
+them changes, never for a camera move or a rotation of estado!!
+
+Point lights (w = 1) use a perspective frustum around the geometry's
+bounding sphere, directional ones (w = 0) an orthographic box. A point light
+inside the bounding sphere (e.g. within a scene) would need a cube map: it
+gets a SHADOW_WIDE_FOV frustum towards the center instead, and what falls
+outside of it is lit.
+"""
+from OpenGL.GL import *
+import numpy as np
+import Transform_3D
+from Object import Mesh
+from .Shader import ProgramCache
+from . import LightingPhong
+
+SHADOWS = True
+SHADOW_MAP_SIZE = 1024            # Texels per side, see set_resolution()
+SHADOW_MAP_UNIT = 4               # Texture unit of the sampler2DShadow
+SHADOW_POLYGON_OFFSET = (4.0, 16.0)  # Slope-scaled depth offset of the pre-pass (acne)
+SHADOW_BIAS = 0.001               # Depth bias of the lookups
+SHADOW_WIDE_FOV = 120.0           # Frustum of a light inside the geometry (degrees)
+
+# [-1, 1] clip coordinates -> [0, 1] texture coordinates and depth
+CLIP_TO_TEXTURE = Transform_3D.translate([0.5, 0.5, 0.5]) @ Transform_3D.scale(0.5)
+
+DEPTH_VERTEX_SHADER_SOURCE = """
+#version 330 core
+
+layout (location = 0) in vec3 aPos;
+
+uniform mat4 lightMatrix;
+
+void main() {
+    gl_Position = lightMatrix * vec4(aPos, 1.0);
+}
+"""
+
+INSTANCED_DEPTH_VERTEX_SHADER_SOURCE = """
+#version 330 core
+
+layout (location = 0) in vec3 aPos;
+layout (location = 2) in mat4 aModel;
+
+uniform mat4 lightMatrix;
+
+void main() {
+    gl_Position = lightMatrix * aModel * vec4(aPos, 1.0);
+}
+"""
+
+DEPTH_FRAGMENT_SHADER_SOURCE = """
+#version 330 core
+
+void main() {
+}
+"""
+
+# GLSL for the Phong fragment shader: fraction of the main light reaching P (view space)
+SHADOW_GLSL = """
+uniform sampler2DShadow shadowMap;
+uniform mat4 shadowMatrix;   // View space -> shadow map texture coordinates
+uniform int shadowsEnabled;
+uniform float shadowBias;
+
+float shadowFactor(vec3 P) {
+    if (shadowsEnabled == 0) {
+        return 1.0;
+    }
+    vec4 coord = shadowMatrix * vec4(P, 1.0);
+    vec3 projected = coord.xyz / coord.w;
+    if (coord.w <= 0.0 || projected.z >= 1.0) {
+        return 1.0;  // Behind the light / past its far plane
+    }
+    // 3x3 PCF, each lookup already filtering 2x2 comparisons
+    vec2 texel = 1.0 / vec2(textureSize(shadowMap, 0));
+    float lit = 0.0;
+    for (int x = -1; x <= 1; x++) {
+        for (int y = -1; y <= 1; y++) {
+            lit += texture(shadowMap, vec3(projected.xy + vec2(x, y) * texel, projected.z - shadowBias));
+        }
+    }
+    return lit / 9.0;
+}
+"""
+
+depth_fbo = None        # Aux_3D.DepthFBO of SHADOW_MAP_SIZE
+shadow_instances = None  # Mesh.InstanceBuffer with every instance of the scene (not only the visible ones)
+light_matrix = None      # Row-major object / scene space -> light clip space, None = no shadows
+_key = None              # (light position, geometry, size) of the current map
+renders = 0
+skipped = 0
+
+def program_sources(instanced=False):
+    """(vertex, fragment) sources of the single-object or instanced depth program"""
+    return (INSTANCED_DEPTH_VERTEX_SHADER_SOURCE if instanced else DEPTH_VERTEX_SHADER_SOURCE), DEPTH_FRAGMENT_SHADER_SOURCE
+
+# Both variants, compiled on first use (no UBOs: only lightMatrix)
+programs = ProgramCache("Shadow", program_sources)
+
+def get_program(instanced=False):
+    """Depth-only program (compiled on first use), False if it failed to compile (not retried)"""
+    return programs.get(instanced)
+
+def set_resolution(size):
+    """Shadow map size in texels per side (the map is rebuilt on the next update)"""
+    global SHADOW_MAP_SIZE
+    SHADOW_MAP_SIZE = int(size)
+
+def enclosing_sphere(centers, radii):
+    """(center, radius) of a sphere around all the given spheres"""
+    lo = (centers - radii[:, None]).min(axis=0)
+    hi = (centers + radii[:, None]).max(axis=0)
+    center = (lo + hi) / 2
+    return center, float((np.linalg.norm(centers - center, axis=1) + radii).max())
+
+def light_frustum(light_pos, center, radius):
+    """
+    Row-major projection @ view of the light, fitted to the bounding sphere
+    (center, radius).
+    """
+    light_pos = np.asarray(light_pos, dtype=np.float64)
+    center = np.asarray(center, dtype=np.float64)
+    if light_pos[3] == 0.0:  # Directional: orthographic box along the light direction
+        direction = light_pos[:3] / np.linalg.norm(light_pos[:3])
+        eye = center + direction * 2 * radius
+        distance = 2 * radius
+        projection = Transform_3D.ortho(-radius, radius, -radius, radius, distance - radius, distance + radius)
+    else:
+        eye = light_pos[:3] / light_pos[3]
+        direction = eye - center
+        distance = np.linalg.norm(direction)
+        if distance < 1e-6 * radius:  # Right at the center: any direction will do
+            direction, center = np.array([0.0, 0.0, 1.0]), eye - (0.0, 0.0, radius)
+        if distance > radius:
+            fovy = 2 * np.degrees(np.arcsin(radius / distance))
+            projection = Transform_3D.perspective(fovy, 1.0, max(distance - radius, 0.01 * distance), distance + radius)
+        else:
+            projection = Transform_3D.perspective(SHADOW_WIDE_FOV, 1.0, 0.01 * radius, distance + radius)
+    up = (0, 1, 0) if abs(direction[1]) < 0.99 * np.linalg.norm(direction) else (1, 0, 0)
+    return projection @ Transform_3D.look_at(eye, center, up)
+
+def update(estado, gpu_timer=None):
+    """
+    Re-renders the shadow map if estado's light or geometry (shape, or the
+    version of estado.scene) changed since the last one. Call it outside of
+    the main FBO, before drawing.
+    """
+    global depth_fbo, shadow_instances, light_matrix, _key, renders, skipped
+    if not SHADOWS:
+        light_matrix = None
+        _key = None
+        return
+    if estado.scene is not None:
+        scene = estado.scene.instances()
+        geometry = ('scene', scene.version)
+    else:
+        scene = None
+        geometry = ('shape', estado.shape)
+    key = (tuple(estado.light_pos), geometry, SHADOW_MAP_SIZE)
+    if key == _key:
+        skipped += 1
+        return
+    _key = key
+
+    if scene is not None:
+        if not scene.count:
+            light_matrix = None
+            return
+        center, radius = enclosing_sphere(*scene.world_spheres())
+    else:
+        mesh = LightingPhong.get_mesh(estado.shape)
+        center, radius = mesh.center, mesh.radius
+    light_matrix = light_frustum(estado.light_pos, center, radius)
+    program = get_program(scene is not None)
+    if light_matrix is None or not program:
+        light_matrix = None
+        return
+
+    from Aux_3D import DepthFBO
+    if depth_fbo is None or depth_fbo.width != SHADOW_MAP_SIZE:
+        if depth_fbo is not None:
+            depth_fbo.delete()
+        depth_fbo = DepthFBO(SHADOW_MAP_SIZE)
+
+    if gpu_timer:
+        gpu_timer.begin('shadow')
+    depth_fbo.bind()
+    glClear(GL_DEPTH_BUFFER_BIT)
+    glDisable(GL_CULL_FACE)
+    glEnable(GL_POLYGON_OFFSET_FILL)
+    glPolygonOffset(*SHADOW_POLYGON_OFFSET)
+    program.use()
+    program.set_uniform('lightMatrix', Transform_3D.to_gl(light_matrix))
+    if scene is not None:
+        # Every instance casts shadows, also the ones outside the camera frustum
+        if shadow_instances is None:
+            shadow_instances = Mesh.InstanceBuffer()
+        shadow_instances.upload(scene.packed(), scene.version)
+        for shape, first, count in scene.batches():
+            LightingPhong.get_mesh(shape).draw_instanced(shadow_instances, first, count)
+    else:
+        mesh.draw()
+    glDisable(GL_POLYGON_OFFSET_FILL)
+    glEnable(GL_CULL_FACE)
+    glUseProgram(0)
+    depth_fbo.unbind()
+    if gpu_timer:
+        gpu_timer.end('shadow')
+    renders += 1
+
+def release():
+    """Deletes the shadow map FBO and instance buffer; the next update() renders a new map"""
+    global depth_fbo, shadow_instances, light_matrix, _key
+    if depth_fbo is not None:
+        depth_fbo.delete()
+    if shadow_instances is not None:
+        shadow_instances.delete()
+    depth_fbo = shadow_instances = light_matrix = _key = None
+
+def bind(program, modelview):
+    """
+    Points the Phong program (in use) at the shadow map. modelview (row-major)
+    takes the object / scene space of the map to the view space of fragPos.
+    """
+    program.set_uniform('shadowMap', SHADOW_MAP_UNIT)  # Own unit even when unused (sampler types may not share)
+    if light_matrix is None:
+        program.set_uniform('shadowsEnabled', 0)
+        return
+    glActiveTexture(GL_TEXTURE0 + SHADOW_MAP_UNIT)
+    glBindTexture(GL_TEXTURE_2D, depth_fbo.texture)
+    glActiveTexture(GL_TEXTURE0)
+    shadow_matrix = CLIP_TO_TEXTURE @ light_matrix @ np.linalg.inv(modelview)
+    program.set_uniform('shadowMatrix', Transform_3D.to_gl(shadow_matrix))
+    program.set_uniform('shadowBias', SHADOW_BIAS)
+    program.set_uniform('shadowsEnabled', 1)
+
+def get_stats():
+    """Shadow map renders vs frames that reused the previous map"""
+    return {'renders': renders, 'skipped': skipped}
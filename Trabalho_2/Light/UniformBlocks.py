@@ -0,0 +1,133 @@
+"""
+Uniform Buffer Objects (std140) for lights and materials
+
+The light and every material from MATERIAL_COLORS live in UBOs shared by
+all shader programs, so switching material is a single int uniform!!
+"""
+from OpenGL.GL import *
+import numpy as np
+from Aux_3D import MATERIAL_COLORS
+
+# Binding points (same for every program)
+LIGHT_BLOCK_BINDING = 0
+MATERIAL_BLOCK_BINDING = 1
+
+MAX_MATERIALS = 16
+MATERIAL_NAMES = list(MATERIAL_COLORS)
+
+# GLSL declarations to paste into any shader that needs them
+LIGHT_BLOCK_GLSL = """
+layout (std140) uniform LightBlock {
+    vec4 lightPos;       // View space: w = 1 position, w = 0 direction towards the light
+    vec4 lightAmbient;
+    vec4 lightDiffuse;
+    vec4 lightSpecular;
+};
+"""
+
+MATERIAL_BLOCK_GLSL = """
+struct Material {
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 specular;
+    float shininess;     // std140: struct padded to 64 bytes
+};
+
+layout (std140) uniform MaterialBlock {
+    Material materials[%d];
+};
+
+uniform int materialIndex;
+""" % MAX_MATERIALS
+
+def material_index(name):
+    """Index of a material in the material UBO (unknown names -> orange)"""
+    if name not in MATERIAL_COLORS:
+        name = 'orange'
+    return MATERIAL_NAMES.index(name)
+
+def pack_light(position, ambient, diffuse, specular):
+    """
+    LightBlock as float32[16] (four std140 vec4). position is homogeneous
+    like GL_POSITION: w = 0 is a directional light, w = 1 (default) a point light.
+    """
+    data = np.zeros((4, 4), dtype=np.float32)
+    data[0, :3] = position[:3]
+    data[0, 3] = position[3] if len(position) > 3 else 1.0
+    data[1, :3] = ambient[:3]
+    data[2, :3] = diffuse[:3]
+    data[3, :3] = specular[:3]
+    return data.reshape(-1)
+
+def pack_materials(material_colors=MATERIAL_COLORS):
+    """MaterialBlock as float32[MAX_MATERIALS * 16], in MATERIAL_NAMES order"""
+    data = np.zeros((MAX_MATERIALS, 16), dtype=np.float32)
+    for i, name in enumerate(MATERIAL_NAMES[:MAX_MATERIALS]):
+        material = material_colors[name]
+        data[i, 0:4] = material['ambient']
+        data[i, 4:8] = material['diffuse']
+        data[i, 8:12] = material['specular']
+        data[i, 12] = material['shininess']
+    return data.reshape(-1)
+
+class UniformBuffer:
+    """UBO bound to a fixed binding point; update() skips unchanged data"""
+    def __init__(self, nbytes, binding):
+        self.nbytes = nbytes
+        self.binding = binding
+        self.data = None
+        self.uploads = 0
+        self.skipped = 0
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.ubo)
+
+    def update(self, data):
+        raw = np.ascontiguousarray(data, dtype=np.float32).tobytes()
+        if raw == self.data:
+            self.skipped += 1
+            return
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, len(raw), raw)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self.data = raw
+        self.uploads += 1
+
+    def delete(self):
+        glDeleteBuffers(1, [self.ubo])
+        self.ubo = 0
+        self.data = None
+
+# Shared buffers (created on first use, once a GL context exists)
+light_buffer = None
+material_buffer = None
+
+def init_buffers():
+    """Creates the light and material UBOs and uploads the material table once"""
+    global light_buffer, material_buffer
+    if light_buffer is None:
+        light_buffer = UniformBuffer(16 * 4, LIGHT_BLOCK_BINDING)
+    if material_buffer is None:
+        material_buffer = UniformBuffer(MAX_MATERIALS * 16 * 4, MATERIAL_BLOCK_BINDING)
+        material_buffer.update(pack_materials())
+
+def release():
+    """Deletes the light and material UBOs (they are created again on first use)"""
+    global light_buffer, material_buffer
+    for buffer in (light_buffer, material_buffer):
+        if buffer is not None:
+            buffer.delete()
+    light_buffer = material_buffer = None
+
+def update_light(position, ambient, diffuse, specular):
+    """Uploads the light block (only if it changed since the last call)"""
+    init_buffers()
+    light_buffer.update(pack_light(position, ambient, diffuse, specular))
+
+def bind_program(shader):
+    """Connects a ShaderProgram's LightBlock / MaterialBlock to the shared binding points"""
+    init_buffers()
+    shader.bind_uniform_block('LightBlock', LIGHT_BLOCK_BINDING)
+    shader.bind_uniform_block('MaterialBlock', MATERIAL_BLOCK_BINDING)
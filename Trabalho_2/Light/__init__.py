@@ -2,8 +2,13 @@
 Light package - helper file!
 """
 
+from . import LightBuffers
 from . import LightingFlat
 from . import LightingGouraud
 from . import LightingPhong
+from . import Shader
+from . import ShaderManager
+from . import ShadowMap
+from . import UniformBlocks
 
-__all__ = ['LightingFlat', 'LightingGouraud', 'LightingPhong']
+__all__ = ['LightBuffers', 'LightingFlat', 'LightingGouraud', 'LightingPhong', 'Shader', 'ShaderManager', 'ShadowMap', 'UniformBlocks']
@@ -0,0 +1,197 @@
+"""
+Many point lights (tiled forward shading, "Forward+")
+
+A LightList holds any number of point lights (world position, color and
+range) in flat NumPy arrays. Each frame the screen is split in TILE_SIZE
+pixel tiles and every light is assigned, on the CPU, to the tiles its
+bounding sphere covers on screen. The Phong fragment shader then only loops
+over the lights of its own tile instead of over all of them!!
+
+Put a LightList in estado.lights: with Phong they are added to the main
+light (estado.light_pos). Flat and Gouraud light per vertex, where there
+is no tile to look up, so they ignore them.
+"""
+import itertools
+import numpy as np
+
+from Profiler_3D import percentiles
+
+TILE_SIZE = 16   # Pixels per side of a screen tile
+
+# Version counter shared by every LightList (a version identifies its data)
+_versions = itertools.count(1)
+
+def near_plane(projection):
+    """Near plane distance of a row-major gluPerspective-style projection"""
+    return projection[2, 3] / (projection[2, 2] - 1.0)
+
+def far_plane(projection):
+    """Far plane distance of a row-major gluPerspective-style projection"""
+    return projection[2, 3] / (projection[2, 2] + 1.0)
+
+def light_tile_rects(centers, radii, projection, width, height, tile_size=TILE_SIZE):
+    """
+    Conservative screen tile rectangle (x0, y0, x1, y1 inclusive, y up like
+    gl_FragCoord) of view space spheres: the bounds of the projected corners
+    of each sphere's box. Spheres crossing the near plane cover the whole
+    screen; the ones behind it, past the far plane or off screen get an
+    empty rectangle (x1 < x0).
+    """
+    tiles_x = -(-width // tile_size)
+    tiles_y = -(-height // tile_size)
+    near, far = near_plane(projection), far_plane(projection)
+    z = centers[:, 2]
+    crossing = z + radii > -near
+    hidden = (z - radii > -near) | (z + radii < -far)
+
+    # 8 box corners per sphere, projected (corners nearer than the near plane only for crossing spheres)
+    signs = np.array(list(itertools.product((-1, 1), repeat=3)), dtype=np.float64)
+    corners = centers[:, None, :] + signs[None] * radii[:, None, None]
+    clip = corners @ projection[:3, :3].T + projection[:3, 3]
+    w = np.maximum(corners @ projection[3, :3] + projection[3, 3], 1e-6)
+    ndc = clip[..., :2] / w[..., None]
+    lo = ((ndc.min(axis=1) * 0.5 + 0.5) * (width, height) // tile_size).astype(np.int64)
+    hi = ((ndc.max(axis=1) * 0.5 + 0.5) * (width, height) // tile_size).astype(np.int64)
+    lo[crossing] = 0
+    hi[crossing] = (tiles_x - 1, tiles_y - 1)
+
+    limits = np.array([tiles_x - 1, tiles_y - 1])
+    offscreen = (hi < 0).any(axis=1) | (lo > limits).any(axis=1)
+    lo = np.clip(lo, 0, limits)
+    hi = np.clip(hi, 0, limits)
+    hi[hidden | offscreen] = lo[hidden | offscreen] - 1
+    return np.hstack([lo, hi]), tiles_x, tiles_y
+
+def assign_tiles(rects, tiles_x, tiles_y):
+    """
+    Light lists of every tile from the light rectangles, without a Python
+    loop over lights or tiles. Returns (offsets, counts, indices): the
+    lights of tile t (= y * tiles_x + x) are indices[offsets[t]:offsets[t] + counts[t]].
+    """
+    widths = np.maximum(rects[:, 2] - rects[:, 0] + 1, 0)
+    heights = np.maximum(rects[:, 3] - rects[:, 1] + 1, 0)
+    per_light = widths * heights
+    lights = np.repeat(np.arange(len(rects)), per_light)
+    # Position of each (light, tile) pair inside its light's rectangle
+    local = np.arange(len(lights)) - np.repeat(np.cumsum(per_light) - per_light, per_light)
+    tx = rects[lights, 0] + local % widths[lights]
+    ty = rects[lights, 1] + local // widths[lights]
+    tiles = ty * tiles_x + tx
+
+    order = np.argsort(tiles, kind='stable')  # Tile by tile, lights in index order
+    counts = np.bincount(tiles, minlength=tiles_x * tiles_y)
+    offsets = np.cumsum(counts) - counts
+    return offsets.astype(np.int32), counts.astype(np.int32), lights[order].astype(np.int32)
+
+class LightList:
+    """
+    Point lights in flat NumPy arrays: world positions (N,3), linear RGB
+    colors (N,3) and ranges (N,), the distance where a light fades to zero.
+    """
+    def __init__(self, capacity=64):
+        self.positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.colors = np.zeros((capacity, 3), dtype=np.float32)
+        self.ranges = np.zeros(capacity, dtype=np.float32)
+        self.count = 0
+        self.version = next(_versions)
+        self._assign_key = None
+        self._assign_result = None
+        # Lights per tile of the last assignment (see tile_stats)
+        self.tile_counts = np.zeros(0, dtype=np.int32)
+        self.tile_size = TILE_SIZE
+        self.tiles_x = 0
+        self.tiles_y = 0
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, count):
+        if count <= len(self.ranges):
+            return
+        capacity = max(count, 2 * len(self.ranges))
+        for name in ('positions', 'colors', 'ranges'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, position, color=(1.0, 1.0, 1.0), light_range=5.0):
+        """Adds one light, returns its index"""
+        return self.add_many([position], [color], [light_range]).start
+
+    def add_many(self, positions, colors, ranges):
+        """Adds len(positions) lights at once, returns their index range"""
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        n = len(positions)
+        start = self.count
+        self._reserve(start + n)
+        self.positions[start:start + n] = positions
+        self.colors[start:start + n] = np.broadcast_to(np.asarray(colors, dtype=np.float32), (n, 3))
+        self.ranges[start:start + n] = np.broadcast_to(np.asarray(ranges, dtype=np.float32), (n,))
+        self.count += n
+        self.version = next(_versions)
+        return range(start, start + n)
+
+    def set_positions(self, positions, start=0):
+        """Moves lights start, start + 1, ..."""
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        self.positions[start:start + len(positions)] = positions
+        self.version = next(_versions)
+
+    def clear(self):
+        self.count = 0
+        self.version = next(_versions)
+
+    def assign(self, view, projection, width, height, tile_size=TILE_SIZE):
+        """
+        Tiled light assignment for the row-major camera view and projection
+        on a width x height target. Returns (lights, tiles, indices, key):
+        float32 (N, 8) view space lights [x, y, z, range, r, g, b, 0], int32
+        (tiles, 2) [offset, count] per tile, int32 light indices and a key
+        that changes whenever they do. Recomputed only when the lights or
+        the camera changed.
+        """
+        key = (self.version, np.asarray(view, dtype=np.float32).tobytes(),
+               np.asarray(projection, dtype=np.float32).tobytes(), width, height, tile_size)
+        if key == self._assign_key:
+            return self._assign_result
+        n = self.count
+        view = np.asarray(view, dtype=np.float64)
+        centers = self.positions[:n] @ view[:3, :3].T + view[:3, 3]
+        # Ranges grow with the camera scale (1 for a pure look_at)
+        radii = self.ranges[:n] * np.sqrt((view[:3, :3] ** 2).sum(axis=0)).max()
+        rects, tiles_x, tiles_y = light_tile_rects(centers, radii, np.asarray(projection, dtype=np.float64),
+                                                   width, height, tile_size)
+        offsets, counts, indices = assign_tiles(rects, tiles_x, tiles_y)
+
+        lights = np.zeros((n, 8), dtype=np.float32)
+        lights[:, :3] = centers
+        lights[:, 3] = radii
+        lights[:, 4:7] = self.colors[:n]
+        tiles = np.ascontiguousarray(np.stack([offsets, counts], axis=1), dtype=np.int32)
+
+        self.tile_counts = counts
+        self.tile_size, self.tiles_x, self.tiles_y = tile_size, tiles_x, tiles_y
+        self._assign_key = key
+        self._assign_result = (lights, tiles, indices, next(_versions))
+        return self._assign_result
+
+    def tile_stats(self):
+        """Lights per tile of the last assignment: mean, max, percentiles and empty tiles"""
+        counts = self.tile_counts
+        if not len(counts):
+            return {}
+        stats = {'tiles': len(counts), 'lights': self.count, 'mean': float(counts.mean()),
+                 'max': int(counts.max()), 'empty': int((counts == 0).sum()),
+                 'assigned': int(counts.sum())}
+        stats.update(percentiles(counts))
+        return stats
+
+def random_lights(count, extent=5.0, range_span=(1.0, 3.0), seed=0):
+    """Load test: count colored lights scattered in a cube of side 2 * extent"""
+    rng = np.random.default_rng(seed)
+    lights = LightList(count)
+    lights.add_many(rng.uniform(-extent, extent, (count, 3)),
+                    rng.uniform(0.2, 1.0, (count, 3)),
+                    rng.uniform(*range_span, count))
+    return lights
@@ -20,11 +20,16 @@ from OpenGL.GLU import *
 import pygame
 from pygame.locals import *
 import sys
+import time
 import multiprocessing as mp
 
-from Aux_3D import (Estado3D, init_opengl, draw_sphere, update_light, render_3d_to_texture, FBO,
+from Aux_3D import (Estado3D, StateSender, StateReceiver, init_opengl, draw_sphere, update_light, render_3d_to_texture, FBO,
                    LARGURA_JANELA, ALTURA_JANELA, FPS, MATERIAL_COLORS, LARGURA_3D, ALTURA_3D, set_lighting_model,
                    ROTATION_STEP, TRANSLATION_STEP)
+from Shared_3D import SharedEstado3D
+from Profiler_3D import FrameProfiler, GPUTimer, ProfilerOverlay
+import Transform_3D
+from Light import ShaderManager, ShadowMap
 
 # Layout constants
 MARGEM = 15
@@ -33,6 +38,26 @@ LIGHT_STEP = 0.5
 BUTTON_REPEAT_DELAY = 300
 BUTTON_REPEAT_INTERVAL = 50
 
+# On-demand rendering: only re-render when a command changed the scene and
+# block on the command queue while idle (False = re-render every frame)
+ON_DEMAND_RENDERING = True
+IDLE_POLL_INTERVAL = 0.05  # seconds between window event polls while idle
+
+# How the GUI state reaches the renderer: 'shared_memory' (Estado3D written in
+# place, see Shared_3D.py) or 'queue' (pickled state deltas on cmd_queue)
+STATE_TRANSPORT = 'shared_memory'
+
+# Latency / frame timeline profiling of the 3D window (P toggles the overlay,
+# T dumps the ring buffer as Chrome trace JSON to TRACE_FILE)
+SHOW_PROFILER_OVERLAY = False
+TRACE_FILE = 'trace_3d.json'
+
+# Phong shadow map sizes, cycled with M in the 3D window
+SHADOW_MAP_SIZES = [512, 1024, 2048]
+
+# Anti-aliasing modes of the 3D FBO as (MSAA samples, supersampling factor), cycled with A
+ANTIALIASING_MODES = [(0, 1), (2, 1), (4, 1), (8, 1), (0, 2)]
+
 # Colors
 COLOR_SCHEME = {
     'bg': (250, 251, 253),
@@ -271,7 +296,7 @@ def desenhar_hud(gui_surface, font_small, font_tiny, estado):
         gui_surface.blit(label_surf, (x, y))
         gui_surface.blit(value_surf, (x, y + 14))
 
-def run_3d_window(cmd_queue, state_queue=None):
+def run_3d_window(cmd_queue, state_queue=None, shared_name=None, wakeup=None):
     """Process for 3D rendering window!!"""
     pygame.init()
     # 3D window with OpenGL context and resizable flag
@@ -284,8 +309,18 @@ def run_3d_window(cmd_queue, state_queue=None):
     
     # Create FBO for offscreen 3D rendering
     fbo = FBO(LARGURA_3D, ALTURA_3D)
+
+    # Every lighting program up front (from the binary cache after the first launch)
+    print(ShaderManager.summary(ShaderManager.warm_up()))
     
     estado = Estado3D()
+    receiver = StateReceiver(estado)
+    shared = SharedEstado3D(shared_name) if shared_name else None
+    gpu_timer = GPUTimer()
+    profiler = FrameProfiler(gpu=gpu_timer)
+    overlay = ProfilerOverlay()
+    show_overlay = SHOW_PROFILER_OVERLAY
+    antialiasing = 0  # Index into ANTIALIASING_MODES
     running = True
     
     # Track current window size
@@ -303,8 +338,7 @@ def run_3d_window(cmd_queue, state_queue=None):
         glDisable(GL_LIGHTING)
         
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        glOrtho(0, width, 0, height, -1, 1)  
+        glLoadMatrixf(Transform_3D.to_gl(Transform_3D.ortho(0, width, 0, height, -1, 1)))
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
         
@@ -334,13 +368,40 @@ def run_3d_window(cmd_queue, state_queue=None):
         glVertex2f(0, height)
         glEnd()
     
+    # Dirty flags: FBO out of date (scene changed) / window out of date
+    needs_render = True
+    needs_present = True
+    
     while running:
+        profiler.begin_frame()
         for event in pygame.event.get():
             if event.type == QUIT:
                 running = False
             elif event.type == KEYDOWN:
                 if event.key == K_ESCAPE:
                     running = False
+                elif event.key == K_p:
+                    show_overlay = not show_overlay
+                    needs_present = True
+                elif event.key == K_t:
+                    print(f"Frame trace written to {profiler.dump_chrome_trace(TRACE_FILE)}")
+                elif event.key == K_a:
+                    # Index of the requested mode (the driver may round the samples)
+                    antialiasing = (antialiasing + 1) % len(ANTIALIASING_MODES)
+                    samples, supersample = ANTIALIASING_MODES[antialiasing]
+                    width, height = fbo.width, fbo.height
+                    fbo.delete()
+                    fbo = FBO(width, height, samples=samples, supersample=supersample)
+                    print(f"Anti-aliasing: {fbo.get_mode()}")
+                    needs_render = True
+                elif event.key == K_m:
+                    sizes = SHADOW_MAP_SIZES
+                    size = sizes[(sizes.index(ShadowMap.SHADOW_MAP_SIZE) + 1) % len(sizes)] if ShadowMap.SHADOW_MAP_SIZE in sizes else sizes[0]
+                    ShadowMap.set_resolution(size)
+                    print(f"Shadow map: {size}x{size}")
+                    needs_render = True
+            elif event.type in (VIDEOEXPOSE, WINDOWEXPOSED):
+                needs_present = True
             elif event.type == VIDEORESIZE:
                 # Handle window resize
                 current_width = event.w
@@ -348,73 +409,93 @@ def run_3d_window(cmd_queue, state_queue=None):
                 screen_3d = pygame.display.set_mode((current_width, current_height), pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE)
                 # Reinitialize OpenGL state after resize
                 init_opengl()
+                needs_present = True
                 # Send window size update to GUI
                 if state_queue:
                     state_queue.put({'type': 'window_size', 'width': current_width, 'height': current_height})
         
-        # Check for commands from queue
+        # Check for commands from queue. While idle, block on it (with a timeout
+        # so window events are still polled) instead of spinning
+        block = ON_DEMAND_RENDERING and not (needs_render or needs_present)
+        if shared:
+            # Shared memory: the GUI sets wakeup after each write, so wait on
+            # that and only drain the queue (quit / rerender) without blocking
+            if block:
+                wakeup.wait(IDLE_POLL_INTERVAL)
+                block = False
+                profiler.begin_frame()  # The idle wait is not part of the frame
+            profiler.begin('dequeue')
+            wakeup.clear()
+            if shared.read(estado):
+                profiler.add_input(shared.timestamp_ns)
+                needs_render = True
+        else:
+            profiler.begin('dequeue')
         try:
-            while True:  # Non-blocking poll
-                cmd = cmd_queue.get_nowait()
-                if cmd['type'] == 'light_pos':
-                    estado.light_pos = cmd['value']
-                elif cmd['type'] == 'material':
-                    estado.material = cmd['value']
-                elif cmd['type'] == 'shape':
-                    estado.shape = cmd['value']
-                elif cmd['type'] == 'camera':
-                    estado.camera_angle = cmd['value']
-                elif cmd['type'] == 'lighting':
-                    estado.lighting_model = cmd['value']
-                elif cmd['type'] == 'rotation':
-                    axis = cmd['axis']
-                    if axis == 'x':
-                        estado.rotation_x = cmd['value']
-                    elif axis == 'y':
-                        estado.rotation_y = cmd['value']
-                    elif axis == 'z':
-                        estado.rotation_z = cmd['value']
-                elif cmd['type'] == 'translation':
-                    axis = cmd['axis']
-                    if axis == 'x':
-                        estado.translation_x = cmd['value']
-                    elif axis == 'y':
-                        estado.translation_y = cmd['value']
-                    elif axis == 'z':
-                        estado.translation_z = cmd['value']
-                elif cmd['type'] == 'reset_transform':
-                    estado.rotation_x = 0.0
-                    estado.rotation_y = 0.0
-                    estado.rotation_z = 0.0
-                    estado.translation_x = 0.0
-                    estado.translation_y = 0.0
-                    estado.translation_z = 0.0
+            while True:
+                if block:
+                    cmd = cmd_queue.get(timeout=IDLE_POLL_INTERVAL)
+                    block = False
+                    profiler.begin_frame()
+                    profiler.begin('dequeue')
+                else:
+                    cmd = cmd_queue.get_nowait()
+                if cmd['type'] == 'state':
+                    # Coalesced GUI state delta (stale fields are dropped)
+                    if receiver.apply(cmd):
+                        profiler.add_input(cmd.get('t'))
+                        needs_render = True
                 elif cmd['type'] == 'rerender':
                     # Recreate FBO with new size if provided
                     new_width = cmd.get('width', current_width)
                     new_height = cmd.get('height', current_height)
                     print(f"Re-rendering FBO with size: {new_width}x{new_height}")
-                    fbo = FBO(new_width, new_height)
+                    samples, supersample = fbo.samples, fbo.supersample
+                    fbo.delete()
+                    fbo = FBO(new_width, new_height, samples=samples, supersample=supersample)
                     init_opengl()
+                    needs_render = True
                 elif cmd['type'] == 'quit':
                     running = False
                     break
         except mp.queues.Empty:
             pass
+        profiler.end('dequeue')
         
-        # Render 3D scene offscreen to FBO
-        render_3d_to_texture(estado, fbo)
+        # GPU stage timings are kept per lighting model and shape
+        if needs_render or needs_present or not ON_DEMAND_RENDERING:
+            gpu_timer.begin_frame((estado.lighting_model, estado.shape))
         
-        # Display the FBO texture to screen
-        display_fbo_texture(fbo, current_width, current_height)
+        # Render 3D scene offscreen to FBO (only when something changed)
+        if needs_render or not ON_DEMAND_RENDERING:
+            with profiler.stage('render'):
+                render_3d_to_texture(estado, fbo, gpu_timer)
+            needs_render = False
+            needs_present = True
         
-        pygame.display.flip()
-        clock.tick(FPS)
+        # Display the FBO texture to screen (idle frames present nothing)
+        if needs_present:
+            with profiler.stage('display'):
+                with gpu_timer.stage('blit'):
+                    display_fbo_texture(fbo, current_width, current_height)
+                if show_overlay:
+                    overlay.build(profiler)
+                    overlay.draw(current_width, current_height)
+            with profiler.stage('flip'):
+                pygame.display.flip()
+            gpu_timer.end_frame()
+            profiler.end_frame()  # Only presented frames are recorded
+            needs_present = False
+            clock.tick(FPS)
     
     # Cleanup
+    overlay.delete()
+    gpu_timer.delete()
+    if shared:
+        shared.close()
     pygame.quit()
 
-def run_gui_window(cmd_queue, state_queue=None):
+def run_gui_window(cmd_queue, state_queue=None, shared_name=None, wakeup=None):
     """Process for the GUI controls window."""
     pygame.init()
     # GUI window 
@@ -429,10 +510,15 @@ def run_gui_window(cmd_queue, state_queue=None):
     pygame.key.set_repeat(BUTTON_REPEAT_DELAY, BUTTON_REPEAT_INTERVAL)
     
     estado = Estado3D()  
+    sender = StateSender(cmd_queue, estado)
+    shared = SharedEstado3D(shared_name) if shared_name else None
     current_width = LARGURA_3D  
     current_height = ALTURA_3D
     running = True
     
+    # Time of the first input not yet sent to the 3D process (latency tracking)
+    input_ns = None
+    
     # Track mouse (for click and hold functionality!)
     mouse_held_button = None
     mouse_hold_timer = 0
@@ -440,6 +526,8 @@ def run_gui_window(cmd_queue, state_queue=None):
     
     while running:
         for event in pygame.event.get():
+            if event.type in (KEYDOWN, MOUSEBUTTONDOWN) and input_ns is None:
+                input_ns = time.monotonic_ns()
             if event.type == QUIT:
                 running = False
                 cmd_queue.put({'type': 'quit'})
@@ -449,16 +537,12 @@ def run_gui_window(cmd_queue, state_queue=None):
                     cmd_queue.put({'type': 'quit'})
                 elif event.key == K_UP:
                     estado.light_pos[1] -= LIGHT_STEP  
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif event.key == K_DOWN:
                     estado.light_pos[1] += LIGHT_STEP  
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif event.key == K_LEFT:
                     estado.light_pos[0] -= LIGHT_STEP
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif event.key == K_RIGHT:
                     estado.light_pos[0] += LIGHT_STEP
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
             elif event.type == MOUSEBUTTONDOWN:
                 if event.button == 1:  
                     for botao in BOTOES_3D:
@@ -472,64 +556,44 @@ def run_gui_window(cmd_queue, state_queue=None):
                             
                             if acao in ["sphere", "cube", "torus", "pyramid"]:
                                 estado.shape = acao
-                                cmd_queue.put({'type': 'shape', 'value': acao})
                             elif acao in ["front", "top", "side", "diagonal"]:
                                 estado.camera_angle = acao
-                                cmd_queue.put({'type': 'camera', 'value': acao})
                             elif acao in ["flat", "gouraud", "phong"]:
                                 estado.lighting_model = acao
-                                cmd_queue.put({'type': 'lighting', 'value': acao})
                             elif acao in MATERIAL_COLORS:
                                 estado.material = acao
-                                cmd_queue.put({'type': 'material', 'value': acao})
                             elif acao == "light_up":
                                 estado.light_pos[1] -= LIGHT_STEP  
-                                cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                             elif acao == "light_down":
                                 estado.light_pos[1] += LIGHT_STEP  
-                                cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                             elif acao == "light_left":
                                 estado.light_pos[0] -= LIGHT_STEP
-                                cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                             elif acao == "light_right":
                                 estado.light_pos[0] += LIGHT_STEP
-                                cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                             elif acao == "rot_x_inc":
                                 estado.rotation_x += ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'x', 'value': estado.rotation_x})
                             elif acao == "rot_x_dec":
                                 estado.rotation_x -= ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'x', 'value': estado.rotation_x})
                             elif acao == "rot_y_inc":
                                 estado.rotation_y += ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'y', 'value': estado.rotation_y})
                             elif acao == "rot_y_dec":
                                 estado.rotation_y -= ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'y', 'value': estado.rotation_y})
                             elif acao == "rot_z_inc":
                                 estado.rotation_z += ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'z', 'value': estado.rotation_z})
                             elif acao == "rot_z_dec":
                                 estado.rotation_z -= ROTATION_STEP
-                                cmd_queue.put({'type': 'rotation', 'axis': 'z', 'value': estado.rotation_z})
                             elif acao == "trans_x_inc":
                                 estado.translation_x += TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'x', 'value': estado.translation_x})
                             elif acao == "trans_x_dec":
                                 estado.translation_x -= TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'x', 'value': estado.translation_x})
                             elif acao == "trans_y_inc":
                                 estado.translation_y += TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'y', 'value': estado.translation_y})
                             elif acao == "trans_y_dec":
                                 estado.translation_y -= TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'y', 'value': estado.translation_y})
                             elif acao == "trans_z_inc":
                                 estado.translation_z += TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'z', 'value': estado.translation_z})
                             elif acao == "trans_z_dec":
                                 estado.translation_z -= TRANSLATION_STEP
-                                cmd_queue.put({'type': 'translation', 'axis': 'z', 'value': estado.translation_z})
                             elif acao == "reset_transform":
                                 estado.rotation_x = 0.0
                                 estado.rotation_y = 0.0
@@ -537,7 +601,6 @@ def run_gui_window(cmd_queue, state_queue=None):
                                 estado.translation_x = 0.0
                                 estado.translation_y = 0.0
                                 estado.translation_z = 0.0
-                                cmd_queue.put({'type': 'reset_transform'})
                             elif acao == "rerender":
                                 # Send re-render command with current window size
                                 cmd_queue.put({'type': 'rerender', 'width': current_width, 'height': current_height})
@@ -561,18 +624,25 @@ def run_gui_window(cmd_queue, state_queue=None):
             # Repeat action if holding
             if mouse_hold_started and (current_time - mouse_hold_timer) >= BUTTON_REPEAT_INTERVAL:
                 mouse_hold_timer = current_time
+                if input_ns is None:
+                    input_ns = time.monotonic_ns()
                 if mouse_held_button == "light_up":
                     estado.light_pos[1] -= LIGHT_STEP  
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif mouse_held_button == "light_down":
                     estado.light_pos[1] += LIGHT_STEP  
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif mouse_held_button == "light_left":
                     estado.light_pos[0] -= LIGHT_STEP
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
                 elif mouse_held_button == "light_right":
                     estado.light_pos[0] += LIGHT_STEP
-                    cmd_queue.put({'type': 'light_pos', 'value': list(estado.light_pos)})
+        
+        # One state update per GUI frame (nothing is sent if nothing changed)
+        if running:
+            if shared:
+                if shared.write(estado, input_ns):
+                    wakeup.set()
+            else:
+                sender.flush(input_ns)
+            input_ns = None
         
         # Check for window size updates from 3D process
         try:
@@ -604,6 +674,8 @@ def run_gui_window(cmd_queue, state_queue=None):
         clock.tick(FPS)
     
     # Cleanup
+    if shared:
+        shared.close()
     pygame.quit()
 
 def main():
@@ -611,9 +683,14 @@ def main():
     cmd_queue = mp.Queue()  
     state_queue = mp.Queue()  
     
+    # Shared Estado3D block (owned and unlinked by this process)
+    shared = SharedEstado3D(create=True) if STATE_TRANSPORT == 'shared_memory' else None
+    shared_name = shared.name if shared else None
+    wakeup = mp.Event()
+    
     # Spawn processes
-    p3d = mp.Process(target=run_3d_window, args=(cmd_queue, state_queue))
-    pgui = mp.Process(target=run_gui_window, args=(cmd_queue, state_queue))
+    p3d = mp.Process(target=run_3d_window, args=(cmd_queue, state_queue, shared_name, wakeup))
+    pgui = mp.Process(target=run_gui_window, args=(cmd_queue, state_queue, shared_name, wakeup))
     
     p3d.start()
     pgui.start()
@@ -621,6 +698,8 @@ def main():
     p3d.join()
     pgui.join()
     
+    if shared:
+        shared.close()
     sys.exit()
 
 if __name__ == "__main__":
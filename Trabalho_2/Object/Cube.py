@@ -2,47 +2,56 @@
 Cube shape module for 3D rendering
 """
 from OpenGL.GL import *
+import numpy as np
+from .Mesh import mesh_cache, weld_vertices, QUAD_TRIANGLES_FLAT, QUAD_TRIANGLES_SMOOTH
 
-def draw_cube(material_colors, material_name='orange'):
-    """Draw a cube with the specified material"""
+# Cube vertices
+CUBE_VERTICES = np.array([
+    [-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+    [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]
+], dtype=np.float32)
+
+# Faces, CCW seen from outside (each face has 4 vertices for the CUBE!!)
+CUBE_FACES = np.array([
+    [2, 1, 0, 3],  # Back
+    [4, 5, 6, 7],  # Front
+    [0, 1, 5, 4],  # Bottom
+    [2, 3, 7, 6],  # Top
+    [7, 3, 0, 4],  # Left
+    [1, 2, 6, 5]   # Right
+])
+
+# Face normals (For direction!!)
+CUBE_NORMALS = np.array([
+    [0, 0, -1], [0, 0, 1], [0, -1, 0], [0, 1, 0], [-1, 0, 0], [1, 0, 0]
+], dtype=np.float32)
+
+def generate_cube_mesh(smooth=False):
+    """
+    Builds the cube with 4 vertices per face so every face keeps its own normal.
+    smooth picks the quad split of GL_SMOOTH (Gouraud) instead of GL_FLAT.
+    Returns contiguous float32 (24,3) positions and normals and uint32 (12,3) indices.
+    """
+    positions = np.ascontiguousarray(CUBE_VERTICES[CUBE_FACES].reshape(-1, 3))
+    normals = np.ascontiguousarray(np.repeat(CUBE_NORMALS, 4, axis=0))
+    base = 4 * np.arange(len(CUBE_FACES), dtype=np.uint32)[:, None]
+    indices = (base + (QUAD_TRIANGLES_SMOOTH if smooth else QUAD_TRIANGLES_FLAT)).reshape(-1, 3)
+    return positions, normals, indices
+
+def get_cube_mesh(smooth=False):
+    """Resident GPU mesh of the cube (uploaded on first use)"""
+    smooth = bool(smooth)
+    return mesh_cache.get(('cube', smooth), lambda: weld_vertices(*generate_cube_mesh(smooth)))
+
+def draw_cube(material_colors, material_name='orange', smooth=True):
+    """Draw a cube with the specified material (smooth: triangulated for GL_SMOOTH)"""
     material = material_colors.get(material_name, material_colors['orange'])
     glMaterialfv(GL_FRONT, GL_AMBIENT, material['ambient'])
     glMaterialfv(GL_FRONT, GL_DIFFUSE, material['diffuse'])
     glMaterialfv(GL_FRONT, GL_SPECULAR, material['specular'])
     glMaterialf(GL_FRONT, GL_SHININESS, material['shininess'])
     
-    # Define cube vertices
-    vertices = [
-        [-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],  
-        [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]       
-    ]
-    
-    # Define faces (each face has 4 vertices for the CUBE!!)
-    faces = [
-        [0, 1, 2, 3],  # Back
-        [4, 5, 6, 7],  # Front
-        [0, 1, 5, 4],  # Bottom
-        [2, 3, 7, 6],  # Top
-        [0, 3, 7, 4],  # Left
-        [1, 2, 6, 5]   # Right
-    ]
-    
-    # Face normals (For direction!!)
-    normals = [
-        [0, 0, -1],   # Back
-        [0, 0, 1],    # Front
-        [0, -1, 0],   # Bottom
-        [0, 1, 0],    # Top
-        [-1, 0, 0],   # Left
-        [1, 0, 0]     # Right
-    ]
-    
-    glBegin(GL_QUADS)
-    for i, face in enumerate(faces):
-        glNormal3fv(normals[i])
-        for vertex_idx in face:
-            glVertex3fv(vertices[vertex_idx])
-    glEnd()
+    get_cube_mesh(smooth).draw()
 
 def get_name():
     return "Cube"
@@ -0,0 +1,284 @@
+"""
+GPU mesh storage for 3D rendering
+
+Geometry is uploaded once to VBOs/EBO/VAO and kept resident in a MeshCache,
+so a shape is only re-uploaded when its parameters change!!
+"""
+from OpenGL.GL import *
+import ctypes
+from collections import OrderedDict, deque
+import numpy as np
+
+# Attribute locations (match the layout() in the shaders)
+POSITION_LOCATION = 0
+NORMAL_LOCATION = 1
+INSTANCE_MODEL_LOCATION = 2      # mat4: locations 2..5, one column each
+INSTANCE_MATERIAL_LOCATION = 6
+
+# One instance in the instance VBO: column-major model matrix + material index
+INSTANCE_DTYPE = np.dtype([('model', np.float32, (16,)), ('material', np.int32)])
+
+# Post-transform vertex cache size we optimize the triangle order for
+VERTEX_CACHE_SIZE = 32
+
+# Two triangles per quad (corners 0..3), as offsets into its 4 vertices.
+# FLAT: both end on corner 3, the GL_FLAT provoking vertex of the old GL_QUADS.
+# SMOOTH: split on the 0-2 diagonal like GL_QUADS, so Gouraud colors
+# interpolate across the same triangles.
+QUAD_TRIANGLES_FLAT = np.array([0, 1, 3, 1, 2, 3], dtype=np.uint32)
+QUAD_TRIANGLES_SMOOTH = np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)
+
+def grid_quad_order(rows, cols, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Order for the quads of a rows x cols grid (row-major numbering) that walks
+    the grid in vertical bands narrow enough for two rows of band vertices to
+    stay in the vertex cache, so each vertex is transformed about once.
+    """
+    band = max(1, cache_size // 2 - 2)
+    quad = np.arange(rows * cols)
+    i, j = quad // cols, quad % cols
+    return np.lexsort((j, i, j // band))
+
+def weld_vertices(positions, normals, indices, decimals=6):
+    """
+    Merges vertices with the same position and normal (e.g. the sphere poles),
+    drops the triangles that become degenerate and renumbers the vertices in
+    first-use order. Returns the new (positions, normals, indices).
+    """
+    keys = np.round(np.hstack([positions, normals]), decimals) + 0.0  # + 0.0 folds -0.0 into 0.0
+    keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * 6))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    indices = first[inverse.ravel()][indices]
+
+    # Degenerate triangles (two corners welded together)
+    keep = (indices[:, 0] != indices[:, 1]) & (indices[:, 1] != indices[:, 2]) & (indices[:, 0] != indices[:, 2])
+    indices = indices[keep]
+
+    # Renumber vertices in the order the triangles first reference them
+    used, first_use = np.unique(indices.ravel(), return_index=True)
+    used = used[np.argsort(first_use)]
+    remap = np.empty(len(positions), dtype=np.uint32)
+    remap[used] = np.arange(len(used), dtype=np.uint32)
+    return (np.ascontiguousarray(positions[used]), np.ascontiguousarray(normals[used]),
+            np.ascontiguousarray(remap[indices]))
+
+def average_cache_miss_ratio(indices, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Simulates a FIFO post-transform cache and returns vertices transformed
+    per triangle (ACMR): 3.0 is no reuse, ~0.5 is ideal for regular grids.
+    """
+    cache = deque()
+    resident = set()
+    misses = 0
+    for v in np.asarray(indices).ravel().tolist():
+        if v not in resident:
+            misses += 1
+            if len(cache) == cache_size:
+                resident.discard(cache.popleft())
+            cache.append(v)
+            resident.add(v)
+    return misses / max(1, np.asarray(indices).size // 3)
+
+_fixed_function = None
+
+def fixed_function_available():
+    """
+    True in a compatibility context (fixed-function vertex arrays exist),
+    False in a core profile one. Queried once per process.
+    """
+    global _fixed_function
+    if _fixed_function is None:
+        try:
+            _fixed_function = not glGetIntegerv(GL_CONTEXT_PROFILE_MASK) & GL_CONTEXT_CORE_PROFILE_BIT
+        except GLError:  # Before OpenGL 3.2 there are no profiles
+            _fixed_function = True
+    return _fixed_function
+
+def release():
+    """Deletes every resident mesh and forgets the context profile (before the GL context goes away)"""
+    global _fixed_function
+    mesh_cache.clear()
+    _fixed_function = None
+
+def bounding_sphere(positions):
+    """
+    (center, radius) enclosing every vertex: center of the bounding box and
+    the farthest vertex from it (tight for the symmetric shapes we build)
+    """
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+    radius = float(np.sqrt(((positions - center) ** 2).sum(axis=1).max()))
+    return center, radius
+
+class GPUMesh:
+    """Position + normal buffers, the element buffer and the VAO that describes them"""
+    def __init__(self, positions, normals, indices):
+        positions = np.ascontiguousarray(positions, dtype=np.float32).reshape(-1, 3)
+        normals = np.ascontiguousarray(normals, dtype=np.float32).reshape(-1, 3)
+        # Smallest index type that can address every vertex
+        if len(positions) <= 0xFFFF:
+            indices = np.ascontiguousarray(indices, dtype=np.uint16).reshape(-1)
+            self.index_type = GL_UNSIGNED_SHORT
+        else:
+            indices = np.ascontiguousarray(indices, dtype=np.uint32).reshape(-1)
+            self.index_type = GL_UNSIGNED_INT
+        self.vertex_count = len(positions)
+        self.index_count = len(indices)
+        self.nbytes = positions.nbytes + normals.nbytes + indices.nbytes
+        self.center, self.radius = bounding_sphere(positions)  # Local bounding sphere (culling)
+
+        self.vao = glGenVertexArrays(1)
+        self.vbo_pos, self.vbo_norm, self.ebo = glGenBuffers(3)
+        glBindVertexArray(self.vao)
+
+        # Position attribute
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_pos)
+        glBufferData(GL_ARRAY_BUFFER, positions.nbytes, positions, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(POSITION_LOCATION)
+        glVertexAttribPointer(POSITION_LOCATION, 3, GL_FLOAT, GL_FALSE, 0, None)
+
+        # Normal attribute
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_norm)
+        glBufferData(GL_ARRAY_BUFFER, normals.nbytes, normals, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(NORMAL_LOCATION)
+        glVertexAttribPointer(NORMAL_LOCATION, 3, GL_FLOAT, GL_FALSE, 0, None)
+
+        # Same buffers as fixed-function arrays, for the fallback without shaders
+        # (those arrays do not exist in a core profile context)
+        if fixed_function_available():
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo_pos)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glVertexPointer(3, GL_FLOAT, 0, None)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo_norm)
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, 0, None)
+
+        # Element buffer (binding is recorded in the VAO)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        glBindVertexArray(self.vao)
+        glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, None)
+        glBindVertexArray(0)
+
+    def draw_instanced(self, instances, first, count):
+        """
+        Draws count copies of the mesh, one per INSTANCE_DTYPE record of the
+        InstanceBuffer starting at record first (one glDrawElementsInstanced).
+        """
+        stride = INSTANCE_DTYPE.itemsize
+        offset = first * stride
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, instances.vbo)
+        for column in range(4):
+            location = INSTANCE_MODEL_LOCATION + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset + column * 16))
+            glVertexAttribDivisor(location, 1)
+        glEnableVertexAttribArray(INSTANCE_MATERIAL_LOCATION)
+        glVertexAttribIPointer(INSTANCE_MATERIAL_LOCATION, 1, GL_INT, stride,
+                               ctypes.c_void_p(offset + INSTANCE_DTYPE.fields['material'][1]))
+        glVertexAttribDivisor(INSTANCE_MATERIAL_LOCATION, 1)
+
+        glDrawElementsInstanced(GL_TRIANGLES, self.index_count, self.index_type, None, count)
+
+        # Leave the VAO as the single-object paths expect it (some drivers alias
+        # generic attributes with the fixed-function ones)
+        for location in range(INSTANCE_MODEL_LOCATION, INSTANCE_MATERIAL_LOCATION + 1):
+            glDisableVertexAttribArray(location)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(3, [self.vbo_pos, self.vbo_norm, self.ebo])
+        self.vao = self.vbo_pos = self.vbo_norm = self.ebo = 0
+
+class InstanceBuffer:
+    """
+    VBO of INSTANCE_DTYPE records. upload() only touches the GPU when the
+    data version changed and reallocates (orphans) only when it grows.
+    """
+    def __init__(self):
+        self.vbo = int(np.atleast_1d(glGenBuffers(1))[0])
+        self.capacity = 0   # Bytes allocated
+        self.version = None
+        self.uploads = 0
+
+    def upload(self, records, version=None):
+        if version is not None and version == self.version:
+            return
+        records = np.ascontiguousarray(records, dtype=INSTANCE_DTYPE)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if records.nbytes > self.capacity:
+            self.capacity = max(records.nbytes, 2 * self.capacity)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity, None, GL_DYNAMIC_DRAW)
+        if records.nbytes:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, records.nbytes, records)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.version = version
+        self.uploads += 1
+
+    def delete(self):
+        glDeleteBuffers(1, [self.vbo])
+        self.vbo = 0
+        self.capacity = 0
+        self.version = None
+
+class MeshCache:
+    """
+    Registry of resident meshes keyed by (shape name, tessellation params).
+
+    Least recently used meshes are evicted once the cache holds more than
+    max_entries meshes or more than max_bytes of vertex data.
+    """
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.meshes = OrderedDict()
+        self.uploads = 0
+        self.evictions = 0
+
+    def get(self, key, builder):
+        """
+        Return the mesh for key, calling builder() -> (positions, normals, indices)
+        and uploading the result only when the key is not resident yet.
+        """
+        mesh = self.meshes.get(key)
+        if mesh is not None:
+            self.meshes.move_to_end(key)
+            return mesh
+
+        positions, normals, indices = builder()
+        mesh = GPUMesh(positions, normals, indices)
+        self.meshes[key] = mesh
+        self.total_bytes += mesh.nbytes
+        self.uploads += 1
+        self._evict(keep=key)
+        return mesh
+
+    def _evict(self, keep):
+        while len(self.meshes) > 1 and (len(self.meshes) > self.max_entries or self.total_bytes > self.max_bytes):
+            key, mesh = next(iter(self.meshes.items()))
+            if key == keep:
+                break
+            del self.meshes[key]
+            self.total_bytes -= mesh.nbytes
+            mesh.delete()
+            self.evictions += 1
+
+    def clear(self):
+        """Free every resident mesh (e.g. before the GL context goes away)"""
+        for mesh in self.meshes.values():
+            mesh.delete()
+        self.meshes.clear()
+        self.total_bytes = 0
+
+# Shared by every shape module and lighting model
+mesh_cache = MeshCache()
@@ -4,59 +4,56 @@ Pyramid shape module for 3D rendering
 A pyramid has 5 faces: 1 square base and 4 triangular sides
 """
 from OpenGL.GL import *
-
-def draw_pyramid(material_colors, material_name='orange'):
-    """Draw a pyramid with the specified material"""
+import numpy as np
+from .Mesh import mesh_cache, weld_vertices, QUAD_TRIANGLES_FLAT, QUAD_TRIANGLES_SMOOTH
+
+# Pyramid vertices
+PYRAMID_APEX = [0, -1.5, 0]  # Pointing downward is inverted!! y axis is oposite for rendererd in CG!!
+PYRAMID_BASE = [
+    [-1, 1, 1],   # Front left (top)
+    [1, 1, 1],    # Front right
+    [1, 1, -1],   # Back right
+    [-1, 1, -1]   # Back left
+]
+
+def generate_pyramid_mesh(smooth=False):
+    """
+    Builds the pyramid (base quad + 4 sides) with one normal per face.
+    smooth picks the base quad split of GL_SMOOTH (Gouraud) instead of GL_FLAT.
+    Returns contiguous float32 (16,3) positions and normals and uint32 (6,3) indices.
+    """
+    apex, base = PYRAMID_APEX, PYRAMID_BASE
+    positions = np.array([
+        base[0], base[1], base[2], base[3],  # Base
+        apex, base[1], base[0],              # Front
+        apex, base[2], base[1],              # Right
+        apex, base[3], base[2],              # Back
+        apex, base[0], base[3],              # Left
+    ], dtype=np.float32)
+    face_normals = np.array([
+        [0, 1, 0], [0, -0.5, 1], [1, -0.5, 0], [0, -0.5, -1], [-1, -0.5, 0]
+    ], dtype=np.float32)
+    normals = np.ascontiguousarray(np.repeat(face_normals, [4, 3, 3, 3, 3], axis=0))
+    indices = np.concatenate([
+        QUAD_TRIANGLES_SMOOTH if smooth else QUAD_TRIANGLES_FLAT,  # Base
+        np.arange(4, 16, dtype=np.uint32),                         # Sides
+    ]).reshape(-1, 3)
+    return positions, normals, indices
+
+def get_pyramid_mesh(smooth=False):
+    """Resident GPU mesh of the pyramid (uploaded on first use)"""
+    smooth = bool(smooth)
+    return mesh_cache.get(('pyramid', smooth), lambda: weld_vertices(*generate_pyramid_mesh(smooth)))
+
+def draw_pyramid(material_colors, material_name='orange', smooth=True):
+    """Draw a pyramid with the specified material (smooth: triangulated for GL_SMOOTH)"""
     material = material_colors.get(material_name, material_colors['orange'])
     glMaterialfv(GL_FRONT, GL_AMBIENT, material['ambient'])
     glMaterialfv(GL_FRONT, GL_DIFFUSE, material['diffuse'])
     glMaterialfv(GL_FRONT, GL_SPECULAR, material['specular'])
     glMaterialf(GL_FRONT, GL_SHININESS, material['shininess'])
 
-    # Pyramid vertices
-    apex = [0, -1.5, 0]  # Pointing downward is inverted!! y axis is oposite for rendererd in CG!!
-    base = [
-        [-1, 1, 1],   # Front left (top)
-        [1, 1, 1],    # Front right
-        [1, 1, -1],   # Back right
-        [-1, 1, -1]   # Back left
-    ]
-
-    # Draw base (square)
-    glBegin(GL_QUADS)
-    glNormal3f(0, 1, 0)  
-    for vertex in base:
-        glVertex3fv(vertex)
-    glEnd()
-
-    # Draw triangular faces
-    glBegin(GL_TRIANGLES)
-
-    # Front face
-    glNormal3f(0, -0.5, 1)
-    glVertex3fv(apex)
-    glVertex3fv(base[1])
-    glVertex3fv(base[0])
-
-    # Right face
-    glNormal3f(1, -0.5, 0)
-    glVertex3fv(apex)
-    glVertex3fv(base[2])
-    glVertex3fv(base[1])
-
-    # Back face
-    glNormal3f(0, -0.5, -1)
-    glVertex3fv(apex)
-    glVertex3fv(base[3])
-    glVertex3fv(base[2])
-
-    # Left face
-    glNormal3f(-1, -0.5, 0)
-    glVertex3fv(apex)
-    glVertex3fv(base[0])
-    glVertex3fv(base[3])
-
-    glEnd()
+    get_pyramid_mesh(smooth).draw()
 
 def get_name():
     return "Pyramid"
@@ -1,24 +1,77 @@
 """
 Sphere shape module for 3D rendering
 
-Use internal OpenGL Functoion!! diferent from vertice like code for polygons!!
+Same layout as the internal OpenGL (GLU) sphere, but tessellated once with
+NumPy and replayed from the GPU mesh cache instead of every frame!!
 """
 from OpenGL.GL import *
-from OpenGL.GLU import *
+import numpy as np
+from .Mesh import grid_quad_order, mesh_cache, weld_vertices
 
-def draw_sphere(material_colors, material_name='orange'):
-    quadric = gluNewQuadric()
-    gluQuadricNormals(quadric, GLU_SMOOTH)
-    
+# Level of detail table: name -> (slices, stacks)
+SPHERE_LOD = {
+    'tiny': (8, 8),
+    'low': (16, 16),
+    'medium': (32, 32),
+    'high': (128, 128),
+    'ultra': (512, 512),
+}
+sphere_lod = 'medium'  # Defaut LOD (same as the old gluSphere(quadric, 1, 32, 32))
+
+def generate_sphere_mesh(slices=32, stacks=32, radius=1.0):
+    """
+    Builds a sphere (poles on the z axis) with NumPy meshgrids, using the
+    gluSphere vertex layout so GL_FLAT picks the same provoking vertices.
+    Returns contiguous float32 (N,3) positions and normals and a uint32
+    (M,3) triangle index array. The longitude seam is shared, not duplicated,
+    and the triangles are ordered for the post-transform vertex cache.
+    """
+    # Trig only on the 1D angle axes, the grid is filled by broadcasting
+    polar = np.pi * np.arange(stacks + 1) / stacks  # 0 = +z pole, pi = -z pole
+    azimuth = 2.0 * np.pi * np.arange(slices) / slices
+    sin_polar, cos_polar = np.sin(polar)[:, None], np.cos(polar)[:, None]
+
+    normals = np.empty((stacks + 1, slices, 3), dtype=np.float32)
+    normals[..., 0] = np.sin(azimuth) * sin_polar
+    normals[..., 1] = np.cos(azimuth) * sin_polar
+    normals[..., 2] = cos_polar
+    normals = normals.reshape(-1, 3)
+    positions = np.ascontiguousarray(normals * np.float32(radius))
+
+    # Quad corners (j = stack, i = slice, wrapping around the seam), CCW seen from outside.
+    # Like the gluSphere quad strips, both triangles end on D (the GL_FLAT provoking vertex)
+    j, i = np.meshgrid(np.arange(stacks), np.arange(slices), indexing='ij')
+    b = j * slices + i                  # (i, j)
+    d = j * slices + (i + 1) % slices   # (i+1, j)
+    a = b + slices                      # (i, j+1)
+    c = d + slices                      # (i+1, j+1)
+    indices = np.stack([a, b, d, c, a, d], axis=-1)
+    # Top cap is a triangle fan in gluSphere: provoking vertex is A, not the pole
+    indices[0, :, 3:] = np.stack([d[0], c[0], a[0]], axis=-1)
+    indices = indices.reshape(-1, 2, 3)[grid_quad_order(stacks, slices)].reshape(-1, 3)  # Vertex cache friendly order
+    return positions, normals, np.ascontiguousarray(indices, dtype=np.uint32)
+
+def get_sphere_mesh(slices=32, stacks=32, radius=1.0):
+    """Resident GPU mesh of the sphere for this tessellation (uploaded on first use)"""
+    return mesh_cache.get(('sphere', slices, stacks, radius),
+                          lambda: weld_vertices(*generate_sphere_mesh(slices, stacks, radius)))
+
+def set_lod(name):
+    """Select the defaut level of detail (a key of SPHERE_LOD)"""
+    global sphere_lod
+    if name not in SPHERE_LOD:
+        raise ValueError(f"Unknown sphere LOD '{name}', expected one of {list(SPHERE_LOD)}")
+    sphere_lod = name
+
+def draw_sphere(material_colors, material_name='orange', lod=None, radius=1.0):
     material = material_colors.get(material_name, material_colors['orange'])
     glMaterialfv(GL_FRONT, GL_AMBIENT, material['ambient'])
     glMaterialfv(GL_FRONT, GL_DIFFUSE, material['diffuse'])
     glMaterialfv(GL_FRONT, GL_SPECULAR, material['specular'])
     glMaterialf(GL_FRONT, GL_SHININESS, material['shininess'])
-    
-    gluSphere(quadric, 1, 32, 32)
-    gluDeleteQuadric(quadric)
+
+    slices, stacks = SPHERE_LOD[lod or sphere_lod]
+    get_sphere_mesh(slices, stacks, radius).draw()
 
 def get_name():
     return "Sphere"
-
@@ -2,8 +2,57 @@
 Torus (donut) shape!!
 """
 from OpenGL.GL import *
-from OpenGL.GLUT import *
-import math
+import numpy as np
+from .Mesh import grid_quad_order, mesh_cache, weld_vertices
+
+# Level of detail table: name -> (rings, sides)
+TORUS_LOD = {
+    'tiny': (6, 12),
+    'low': (12, 24),
+    'medium': (24, 48),
+    'high': (48, 96),
+}
+
+def generate_torus_mesh(rings=24, sides=48, inner_radius=0.4, outer_radius=1.0, ring_offset=0.0):
+    """
+    Builds a torus around the z axis with NumPy meshgrids.
+    Returns contiguous float32 (N,3) positions and normals and a uint32
+    (M,3) triangle index array. Both seams wrap onto shared vertices and
+    the triangles are ordered for the post-transform vertex cache.
+    ring_offset shifts the rings around the z axis (in rings).
+    """
+    # Trig only on the 1D angle axes, the grid is filled by broadcasting
+    theta = 2.0 * np.pi * (np.arange(rings) + ring_offset) / rings
+    phi = 2.0 * np.pi * np.arange(sides) / sides
+    cos_theta, sin_theta = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    cos_phi, sin_phi = np.cos(phi), np.sin(phi)
+    radius = outer_radius + inner_radius * cos_phi
+
+    normals = np.empty((rings, sides, 3), dtype=np.float32)
+    normals[..., 0] = cos_phi * cos_theta
+    normals[..., 1] = cos_phi * sin_theta
+    normals[..., 2] = sin_phi
+
+    positions = np.empty((rings, sides, 3), dtype=np.float32)
+    positions[..., 0] = radius * cos_theta
+    positions[..., 1] = radius * sin_theta
+    positions[..., 2] = inner_radius * sin_phi
+
+    # Quad corners (i = ring, j = side), CCW seen from outside.
+    # Both triangles end on v2, the GL_FLAT provoking vertex of the old quad strip
+    i, j = np.meshgrid(np.arange(rings), np.arange(sides), indexing='ij')
+    v0 = i * sides + j
+    v1 = i * sides + (j + 1) % sides
+    v2 = ((i + 1) % rings) * sides + (j + 1) % sides
+    v3 = ((i + 1) % rings) * sides + j
+    indices = np.stack([v1, v0, v2, v0, v3, v2], axis=-1).reshape(-1, 2, 3)
+    indices = indices[grid_quad_order(rings, sides)].reshape(-1, 3)  # Vertex cache friendly order
+    return positions.reshape(-1, 3), normals.reshape(-1, 3), np.ascontiguousarray(indices, dtype=np.uint32)
+
+def get_torus_mesh(rings=24, sides=48, ring_offset=0.0):
+    """Resident GPU mesh of the torus for this tessellation (uploaded on first use)"""
+    return mesh_cache.get(('torus', rings, sides, ring_offset),
+                          lambda: weld_vertices(*generate_torus_mesh(rings, sides, ring_offset=ring_offset)))
 
 def draw_torus(material_colors, material_name='orange'):
     """Draw a torus with the specified material"""
@@ -14,36 +63,10 @@ def draw_torus(material_colors, material_name='orange'):
     glMaterialf(GL_FRONT, GL_SHININESS, material['shininess'])
     
     # Parameters
-    inner_radius = 0.4
-    outer_radius = 1.0
     sides = 32
     rings = 32
-    
-    # Draw torus!!
-    for i in range(rings):
-        glBegin(GL_QUAD_STRIP)
-        for j in range(sides + 1):
-            for k in range(2):
-                s = (i + k) % rings + 0.5
-                t = j % sides
-                
-                # Calculate angles
-                theta = s * 2.0 * math.pi / rings
-                phi = t * 2.0 * math.pi / sides
-                
-                # Calculate vertex position
-                x = (outer_radius + inner_radius * math.cos(phi)) * math.cos(theta)
-                y = (outer_radius + inner_radius * math.cos(phi)) * math.sin(theta)
-                z = inner_radius * math.sin(phi)
-                
-                # Calculate normal
-                nx = math.cos(phi) * math.cos(theta)
-                ny = math.cos(phi) * math.sin(theta)
-                nz = math.sin(phi)
-                
-                glNormal3f(nx, ny, nz)
-                glVertex3f(x, y, z)
-        glEnd()
+
+    get_torus_mesh(rings, sides, ring_offset=0.5).draw()
 
 def get_name():
     return "Torus"
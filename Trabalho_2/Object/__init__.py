@@ -6,5 +6,6 @@ from . import Sphere
 from . import Cube
 from . import Torus
 from . import Pyramid
+from . import Mesh
 
-__all__ = ['Sphere', 'Cube', 'Torus', 'Pyramid']
+__all__ = ['Sphere', 'Cube', 'Torus', 'Pyramid', 'Mesh']
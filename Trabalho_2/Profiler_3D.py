@@ -0,0 +1,343 @@
+"""
+Frame timeline and input-to-frame latency profiler
+
+The 3D process records, for every presented frame, when each stage ran
+(command dequeue, render_3d_to_texture, display_fbo_texture, display.flip)
+and how long the oldest input applied in that frame took to reach the
+screen. Everything lives in a fixed size ring buffer that can be dumped as
+Chrome trace JSON (chrome://tracing or https://ui.perfetto.dev)!!
+
+Timestamps are time.monotonic_ns(), which is the same clock in every process
+of the machine, so the GUI's input timestamps can be compared directly.
+"""
+import os
+import json
+import time
+import ctypes
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+PROFILE_CAPACITY = 2048  # Frames kept in the ring buffer
+STAGES = ['dequeue', 'render', 'display', 'flip']
+GPU_STAGES = ['shadow', 'clear', 'geometry', 'resolve', 'blit']
+PERCENTILES = (50, 95, 99)
+
+def percentiles(values):
+    """p50/p95/p99 of a sequence (zeros if empty)"""
+    if len(values) == 0:
+        return {f'p{p}': 0.0 for p in PERCENTILES}
+    return {f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+class FrameProfiler:
+    """
+    Ring buffer of per-frame stage timings and input latencies.
+
+    begin_frame() / end_frame() delimit a frame, begin(stage) / end(stage)
+    (or the stage() context manager) time a stage inside it and
+    add_input(timestamp_ns) attaches an input event to the current frame.
+    GPU stage times come from an optional GPUTimer (profiler.gpu).
+    """
+    def __init__(self, capacity=PROFILE_CAPACITY, stages=STAGES, gpu=None):
+        self.capacity = capacity
+        self.gpu = gpu
+        self.stages = list(stages)
+        self.stage_index = {name: i for i, name in enumerate(self.stages)}
+        self.starts = np.zeros((capacity, len(self.stages)), dtype=np.int64)  # 0 = stage did not run
+        self.ends = np.zeros((capacity, len(self.stages)), dtype=np.int64)
+        self.frame_starts = np.zeros(capacity, dtype=np.int64)
+        self.frame_ends = np.zeros(capacity, dtype=np.int64)
+        self.inputs = np.zeros(capacity, dtype=np.int64)  # 0 = no input in that frame
+        self.count = 0             # Frames recorded since creation
+        self.pending_input = 0     # Oldest input not yet shown on screen
+
+    @property
+    def slot(self):
+        return self.count % self.capacity
+
+    def begin_frame(self):
+        """Starts (or restarts, e.g. after an idle wait) the current frame"""
+        slot = self.slot
+        self.starts[slot] = 0
+        self.ends[slot] = 0
+        self.frame_starts[slot] = time.monotonic_ns()
+
+    def begin(self, stage):
+        self.starts[self.slot, self.stage_index[stage]] = time.monotonic_ns()
+
+    def end(self, stage):
+        self.ends[self.slot, self.stage_index[stage]] = time.monotonic_ns()
+
+    @contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def add_input(self, timestamp_ns):
+        """Input event (GUI timestamp) whose effect will be shown by the next frame"""
+        if timestamp_ns and (not self.pending_input or timestamp_ns < self.pending_input):
+            self.pending_input = timestamp_ns
+
+    def end_frame(self):
+        """Commits the current frame to the ring buffer (call after the flip)"""
+        slot = self.slot
+        self.frame_ends[slot] = time.monotonic_ns()
+        self.inputs[slot] = self.pending_input
+        self.pending_input = 0
+        self.count += 1
+
+    def _order(self):
+        """Slots of the recorded frames, oldest first"""
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        return (np.arange(self.capacity) + self.slot) % self.capacity
+
+    def frame_times_ms(self):
+        order = self._order()
+        return (self.frame_ends[order] - self.frame_starts[order]) / 1e6
+
+    def latencies_ms(self):
+        """Input-to-frame latency of the frames that showed an input"""
+        order = self._order()
+        inputs = self.inputs[order]
+        has_input = inputs > 0
+        return (self.frame_ends[order][has_input] - inputs[has_input]) / 1e6
+
+    def stage_times_ms(self, stage):
+        order = self._order()
+        index = self.stage_index[stage]
+        ran = self.starts[order, index] > 0
+        return (self.ends[order, index] - self.starts[order, index])[ran] / 1e6
+
+    def summary(self):
+        """
+        p50/p95/p99 (ms) of frame time, input latency and every stage, plus the
+        GPU stages per 'lighting/shape' under 'gpu_ms' (if there is a GPUTimer)
+        """
+        result = {
+            'frames': min(self.count, self.capacity),
+            'frame_ms': percentiles(self.frame_times_ms()),
+            'latency_ms': percentiles(self.latencies_ms()),
+        }
+        for stage in self.stages:
+            result[stage + '_ms'] = percentiles(self.stage_times_ms(stage))
+        if self.gpu:
+            result['gpu_ms'] = self.gpu.summary()
+        return result
+
+    def chrome_trace(self, pid=None):
+        """Recorded frames as a Chrome trace event list ("X" events, microseconds)"""
+        pid = pid or os.getpid()
+        events = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': '3D renderer'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 1, 'args': {'name': 'frames'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 2, 'args': {'name': 'input latency'}},
+        ]
+        for number, slot in enumerate(self._order(), self.count - min(self.count, self.capacity)):
+            start, end = self.frame_starts[slot], self.frame_ends[slot]
+            events.append({'name': 'frame', 'ph': 'X', 'pid': pid, 'tid': 1,
+                           'ts': start / 1e3, 'dur': (end - start) / 1e3, 'args': {'frame': int(number)}})
+            for index, stage in enumerate(self.stages):
+                stage_start, stage_end = self.starts[slot, index], self.ends[slot, index]
+                if stage_start:
+                    events.append({'name': stage, 'ph': 'X', 'pid': pid, 'tid': 1,
+                                   'ts': stage_start / 1e3, 'dur': (stage_end - stage_start) / 1e3})
+            if self.inputs[slot]:
+                events.append({'name': 'input -> frame', 'ph': 'X', 'pid': pid, 'tid': 2,
+                               'ts': self.inputs[slot] / 1e3, 'dur': (end - self.inputs[slot]) / 1e3,
+                               'args': {'frame': int(number)}})
+        return events
+
+    def dump_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.chrome_trace(), 'displayTimeUnit': 'ms'}, f)
+        return path
+
+class GPUTimer:
+    """
+    GL_TIME_ELAPSED queries around the GPU stages of a frame (shadow map,
+    clear, geometry draw, MSAA / supersampling resolve, FBO-to-screen blit).
+
+    Each frame uses its own set of query objects out of a ring of `latency`
+    sets and results are read back `latency` frames later, only if the GPU
+    already has them: reading never stalls, a late result is dropped instead.
+    Times (ms) are kept per frame key, e.g. ('phong', 'sphere').
+    """
+    def __init__(self, stages=GPU_STAGES, latency=3, history=240):
+        self.stages = list(stages)
+        self.stage_index = {name: i for i, name in enumerate(self.stages)}
+        self.latency = latency
+        self.history = history
+        self.queries = np.asarray(glGenQueries(latency * len(self.stages))).reshape(latency, len(self.stages))
+        self.pending = [None] * latency  # slot -> (key, stages issued) waiting for results
+        self.times = {}                  # key -> {stage: deque of ms}
+        self.frame = 0
+        self.key = None
+        self.dropped = 0
+        self.warmup = 1  # Some drivers (llvmpipe) report garbage for the very first query
+
+    def __bool__(self):
+        return True
+
+    @property
+    def slot(self):
+        return self.frame % self.latency
+
+    def begin_frame(self, key):
+        slot = self.slot
+        if self.pending[slot] and not self._collect(slot):
+            self.dropped += 1  # Still not available after `latency` frames
+        self.pending[slot] = (key, [])
+        self.key = key
+
+    def begin(self, stage):
+        index = self.stage_index[stage]
+        glBeginQuery(GL_TIME_ELAPSED, int(self.queries[self.slot, index]))
+        self.pending[self.slot][1].append(index)
+
+    def end(self, stage):
+        glEndQuery(GL_TIME_ELAPSED)
+
+    @contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def end_frame(self):
+        self.frame += 1
+        # Opportunistically pick up older frames that already finished
+        for slot in range(self.latency):
+            if slot != self.slot and self.pending[slot]:
+                self._collect(slot)
+
+    def _collect(self, slot):
+        """Reads a frame's queries if all are available, returns False otherwise"""
+        key, issued = self.pending[slot]
+        for index in issued:
+            if not glGetQueryObjectiv(int(self.queries[slot, index]), GL_QUERY_RESULT_AVAILABLE):
+                return False
+        self.pending[slot] = None
+        if self.warmup:
+            self.warmup -= 1
+            return True
+        times = self.times.setdefault(key, {stage: deque(maxlen=self.history) for stage in self.stages})
+        elapsed = ctypes.c_uint64()
+        for index in issued:
+            glGetQueryObjectui64v(int(self.queries[slot, index]), GL_QUERY_RESULT, ctypes.byref(elapsed))
+            times[self.stages[index]].append(elapsed.value / 1e6)
+        return True
+
+    def summary(self):
+        """{'lighting/shape': {stage: p50/p95/p99 ms}}"""
+        return {'/'.join(key) if isinstance(key, tuple) else str(key):
+                    {stage: percentiles(values) for stage, values in stages.items() if values}
+                for key, stages in self.times.items()}
+
+    def delete(self):
+        glDeleteQueries(self.queries.size, self.queries.reshape(-1))
+        self.pending = [None] * self.latency
+
+class ProfilerOverlay:
+    """
+    Stats panel drawn over the 3D window: p50/p95/p99 of latency and frame
+    time plus their histograms. The panel is drawn with pygame into a texture,
+    rebuilt at most every refresh_ms.
+    """
+    WIDTH = 260
+    HEIGHT = 244
+    BINS = 24
+
+    def __init__(self, refresh_ms=250):
+        self.refresh_ms = refresh_ms
+        self.last_build = 0
+        self.built_count = -1
+        self.font = pygame.font.SysFont("monospace", 11)
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.WIDTH, self.HEIGHT, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def _histogram(self, surface, values, rect, color):
+        pygame.draw.rect(surface, (40, 40, 55, 200), rect)
+        if len(values) == 0:
+            return
+        top = max(float(np.percentile(values, 99)) * 1.2, 1e-3)
+        counts, _ = np.histogram(np.clip(values, 0, top), bins=self.BINS, range=(0, top))
+        bar_w = rect.width / self.BINS
+        for i, count in enumerate(counts):
+            h = int(rect.height * count / counts.max())
+            if h:
+                pygame.draw.rect(surface, color, (rect.x + int(i * bar_w), rect.bottom - h, max(int(bar_w) - 1, 1), h))
+        label = self.font.render(f"0-{top:.1f} ms", True, (170, 170, 190))
+        surface.blit(label, (rect.right - label.get_width() - 2, rect.y + 1))
+
+    def build(self, profiler):
+        """Redraws the panel (if the refresh interval passed and there are new frames)"""
+        now = pygame.time.get_ticks()
+        if profiler.count == self.built_count or now - self.last_build < self.refresh_ms:
+            return
+        self.last_build = now
+        self.built_count = profiler.count
+
+        stats = profiler.summary()
+        surface = pygame.Surface((self.WIDTH, self.HEIGHT), pygame.SRCALPHA)
+        surface.fill((15, 15, 25, 190))
+        lines = [f"frames {stats['frames']}   (P: hide, T: trace)"]
+        for key, label in (('latency_ms', 'input->frame'), ('frame_ms', 'frame'),
+                           ('render_ms', ' render'), ('display_ms', ' display'), ('flip_ms', ' flip')):
+            p = stats[key]
+            lines.append(f"{label:13s}{p['p50']:6.2f}{p['p95']:7.2f}{p['p99']:7.2f}")
+        if profiler.gpu and profiler.gpu.key:
+            key = '/'.join(profiler.gpu.key)
+            lines.append(f"GPU {key}")
+            gpu_stats = stats['gpu_ms'].get(key, {})
+            for stage in profiler.gpu.stages:
+                p = gpu_stats.get(stage, percentiles([]))
+                lines.append(f"{' ' + stage:13s}{p['p50']:6.2f}{p['p95']:7.2f}{p['p99']:7.2f}")
+        y = 4
+        header = self.font.render(f"{'ms':13s}{'p50':>6s}{'p95':>7s}{'p99':>7s}", True, (150, 150, 170))
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, (235, 235, 245)), (6, y))
+            y += 13
+            if i == 0:
+                surface.blit(header, (6, y))
+                y += 13
+        self._histogram(surface, profiler.latencies_ms(), pygame.Rect(6, y + 4, self.WIDTH - 12, 28), (240, 170, 60))
+        self._histogram(surface, profiler.frame_times_ms(), pygame.Rect(6, y + 38, self.WIDTH - 12, 28), (90, 170, 250))
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.WIDTH, self.HEIGHT, GL_RGBA, GL_UNSIGNED_BYTE,
+                        pygame.image.tostring(surface, "RGBA", True))
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def draw(self, width, height):
+        """Draws the panel in the top-left corner (expects the 2D ortho setup of display_fbo_texture)"""
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glColor4f(1.0, 1.0, 1.0, 1.0)
+        x, y = 8, height - 8 - self.HEIGHT
+        glBegin(GL_QUADS)
+        glTexCoord2f(0, 0); glVertex2f(x, y)
+        glTexCoord2f(1, 0); glVertex2f(x + self.WIDTH, y)
+        glTexCoord2f(1, 1); glVertex2f(x + self.WIDTH, y + self.HEIGHT)
+        glTexCoord2f(0, 1); glVertex2f(x, y + self.HEIGHT)
+        glEnd()
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glDisable(GL_TEXTURE_2D)
+        glDisable(GL_BLEND)
+
+    def delete(self):
+        glDeleteTextures([self.texture])
+        self.texture = 0
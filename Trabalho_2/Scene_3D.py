@@ -0,0 +1,516 @@
+"""
+Scenes with many objects
+
+An InstanceList holds any number of objects (shape, material, model matrix)
+in flat NumPy arrays. Instances that share a mesh are drawn together with a
+single glDrawElementsInstanced call, their model matrices and material
+indices coming from one instance VBO!!
+
+Instances outside the view frustum are culled before drawing (bounding
+spheres + BVH, see Culling_3D.py) and each visible one gets a tessellation
+level from its size on screen.
+
+A SceneGraph adds parent-child nodes with local TRS transforms on top: world
+matrices are cached and only the subtrees under changed nodes are
+recomputed, then flattened into an InstanceList for drawing.
+
+Put an InstanceList or a SceneGraph in estado.scene and render_3d_to_texture
+draws it instead of the single estado.shape (estado's rotation / translation
+still move the whole scene).
+"""
+import itertools
+import numpy as np
+
+from Aux_3D import MATERIAL_COLORS, SHAPES
+from Object import Sphere, Cube, Torus, Pyramid
+from Object.Mesh import INSTANCE_DTYPE, bounding_sphere
+import Transform_3D
+import Culling_3D
+
+MATERIALS = list(MATERIAL_COLORS)
+
+# Skip instances outside the view frustum (False = always draw everything)
+FRUSTUM_CULLING = True
+
+# Automatic level of detail: tessellations per shape (coarse -> fine) and the
+# projected bounding sphere radius (pixels) above which the next finer level
+# is used. A level change needs LOD_HYSTERESIS (fraction) past the threshold
+AUTO_LOD = True
+LOD_LEVELS = {
+    'sphere': [Sphere.SPHERE_LOD[name] for name in ('tiny', 'low', 'medium', 'high')],
+    'cube': [()],
+    'torus': [Torus.TORUS_LOD[name] for name in ('tiny', 'low', 'medium', 'high')],
+    'pyramid': [()],
+}
+LOD_PIXEL_RADII = [8.0, 24.0, 96.0]
+LOD_HYSTERESIS = 0.15
+MAX_LOD_LEVELS = max(len(levels) for levels in LOD_LEVELS.values())
+LOD_LEVEL_COUNTS = np.array([len(LOD_LEVELS[shape]) for shape in SHAPES])
+
+# Local bounding sphere of each shape, in SHAPES order (filled on first use)
+SHAPE_GENERATORS = {
+    'sphere': Sphere.generate_sphere_mesh,
+    'cube': Cube.generate_cube_mesh,
+    'torus': Torus.generate_torus_mesh,
+    'pyramid': Pyramid.generate_pyramid_mesh,
+}
+_shape_bounds = None
+
+_lod_loaded = False
+
+def preload_lod():
+    """Uploads every LOD level of every shape to the mesh cache up front (needs a GL context)"""
+    global _lod_loaded
+    if _lod_loaded:
+        return
+    from Light import LightingPhong
+    for shape, levels in LOD_LEVELS.items():
+        for params in levels:
+            LightingPhong.get_mesh(shape, params)
+    _lod_loaded = True
+
+def release_lod():
+    """Forgets that the LOD meshes were uploaded (Mesh.release() deleted them)"""
+    global _lod_loaded
+    _lod_loaded = False
+
+def shape_bounds():
+    """(centers (S,3), radii (S,)) of the local bounding sphere of every shape in SHAPES"""
+    global _shape_bounds
+    if _shape_bounds is None:
+        spheres = [bounding_sphere(SHAPE_GENERATORS[shape]()[0]) for shape in SHAPES]
+        _shape_bounds = (np.array([center for center, _ in spheres], dtype=np.float32),
+                         np.array([radius for _, radius in spheres], dtype=np.float32))
+    return _shape_bounds
+
+# Versions are unique across all scenes, so a GPU copy of one scene is never
+# mistaken for an up to date copy of another
+_versions = itertools.count(1)
+
+class InstanceList:
+    """
+    Growable arrays of instances: shapes (index into SHAPES), materials
+    (index into MATERIAL_COLORS) and row-major model matrices.
+    version changes on every change so GPU copies know when to re-upload.
+    """
+    def __init__(self, capacity=256):
+        self.matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.shapes = np.zeros(capacity, dtype=np.int8)
+        self.materials = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        self.version = next(_versions)
+        self._packed_version = -1
+        self._packed = None
+        self._batches = None
+        self._order = None
+        self._spheres = None
+        self._spheres_version = -1
+        self._bvh = None
+        self._bvh_version = -1
+        self._lod = None          # Current LOD level per packed record (hysteresis)
+        self._positions = None    # Packed records drawn last frame, in draw order
+        self._cull_key = None
+        self._cull_result = None
+        # Counters of the last frame (instances drawn / culled, BVH nodes tested, triangles drawn)
+        self.visible = np.zeros(0, dtype=np.int64)
+        self.drawn = 0
+        self.culled = 0
+        self.nodes_tested = 0
+        self.triangles = 0
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, count):
+        if count <= len(self.shapes):
+            return
+        capacity = max(count, 2 * len(self.shapes))
+        for name in ('matrices', 'shapes', 'materials'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, shape='sphere', material='orange', matrix=None):
+        """Adds one instance, returns its index"""
+        return self.add_many([shape], [material], None if matrix is None else [matrix]).start
+
+    def add_many(self, shapes, materials, matrices=None):
+        """
+        Adds len(shapes) instances at once (names or indices for shapes /
+        materials, (N, 4, 4) matrices or None for identity). Returns their
+        index range.
+        """
+        shapes = np.array([SHAPES.index(s) if isinstance(s, str) else s for s in shapes], dtype=np.int8)
+        materials = np.array([MATERIALS.index(m) if isinstance(m, str) else m for m in materials], dtype=np.int32)
+        n = len(shapes)
+        start = self.count
+        self._reserve(start + n)
+        self.shapes[start:start + n] = shapes
+        self.materials[start:start + n] = np.broadcast_to(materials, (n,))
+        self.matrices[start:start + n] = Transform_3D.identity() if matrices is None else matrices
+        self.count += n
+        self.version = next(_versions)
+        return range(start, start + n)
+
+    def set_matrix(self, index, matrix):
+        self.matrices[index] = matrix
+        self.version = next(_versions)
+
+    def set_matrices(self, matrices, start=0):
+        """Overwrites the model matrices of instances start, start + 1, ..."""
+        matrices = np.asarray(matrices, dtype=np.float32)
+        self.matrices[start:start + len(matrices)] = matrices
+        self.version = next(_versions)
+
+    def clear(self):
+        self.count = 0
+        self.version = next(_versions)
+        self._lod = None  # The next instances are new ones, whatever their order
+
+    def _pack(self):
+        """Instance records sorted by shape (instance VBO layout) and the draw batches"""
+        if self._packed_version == self.version:
+            return
+        n = self.count
+        order = np.argsort(self.shapes[:n], kind='stable')
+        records = np.empty(n, dtype=INSTANCE_DTYPE)
+        # Column-major for OpenGL
+        records['model'] = self.matrices[:n][order].transpose(0, 2, 1).reshape(n, 16)
+        records['material'] = self.materials[:n][order]
+
+        # LOD levels are kept per packed record: start over when records move to other positions
+        if self._lod is not None and (self._order is None or not np.array_equal(order, self._order)):
+            self._lod = None
+
+        shapes, firsts, counts = np.unique(self.shapes[:n][order], return_index=True, return_counts=True)
+        self._batches = [(SHAPES[shape], int(first), int(count)) for shape, first, count in zip(shapes, firsts, counts)]
+        self._packed = records
+        self._order = order
+        self._packed_version = self.version
+
+    def packed(self):
+        """INSTANCE_DTYPE records in draw order (rebuilt only after a change)"""
+        self._pack()
+        return self._packed
+
+    def batches(self):
+        """[(shape name, first record, instance count)] for one instanced draw each"""
+        self._pack()
+        return self._batches
+
+    def instances(self):
+        """Drawable instances (an InstanceList is its own)"""
+        return self
+
+    def world_spheres(self):
+        """World bounding spheres (centers, radii) in draw (packed) order; rebuilt after a change"""
+        self._pack()
+        if self._spheres_version != self.version:
+            centers, radii = shape_bounds()
+            shapes = self.shapes[:self.count][self._order]
+            self._spheres = Culling_3D.transform_spheres(self.matrices[:self.count][self._order],
+                                                         centers[shapes], radii[shapes])
+            self._spheres_version = self.version
+        return self._spheres
+
+    def bvh(self):
+        """BVH over the world bounding spheres, in draw (packed) order; rebuilt after a change"""
+        if self._bvh_version != self.version:
+            self._bvh = Culling_3D.BVH(*self.world_spheres())
+            self._bvh_version = self.version
+        return self._bvh
+
+    def select_lod(self, positions, view, projection, viewport_height):
+        """
+        LOD level (index into LOD_LEVELS[shape]) of the packed records at
+        positions, from the projected radius of their bounding sphere in
+        pixels. A record only moves to another level once its radius is
+        LOD_HYSTERESIS past the threshold, so objects near it do not pop.
+        """
+        self._pack()  # May drop the levels of records that moved
+        if self._lod is None or len(self._lod) != self.count:
+            self._lod = np.full(self.count, -1, dtype=np.int8)  # -1 = not drawn yet
+        centers, radii = self.world_spheres()
+        # Clip space w of the center (-z for a perspective, 1 for an ortho projection)
+        view_centers = centers[positions] @ view[:3, :3].T + view[:3, 3]
+        w = np.maximum(view_centers @ projection[3, :3] + projection[3, 3], 1e-6)
+        axis_scale = np.sqrt((view[:3, :3] ** 2).sum(axis=0)).max()
+        pixels = radii[positions] * axis_scale * projection[1, 1] * viewport_height / (2 * w)
+
+        # Finest level allowed without / with the hysteresis margin
+        strict = np.searchsorted(np.asarray(LOD_PIXEL_RADII) * (1 + LOD_HYSTERESIS), pixels)
+        lenient = np.searchsorted(np.asarray(LOD_PIXEL_RADII) * (1 - LOD_HYSTERESIS), pixels)
+        current = self._lod[positions]
+        level = np.where(current < 0, np.searchsorted(LOD_PIXEL_RADII, pixels), np.clip(current, strict, lenient))
+
+        # Shapes with fewer levels use their finest one
+        shapes = self.shapes[:self.count][self._order][positions]
+        level = np.minimum(level, LOD_LEVEL_COUNTS[shapes] - 1)
+        self._lod[positions] = level
+        return level
+
+    def cull(self, view, projection, viewport_height):
+        """
+        Frustum culling and LOD selection for the row-major view (modelview)
+        and projection matrices. Returns (records, batches, key): the visible
+        instance records in draw order, their [(shape, tessellation params or
+        None, first, count)] batches and a key that changes whenever the
+        records do. Also sets visible (instance indices), drawn, culled and
+        nodes_tested.
+        """
+        self._pack()
+        clip = projection @ view
+        key = (self.version, np.asarray(clip, dtype=np.float32).tobytes(), viewport_height)
+        if key == self._cull_key:
+            return self._cull_result
+        if not FRUSTUM_CULLING:
+            positions = np.arange(self.count)
+            self.nodes_tested = 0
+        else:
+            bvh = self.bvh()
+            positions = bvh.cull(Culling_3D.frustum_planes(clip))
+            self.nodes_tested = bvh.nodes_tested
+
+        # Records are sorted by shape (and by LOD level inside a shape): one batch each
+        shapes = self.shapes[:self.count][self._order][positions].astype(np.int64)
+        if AUTO_LOD:
+            levels = self.select_lod(positions, view, projection, viewport_height)
+            groups = shapes * MAX_LOD_LEVELS + levels
+            order = np.argsort(groups, kind='stable')
+            positions, groups = positions[order], groups[order]
+        else:
+            groups = shapes * MAX_LOD_LEVELS
+        keys, firsts, counts = np.unique(groups, return_index=True, return_counts=True)
+        batches = []
+        for group, first, count in zip(keys, firsts, counts):
+            shape = SHAPES[group // MAX_LOD_LEVELS]
+            params = LOD_LEVELS[shape][group % MAX_LOD_LEVELS] if AUTO_LOD else None
+            batches.append((shape, params, int(first), int(count)))
+
+        previous = self._cull_result
+        if previous is not None and self._cull_key and self._cull_key[0] == self.version and np.array_equal(self._positions, positions):
+            result = (previous[0], batches, previous[2])  # Same records: the GPU copy is still good
+        else:
+            result = (self._packed[positions], batches, next(_versions))
+        self._positions = positions
+        self.visible = self._order[positions]
+        self.drawn = len(positions)
+        self.culled = self.count - self.drawn
+        self._cull_key = key
+        self._cull_result = result
+        return result
+
+class SceneNode:
+    """Handle to one node of a SceneGraph (the data lives in the graph's arrays)"""
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, SceneNode) and other.graph is self.graph and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.graph), self.index))
+
+    @property
+    def parent(self):
+        parent = self.graph.parents[self.index]
+        return SceneNode(self.graph, parent) if parent >= 0 else None
+
+    @property
+    def translation(self):
+        return self.graph.translations[self.index].copy()
+
+    @translation.setter
+    def translation(self, value):
+        self.graph.set_transform(self, translation=value)
+
+    @property
+    def rotation(self):
+        return self.graph.rotations[self.index].copy()
+
+    @rotation.setter
+    def rotation(self, value):
+        self.graph.set_transform(self, rotation=value)
+
+    @property
+    def scale(self):
+        return self.graph.scales[self.index].copy()
+
+    @scale.setter
+    def scale(self, value):
+        self.graph.set_transform(self, scale=value)
+
+    @property
+    def world_matrix(self):
+        self.graph.update()
+        return self.graph.world[self.index].copy()
+
+    def add_child(self, **kwargs):
+        return self.graph.add_node(parent=self, **kwargs)
+
+class SceneGraph:
+    """
+    Nodes with a parent, a local transform (translation, Euler rotation in
+    degrees, per-axis scale) and optionally a shape + material to draw.
+
+    Nodes are stored in creation order, so a parent always comes before its
+    children. update() rebuilds the local matrices of the nodes that were
+    changed and then, one tree level at a time, the world matrices of those
+    nodes and of everything below them, vectorized with NumPy.
+    """
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.parents = np.full(capacity, -1, dtype=np.int32)
+        self.depths = np.zeros(capacity, dtype=np.int32)
+        self.translations = np.zeros((capacity, 3), dtype=np.float32)
+        self.rotations = np.zeros((capacity, 3), dtype=np.float32)
+        self.scales = np.ones((capacity, 3), dtype=np.float32)
+        self.shapes = np.full(capacity, -1, dtype=np.int8)    # -1 = group node (nothing to draw)
+        self.materials = np.zeros(capacity, dtype=np.int32)
+        self.local = Transform_3D.identity(capacity)
+        self.world = Transform_3D.identity(capacity)
+        self.dirty = np.zeros(capacity, dtype=bool)           # Local transform changed
+        self.changed = False                                  # Some world matrix changed since the last flatten
+        self.recomputed = 0                                   # World matrices rebuilt by the last update()
+        self._levels = None                                   # Node indices per depth
+        self._instances = None
+        self._renderable = None
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, count):
+        capacity = len(self.parents)
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity)
+        fill = {'parents': -1, 'scales': 1.0, 'shapes': -1}
+        for name in ('parents', 'depths', 'translations', 'rotations', 'scales', 'shapes', 'materials', 'dirty'):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], fill.get(name, 0), dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        for name in ('local', 'world'):
+            new = Transform_3D.identity(capacity)
+            new[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, new)
+
+    def add_node(self, parent=None, shape=None, material='orange', translation=(0.0, 0.0, 0.0),
+                 rotation=(0.0, 0.0, 0.0), scale=1.0):
+        """Adds a node (a group node if shape is None) and returns its SceneNode"""
+        index = self.count
+        self._reserve(index + 1)
+        parent = parent.index if isinstance(parent, SceneNode) else (-1 if parent is None else parent)
+        self.parents[index] = parent
+        self.depths[index] = self.depths[parent] + 1 if parent >= 0 else 0
+        self.translations[index] = translation
+        self.rotations[index] = rotation
+        self.scales[index] = scale
+        self.shapes[index] = -1 if shape is None else SHAPES.index(shape)
+        self.materials[index] = MATERIALS.index(material)
+        self.dirty[index] = True
+        self.count += 1
+        self._levels = None
+        self._instances = None
+        return SceneNode(self, index)
+
+    def node(self, index):
+        return SceneNode(self, index)
+
+    def set_transform(self, node, translation=None, rotation=None, scale=None):
+        """Changes a node's local transform (its subtree is recomputed on the next update)"""
+        index = node.index if isinstance(node, SceneNode) else node
+        if translation is not None:
+            self.translations[index] = translation
+        if rotation is not None:
+            self.rotations[index] = rotation
+        if scale is not None:
+            self.scales[index] = scale
+        self.dirty[index] = True
+
+    def set_transforms(self, indices, translations=None, rotations=None, scales=None):
+        """Vectorized set_transform for many nodes at once"""
+        indices = np.asarray(indices)
+        if translations is not None:
+            self.translations[indices] = translations
+        if rotations is not None:
+            self.rotations[indices] = rotations
+        if scales is not None:
+            self.scales[indices] = np.asarray(scales, dtype=np.float32).reshape(len(indices), -1)
+        self.dirty[indices] = True
+
+    def levels(self):
+        """Node indices grouped by depth (roots first)"""
+        if self._levels is None:
+            depths = self.depths[:self.count]
+            order = np.argsort(depths, kind='stable')
+            bounds = np.searchsorted(depths[order], np.arange(depths.max(initial=0) + 2))
+            self._levels = [order[bounds[d]:bounds[d + 1]] for d in range(len(bounds) - 1) if bounds[d + 1] > bounds[d]]
+        return self._levels
+
+    def update(self):
+        """Brings the world matrices up to date, returns how many were recomputed"""
+        n = self.count
+        dirty = self.dirty[:n]
+        if not dirty.any():
+            self.recomputed = 0
+            return 0
+
+        changed = np.flatnonzero(dirty)
+        self.local[changed] = Transform_3D.trs(self.translations[changed], self.rotations[changed], self.scales[changed])
+
+        # A world matrix is stale if its local one changed or its parent's world did
+        stale = dirty.copy()
+        for level in self.levels():
+            parents = self.parents[level]
+            if parents[0] >= 0:  # Roots have no parent (same depth -> all roots or none)
+                stale[level] |= stale[parents]
+            nodes = level[stale[level]]
+            if len(nodes) == 0:
+                continue
+            if parents[0] >= 0:
+                self.world[nodes] = self.world[self.parents[nodes]] @ self.local[nodes]
+            else:
+                self.world[nodes] = self.local[nodes]
+
+        self.dirty[:n] = False
+        self.changed = True
+        self.recomputed = int(stale.sum())
+        return self.recomputed
+
+    def world_matrices(self):
+        """(N, 4, 4) row-major world matrices of every node, up to date"""
+        self.update()
+        return self.world[:self.count]
+
+    def instances(self):
+        """
+        The drawable nodes flattened into an InstanceList (contiguous world
+        matrices, ready for the instance VBO). Rebuilt when nodes are added,
+        only its matrices are refreshed when transforms change.
+        """
+        self.update()
+        if self._instances is None:
+            self._renderable = np.flatnonzero(self.shapes[:self.count] >= 0)
+            self._instances = InstanceList(len(self._renderable))
+            self._instances.add_many(self.shapes[self._renderable], self.materials[self._renderable],
+                                     self.world[self._renderable])
+            self.changed = False
+        elif self.changed:
+            self._instances.set_matrices(self.world[self._renderable])
+            self.changed = False
+        return self._instances
+
+def random_scene(count, shapes=SHAPES, materials=MATERIALS, extent=20.0, scale_range=(0.1, 0.4), seed=0):
+    """Load test scene: count instances scattered in a cube of side 2 * extent"""
+    rng = np.random.default_rng(seed)
+    scene = InstanceList(count)
+    matrices = Transform_3D.trs(rng.uniform(-extent, extent, (count, 3)),
+                                rng.uniform(0.0, 360.0, (count, 3)),
+                                rng.uniform(*scale_range, count))
+    scene.add_many(rng.choice(list(shapes), count), rng.choice(list(materials), count), matrices)
+    return scene
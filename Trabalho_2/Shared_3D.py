@@ -0,0 +1,124 @@
+"""
+Estado3D in shared memory
+
+The GUI process writes the scene state in place into a fixed-layout
+multiprocessing.shared_memory block and the 3D process reads it every frame,
+with no pickling and no queue. A seqlock (version counter) keeps reads
+consistent and the writer's timestamp lets the reader measure latency!!
+
+Layout (little endian, VERSION_FORMAT + PAYLOAD_FORMAT):
+    version        uint64   odd while a write is in progress
+    timestamp_ns   int64    time.monotonic_ns() of the input behind the last write
+    light_pos      4 x float64
+    rotation       3 x float64 (x, y, z)
+    translation    3 x float64 (x, y, z)
+    shape, material, camera, lighting   uint8 indices
+"""
+import struct
+import time
+from multiprocessing import shared_memory
+
+from Aux_3D import Estado3D, MATERIAL_COLORS, SHAPES, CAMERA_ANGLES, LIGHTING_MODELS
+
+MATERIALS = list(MATERIAL_COLORS)
+
+VERSION_FORMAT = '<Q'
+PAYLOAD_FORMAT = '<q4d3d3d4B'
+VERSION_SIZE = struct.calcsize(VERSION_FORMAT)
+STATE_SIZE = VERSION_SIZE + struct.calcsize(PAYLOAD_FORMAT)
+MAX_READ_RETRIES = 1000  # Reader gives up (keeps its estado) after this many torn reads
+
+def _index(options, value):
+    return options.index(value) if value in options else 0
+
+class SharedEstado3D:
+    """
+    Estado3D backed by shared memory.
+
+    The owner (main process) creates the block and fills it with a default
+    Estado3D, so readers never see the zeroed block; the GUI and 3D processes
+    attach to it by name. There must be a single writer.
+    """
+    def __init__(self, name=None, create=False):
+        self.owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=STATE_SIZE)
+            self.shm.buf[:STATE_SIZE] = bytes(STATE_SIZE)
+        else:
+            # Attaching processes only close(): the owner unlinks the block
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.last_version = 0    # Reader: last version copied into an Estado3D (0 = never written)
+        self.timestamp_ns = 0    # Reader: input timestamp of the last read
+        self.latency_ns = 0      # Reader: input -> read latency of the last read
+        self.retries = 0         # Reader: reads repeated because a write was in progress
+        self._payload = None     # Writer: last payload, to skip identical writes
+        if create:
+            self.write(Estado3D(), timestamp_ns=0)  # Defaults, with no input behind them
+
+    @property
+    def version(self):
+        return struct.unpack_from(VERSION_FORMAT, self.buf, 0)[0]
+
+    def write(self, estado, timestamp_ns=None):
+        """
+        Writer: stores estado in place (seqlock write), stamped with the time of
+        the input that changed it (default: now, 0: no input). Skipped when
+        nothing changed since the last write. Returns True if the block was written.
+        """
+        values = (list(estado.light_pos[:4]) +
+                  [estado.rotation_x, estado.rotation_y, estado.rotation_z,
+                   estado.translation_x, estado.translation_y, estado.translation_z] +
+                  [_index(SHAPES, estado.shape), _index(MATERIALS, estado.material),
+                   _index(CAMERA_ANGLES, estado.camera_angle), _index(LIGHTING_MODELS, estado.lighting_model)])
+        if values == self._payload:
+            return False
+        self._payload = values
+
+        version = self.version
+        struct.pack_into(VERSION_FORMAT, self.buf, 0, version + 1)   # Odd: write in progress
+        struct.pack_into(PAYLOAD_FORMAT, self.buf, VERSION_SIZE, time.monotonic_ns() if timestamp_ns is None else timestamp_ns, *values)
+        struct.pack_into(VERSION_FORMAT, self.buf, 0, version + 2)   # Even: consistent again
+        return True
+
+    def read(self, estado, force=False):
+        """
+        Reader: copies the block into estado if a newer version was written
+        (or always, with force). Retries, yielding the CPU, while a write is
+        in progress, at most MAX_READ_RETRIES times. Returns True if estado
+        was updated.
+        """
+        for _ in range(MAX_READ_RETRIES):
+            version = self.version
+            if version == 0 or (version == self.last_version and not force):
+                return False
+            if not version % 2:
+                payload = struct.unpack_from(PAYLOAD_FORMAT, self.buf, VERSION_SIZE)
+                if self.version == version:
+                    break
+            self.retries += 1
+            time.sleep(0)  # Let the writer finish
+        else:
+            return False  # Writer stalled mid-write: keep estado, try again next frame
+
+        self.timestamp_ns = timestamp_ns = payload[0]
+        estado.light_pos = list(payload[1:5])
+        estado.rotation_x, estado.rotation_y, estado.rotation_z = payload[5:8]
+        estado.translation_x, estado.translation_y, estado.translation_z = payload[8:11]
+        shape, material, camera, lighting = payload[11:15]
+        estado.shape = SHAPES[shape]
+        estado.material = MATERIALS[material]
+        estado.camera_angle = CAMERA_ANGLES[camera]
+        estado.lighting_model = LIGHTING_MODELS[lighting]
+
+        self.last_version = version
+        if timestamp_ns:
+            self.latency_ns = time.monotonic_ns() - timestamp_ns
+        return True
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,131 @@
+"""
+Transform matrices with NumPy
+
+Row-major float32 4x4 matrices acting on column vectors (p' = M @ p), the
+same convention as the gluPerspective / gluLookAt / glTranslatef /
+glRotatef calls they replace. The model transforms are vectorized over any
+leading batch shape, so thousands of instance transforms are built in one
+call!!
+
+Everything is computed on the CPU and only ever sent to OpenGL (shader
+uniforms, glLoadMatrixf), never read back with glGetFloatv. OpenGL expects
+column-major data: use to_gl() before handing a matrix over.
+"""
+import numpy as np
+
+def identity(batch=()):
+    """Identity matrix, or a batch of them with the given leading shape"""
+    batch = (batch,) if isinstance(batch, int) else tuple(batch)
+    return np.broadcast_to(np.eye(4, dtype=np.float32), batch + (4, 4)).copy()
+
+def translate(offset):
+    """Translation by offset (..., 3)"""
+    offset = np.asarray(offset, dtype=np.float32)
+    matrix = identity(offset.shape[:-1])
+    matrix[..., :3, 3] = offset
+    return matrix
+
+def scale(factor):
+    """Scale by a scalar / (...,) uniform factor or a (..., 3) per-axis factor"""
+    factor = np.asarray(factor, dtype=np.float32)
+    if factor.ndim == 0 or factor.shape[-1] != 3:
+        factor = np.repeat(factor[..., None], 3, axis=-1)
+    matrix = identity(factor.shape[:-1])
+    matrix[..., 0, 0] = factor[..., 0]
+    matrix[..., 1, 1] = factor[..., 1]
+    matrix[..., 2, 2] = factor[..., 2]
+    return matrix
+
+def _rotation(degrees, a, b, sign):
+    radians = np.radians(np.asarray(degrees, dtype=np.float32))
+    c, s = np.cos(radians), np.sin(radians)
+    matrix = identity(radians.shape)
+    matrix[..., a, a] = c
+    matrix[..., b, b] = c
+    matrix[..., a, b] = -sign * s
+    matrix[..., b, a] = sign * s
+    return matrix
+
+def rotate_x(degrees):
+    """Rotation about +x, like glRotatef(degrees, 1, 0, 0)"""
+    return _rotation(degrees, 1, 2, 1.0)
+
+def rotate_y(degrees):
+    """Rotation about +y, like glRotatef(degrees, 0, 1, 0)"""
+    return _rotation(degrees, 0, 2, -1.0)
+
+def rotate_z(degrees):
+    """Rotation about +z, like glRotatef(degrees, 0, 0, 1)"""
+    return _rotation(degrees, 0, 1, 1.0)
+
+def rotate_xyz(rotation):
+    """Euler angles (..., 3) in degrees applied like render_3d_to_texture: Rx @ Ry @ Rz"""
+    rotation = np.asarray(rotation, dtype=np.float32)
+    return rotate_x(rotation[..., 0]) @ rotate_y(rotation[..., 1]) @ rotate_z(rotation[..., 2])
+
+def trs(translation=None, rotation=None, scale_factor=None):
+    """
+    Model matrix T @ Rx @ Ry @ Rz @ S. Any part may be None (skipped); the
+    parts broadcast against each other, e.g. (N, 3) translations with one
+    shared rotation.
+    """
+    matrix = identity()
+    if translation is not None:
+        matrix = matrix @ translate(translation)
+    if rotation is not None:
+        matrix = matrix @ rotate_xyz(rotation)
+    if scale_factor is not None:
+        matrix = matrix @ scale(scale_factor)
+    return matrix
+
+def perspective(fovy, aspect, near, far):
+    """Projection matrix of gluPerspective (fovy in degrees)"""
+    f = 1.0 / np.tan(np.radians(fovy) / 2)
+    matrix = np.zeros((4, 4), dtype=np.float32)
+    matrix[0, 0] = f / aspect
+    matrix[1, 1] = f
+    matrix[2, 2] = (far + near) / (near - far)
+    matrix[2, 3] = 2 * far * near / (near - far)
+    matrix[3, 2] = -1.0
+    return matrix
+
+def ortho(left, right, bottom, top, near, far):
+    """Projection matrix of glOrtho"""
+    matrix = identity()
+    matrix[0, 0] = 2 / (right - left)
+    matrix[1, 1] = 2 / (top - bottom)
+    matrix[2, 2] = -2 / (far - near)
+    matrix[0, 3] = -(right + left) / (right - left)
+    matrix[1, 3] = -(top + bottom) / (top - bottom)
+    matrix[2, 3] = -(far + near) / (far - near)
+    return matrix
+
+def look_at(eye, center, up):
+    """View matrix of gluLookAt"""
+    eye = np.asarray(eye, dtype=np.float32)
+    forward = np.asarray(center, dtype=np.float32) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, np.asarray(up, dtype=np.float32))
+    side /= np.linalg.norm(side)
+    true_up = np.cross(side, forward)
+
+    matrix = identity()
+    matrix[0, :3] = side
+    matrix[1, :3] = true_up
+    matrix[2, :3] = -forward
+    matrix[:3, 3] = -matrix[:3, :3] @ eye
+    return matrix
+
+def normal_matrix(modelview):
+    """Inverse transpose of the upper-left 3x3 (normals to view space)"""
+    modelview = np.asarray(modelview, dtype=np.float32)
+    return np.linalg.inv(modelview[..., :3, :3]).swapaxes(-1, -2).astype(np.float32)
+
+def to_gl(matrix):
+    """Column-major contiguous float32 copy, as glUniformMatrix* / glLoadMatrixf expect"""
+    return np.ascontiguousarray(np.swapaxes(matrix, -1, -2), dtype=np.float32)
+
+def estado_model_matrix(estado):
+    """Object transform of an Estado3D (translation + rotation)"""
+    return trs([estado.translation_x, estado.translation_y, estado.translation_z],
+               [estado.rotation_x, estado.rotation_y, estado.rotation_z])
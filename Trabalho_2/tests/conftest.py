@@ -0,0 +1,7 @@
+"""Tests import the Trabalho_2 modules the way the program does (run from Trabalho_2)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Headless_3D  # Picks the headless GL platform before any test imports OpenGL
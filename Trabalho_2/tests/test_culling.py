@@ -0,0 +1,50 @@
+"""
+View-frustum culling (Culling_3D): the BVH walk must accept exactly the
+spheres the brute-force plane test accepts.
+"""
+import numpy as np
+import pytest
+
+import Transform_3D
+from Culling_3D import BVH, frustum_planes, spheres_visible, transform_spheres
+
+def random_frustum(rng):
+    eye = rng.uniform(-30, 30, 3)
+    target = rng.uniform(-10, 10, 3)
+    projection = Transform_3D.perspective(rng.uniform(20, 90), rng.uniform(0.5, 2.0), 0.1, rng.uniform(10, 60))
+    return frustum_planes(projection @ Transform_3D.look_at(eye, target, (0, 1, 0)))
+
+@pytest.mark.parametrize('count, leaf_size', [(0, 32), (1, 32), (500, 32), (3000, 8), (3000, 32)])
+def test_bvh_cull_matches_brute_force(count, leaf_size):
+    rng = np.random.default_rng(count + leaf_size)
+    centers = rng.uniform(-20, 20, (count, 3))
+    radii = rng.uniform(0.05, 2.0, count)
+    bvh = BVH(centers, radii, leaf_size)
+    for _ in range(20):
+        planes = random_frustum(rng)
+        expected = np.flatnonzero(spheres_visible(centers, radii, planes))
+        assert np.array_equal(bvh.cull(planes), expected)
+
+def test_bvh_skips_subtrees_outside():
+    rng = np.random.default_rng(1)
+    bvh = BVH(rng.uniform(-20, 20, (4000, 3)), np.full(4000, 0.5))
+    # Short, narrow view into one corner of the cloud: most of the tree is never reached
+    planes = frustum_planes(Transform_3D.perspective(20, 1.0, 0.1, 25) @
+                            Transform_3D.look_at((30, 30, 30), (0, 0, 0), (0, 1, 0)))
+    assert len(bvh.cull(planes))
+    assert bvh.nodes_tested < len(bvh) // 4
+
+def test_frustum_planes_point_inside():
+    planes = frustum_planes(Transform_3D.perspective(60, 1.0, 1.0, 10.0))
+    inside = np.array([[0.0, 0.0, -5.0]])
+    outside = np.array([[0.0, 0.0, 5.0], [0.0, 0.0, -20.0], [100.0, 0.0, -5.0]])
+    assert spheres_visible(inside, np.zeros(1), planes).all()
+    assert not spheres_visible(outside, np.zeros(3), planes).any()
+    # A sphere reaching back into the frustum is kept
+    assert spheres_visible(np.array([[0.0, 0.0, -10.5]]), np.array([1.0]), planes).all()
+
+def test_transform_spheres_uses_largest_scale():
+    matrices = np.stack([Transform_3D.translate([1.0, 2.0, 3.0]) @ Transform_3D.scale([1.0, 3.0, 2.0])])
+    centers, radii = transform_spheres(matrices, np.array([[1.0, 0.0, 0.0]]), np.array([0.5]))
+    assert np.allclose(centers, [[2.0, 2.0, 3.0]])
+    assert np.allclose(radii, [1.5])
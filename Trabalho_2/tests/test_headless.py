@@ -0,0 +1,115 @@
+"""
+Headless rendering (Headless_3D): needs an EGL or OSMesa driver, skipped
+without one.
+"""
+import numpy as np
+import pytest
+
+import Transform_3D
+from Aux_3D import Estado3D
+from Headless_3D import HeadlessContext, HeadlessRenderer, render_headless
+from Lights_3D import random_lights
+from Light import LightingGouraud, LightingPhong, Shader
+from Object import Sphere
+from Scene_3D import random_scene
+
+@pytest.fixture(scope='module', autouse=True)
+def headless_driver():
+    try:
+        HeadlessContext().release()
+    except Exception as e:
+        pytest.skip(f"no headless GL context: {e}")
+
+def estados():
+    result = []
+    for lighting in ('flat', 'gouraud', 'phong'):
+        for shape in ('sphere', 'cube'):
+            estado = Estado3D()
+            estado.lighting_model, estado.shape = lighting, shape
+            result.append(estado)
+    estado = Estado3D()
+    estado.lighting_model = 'phong'
+    estado.scene = random_scene(50, extent=4.0, scale_range=(0.1, 0.3))
+    result.append(estado)
+    estado = Estado3D()
+    estado.lighting_model, estado.shape = 'phong', 'torus'
+    estado.lights = random_lights(16, extent=4.0, range_span=(0.5, 2.0))
+    result.append(estado)
+    return result
+
+def test_renders_twice_in_one_process():
+    # The second renderer gets a new context: no GL name of the first one may survive in a cache
+    first = list(render_headless(estados(), 128, 96))
+    second = list(render_headless(estados(), 128, 96))
+    assert len(first) == len(second) == 8
+    for a, b in zip(first, second):
+        assert a.shape == (96, 128, 4)
+        assert np.array_equal(a, b)
+    assert any(frame[..., :3].std() > 0 for frame in first)  # Something was drawn
+
+@pytest.mark.parametrize('lighting', ['flat', 'gouraud', 'phong'])
+def test_sphere_follows_lod(lighting):
+    estado = Estado3D()
+    estado.lighting_model = lighting
+    with HeadlessRenderer(128, 96) as renderer:
+        medium = renderer.render(estado)
+        Sphere.set_lod('tiny')
+        try:
+            tiny = renderer.render(estado)
+        finally:
+            Sphere.set_lod('medium')
+        assert not np.array_equal(medium, tiny)
+        assert np.array_equal(renderer.render(estado), medium)
+
+@pytest.mark.parametrize('light_pos', [[0.0, 0.0, 1.0, 0.0], [1.0, -0.5, 0.7, 0.0], [2.0, -1.5, 3.0, 1.0]])
+@pytest.mark.parametrize('shape', ['sphere', 'torus'])
+def test_gouraud_matches_fixed_function(monkeypatch, shape, light_pos):
+    # Point (w = 1) and directional (w = 0) lights, like GL_LIGHT0
+    estado = Estado3D()
+    estado.lighting_model, estado.shape, estado.light_pos = 'gouraud', shape, light_pos
+    estado.rotation_x, estado.rotation_y = 20.0, -35.0
+    with HeadlessRenderer(128, 96) as renderer:
+        shader = renderer.render(estado)
+        monkeypatch.setattr(LightingGouraud, 'enable', lambda instanced=False: False)
+        fixed = renderer.render(estado)
+    difference = np.abs(shader.astype(np.int16) - fixed)[..., :3].max(axis=2)
+    assert (difference > 2).sum() <= 4
+
+class MissingFunction:
+    """Stands for a GL entry point the driver does not export (like PyOpenGL's null functions)"""
+    def __bool__(self):
+        return False
+
+    def __call__(self, *args):
+        raise AssertionError("called a GL function the driver does not have")
+
+def test_programs_link_without_program_binaries(monkeypatch):
+    # Driver without GL 4.1 / ARB_get_program_binary: no retrievable hint, no disk cache
+    monkeypatch.setattr(Shader, 'binaries_supported', lambda: False)
+    monkeypatch.setattr(Shader, 'glProgramParameteri', MissingFunction())
+    with HeadlessRenderer(64, 48):
+        for instanced in (False, True):
+            program = Shader.compile_program(*LightingPhong.program_sources(instanced), "Phong")
+            assert program and not program.from_cache
+
+def gl_matrix(*calls):
+    """Row-major matrix the fixed pipeline builds from identity with calls [(function, args)]"""
+    from OpenGL.GL import glMatrixMode, glLoadIdentity, glGetFloatv, GL_MODELVIEW, GL_MODELVIEW_MATRIX
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    for function, args in calls:
+        function(*args)
+    return np.asarray(glGetFloatv(GL_MODELVIEW_MATRIX)).reshape(4, 4).T
+
+def test_transforms_match_glu():
+    from OpenGL.GL import glRotatef, glScalef, glTranslatef
+    from OpenGL.GLU import gluLookAt, gluPerspective
+    with HeadlessRenderer(64, 48):
+        for args in [(45.0, 1.0, 0.1, 100.0), (60.0, 2.0, 0.5, 10.0)]:
+            assert np.allclose(Transform_3D.perspective(*args), gl_matrix((gluPerspective, args)), atol=1e-5)
+        for eye, up in [((0, 0, 8), (0, 1, 0)), ((0, 8, 0.1), (0, 0, -1)), ((5, 5, 5), (0, 1, 0)), ((1, -2, 3), (0.3, 1, 0))]:
+            expected = gl_matrix((gluLookAt, (*eye, 0.5, 0.0, -1.0, *up)))
+            assert np.allclose(Transform_3D.look_at(eye, (0.5, 0.0, -1.0), up), expected, atol=1e-5)
+        expected = gl_matrix((glTranslatef, (1.0, -2.0, 0.5)), (glRotatef, (30.0, 1, 0, 0)),
+                             (glRotatef, (-45.0, 0, 1, 0)), (glRotatef, (60.0, 0, 0, 1)), (glScalef, (2.0, 2.0, 2.0)))
+        assert np.allclose(Transform_3D.trs([1.0, -2.0, 0.5], [30.0, -45.0, 60.0], 2.0), expected, atol=1e-5)
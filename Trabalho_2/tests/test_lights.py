@@ -0,0 +1,47 @@
+"""
+Tiled point lights (Lights_3D): per-tile light lists and tile rectangles.
+"""
+import numpy as np
+import pytest
+
+import Transform_3D
+from Lights_3D import assign_tiles, light_tile_rects
+
+def brute_force_tiles(rects, tiles_x, tiles_y):
+    tiles = [[] for _ in range(tiles_x * tiles_y)]
+    for light, (x0, y0, x1, y1) in enumerate(rects):
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                tiles[y * tiles_x + x].append(light)
+    return tiles
+
+@pytest.mark.parametrize('count', [0, 1, 50, 400])
+def test_assign_tiles_matches_brute_force(count):
+    rng = np.random.default_rng(count)
+    tiles_x, tiles_y = 12, 7
+    lo = rng.integers(0, (tiles_x, tiles_y), (count, 2))
+    hi = lo + rng.integers(-1, 5, (count, 2))  # Some empty (x1 < x0 or y1 < y0)
+    rects = np.hstack([lo, np.minimum(hi, (tiles_x - 1, tiles_y - 1))])
+
+    offsets, counts, indices = assign_tiles(rects, tiles_x, tiles_y)
+    assert len(offsets) == len(counts) == tiles_x * tiles_y
+    for tile, expected in enumerate(brute_force_tiles(rects, tiles_x, tiles_y)):
+        assert indices[offsets[tile]:offsets[tile] + counts[tile]].tolist() == expected
+
+def test_light_tile_rects():
+    width, height, tile = 64, 32, 16
+    projection = Transform_3D.perspective(90, width / height, 1.0, 50.0)
+    centers = np.array([[0.0, 0.0, -10.0],   # Small, in the middle
+                        [0.0, 0.0, -0.5],    # Crossing the near plane
+                        [0.0, 0.0, 5.0],     # Behind the camera
+                        [0.0, 0.0, -80.0],   # Past the far plane
+                        [500.0, 0.0, -10.0]])  # Off screen
+    radii = np.array([0.5, 1.0, 1.0, 1.0, 1.0])
+    rects, tiles_x, tiles_y = light_tile_rects(centers, radii, projection, width, height, tile)
+    assert (tiles_x, tiles_y) == (4, 2)
+
+    x0, y0, x1, y1 = rects[0]
+    assert x0 <= 1 < 2 <= x1 and y0 <= 0 < 1 <= y1  # Covers the 4 tiles around the center
+    assert (x1 - x0, y1 - y0) == (1, 1)
+    assert rects[1].tolist() == [0, 0, tiles_x - 1, tiles_y - 1]
+    assert ((rects[2:, 2] < rects[2:, 0]) | (rects[2:, 3] < rects[2:, 1])).all()
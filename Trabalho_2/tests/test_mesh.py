@@ -0,0 +1,56 @@
+"""
+Mesh generation helpers (Object/Mesh.py): quad order, welding and the
+vertex cache metric. NumPy only, no GL context needed.
+"""
+import numpy as np
+import pytest
+
+from Object import Mesh, Sphere, Torus
+
+@pytest.mark.parametrize('rows, cols', [(1, 1), (4, 40), (32, 32), (24, 48)])
+def test_grid_quad_order_is_a_permutation(rows, cols):
+    order = Mesh.grid_quad_order(rows, cols)
+    assert np.array_equal(np.sort(order), np.arange(rows * cols))
+
+def test_grid_quad_order_walks_bands():
+    # Narrow grids fit in one band: plain row-major order
+    assert np.array_equal(Mesh.grid_quad_order(3, 5), np.arange(15))
+    # Wider ones finish a band (all rows) before moving to the next one
+    band = Mesh.VERTEX_CACHE_SIZE // 2 - 2
+    cols = Mesh.grid_quad_order(8, 3 * band) % (3 * band)
+    assert (np.diff(cols // band) >= 0).all()
+
+def test_weld_vertices_merges_duplicates_and_drops_degenerates():
+    positions = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 0, 0], [1, 1, 0]], dtype=np.float32)
+    normals = np.tile(np.float32([0, 0, 1]), (5, 1))
+    indices = np.array([[0, 1, 2], [3, 4, 2], [1, 3, 4]], dtype=np.uint32)  # Vertex 3 == vertex 1
+    welded_positions, welded_normals, welded = Mesh.weld_vertices(positions, normals, indices)
+
+    assert len(welded_positions) == 4
+    assert welded.shape == (2, 3)  # [1, 3, 4] collapsed
+    assert np.array_equal(welded[0], [0, 1, 2])  # Renumbered in first-use order
+    assert np.array_equal(welded_positions[welded], positions[indices[:2]])
+    assert np.array_equal(welded_normals, normals[:4])
+
+def test_weld_vertices_keeps_different_normals():
+    positions = np.zeros((3, 3), dtype=np.float32)
+    positions[1, 0] = positions[2, 1] = 1
+    positions = np.vstack([positions, positions[:1]])
+    normals = np.array([[0, 0, 1]] * 3 + [[1, 0, 0]], dtype=np.float32)
+    indices = np.array([[0, 1, 2], [3, 1, 2]], dtype=np.uint32)
+    assert len(Mesh.weld_vertices(positions, normals, indices)[0]) == 4
+
+def test_average_cache_miss_ratio_bounds():
+    # No reuse at all: every corner is a miss
+    assert Mesh.average_cache_miss_ratio(np.arange(30)) == 3.0
+    # One triangle drawn over and over: only its first 3 corners miss
+    assert Mesh.average_cache_miss_ratio(np.tile([0, 1, 2], 10)) == pytest.approx(0.3)
+
+@pytest.mark.parametrize('generate, params', [
+    (Sphere.generate_sphere_mesh, (32, 32)),
+    (Torus.generate_torus_mesh, (24, 48)),
+])
+def test_generated_meshes_are_cache_friendly(generate, params):
+    positions, normals, indices = generate(*params)
+    assert indices.max() < len(positions) == len(normals)
+    assert Mesh.average_cache_miss_ratio(indices) < 0.6
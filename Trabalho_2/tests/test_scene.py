@@ -0,0 +1,125 @@
+"""
+Scenes with many objects (Scene_3D): LOD levels of the packed records and
+the SceneGraph's incremental world matrices. NumPy only.
+"""
+import numpy as np
+import pytest
+
+import Scene_3D
+import Transform_3D
+from Scene_3D import InstanceList, SceneGraph
+
+# Camera at the origin looking down -z, instances 10 units away
+VIEW = Transform_3D.identity()
+PROJECTION = Transform_3D.perspective(45.0, 1.0, 0.1, 100.0)
+HEIGHT = 500
+DISTANCE = 10.0
+
+def matrices_for(shapes, pixels):
+    """Model matrices putting each shape at DISTANCE with a bounding sphere of pixels radius on screen"""
+    _, radii = Scene_3D.shape_bounds()  # Sphere and torus are centered on their origin
+    shape_radii = radii[[Scene_3D.SHAPES.index(shape) for shape in shapes]]
+    scales = pixels * 2 * DISTANCE / (shape_radii * PROJECTION[1, 1] * HEIGHT)
+    offsets = np.linspace(-1.0, 1.0, len(shapes))
+    translations = np.stack([offsets, np.zeros(len(shapes)), np.full(len(shapes), -DISTANCE)], axis=1)
+    return Transform_3D.trs(translations, None, scales)
+
+def levels(scene):
+    return scene.select_lod(np.arange(scene.count), VIEW, PROJECTION, HEIGHT)
+
+def fresh_levels(shapes, pixels):
+    scene = InstanceList()
+    scene.add_many(shapes, ['orange'] * len(shapes), matrices_for(shapes, pixels))
+    return levels(scene)
+
+# Between LOD_PIXEL_RADII[1] and LOD_PIXEL_RADII[1] * (1 + LOD_HYSTERESIS):
+# level 2 from scratch, level 1 kept by a record that already had it
+SMALL = 15.0
+NEAR_THRESHOLD = Scene_3D.LOD_PIXEL_RADII[1] * (1 + Scene_3D.LOD_HYSTERESIS / 2)
+
+def test_lod_hysteresis_keeps_level():
+    shapes = ['sphere', 'torus']
+    scene = InstanceList()
+    scene.add_many(shapes, ['orange'] * 2, matrices_for(shapes, SMALL))
+    assert levels(scene).tolist() == [1, 1]
+    scene.set_matrices(matrices_for(shapes, NEAR_THRESHOLD))  # Same records, just grown
+    assert levels(scene).tolist() == [1, 1]
+    assert fresh_levels(shapes, NEAR_THRESHOLD).tolist() == [2, 2]
+
+def test_lod_starts_over_after_clear():
+    scene = InstanceList()
+    scene.add_many(['sphere', 'torus'], ['orange'] * 2, matrices_for(['sphere', 'torus'], SMALL))
+    levels(scene)
+    # Same count, other shape order: the old levels belong to other objects
+    scene.clear()
+    shapes = ['torus', 'sphere']
+    scene.add_many(shapes, ['orange'] * 2, matrices_for(shapes, NEAR_THRESHOLD))
+    scene._pack()
+    assert scene._lod is None  # select_lod starts every record from -1
+    assert np.array_equal(levels(scene), fresh_levels(shapes, NEAR_THRESHOLD))
+
+def random_graph(rng, count):
+    graph = SceneGraph(capacity=8)  # Also exercises _reserve
+    shapes = [None] + list(Scene_3D.SHAPES)
+    for index in range(count):
+        parent = None if index == 0 or rng.random() < 0.1 else int(rng.integers(index))
+        graph.add_node(parent, shape=shapes[rng.integers(len(shapes))],
+                       translation=rng.uniform(-2, 2, 3), rotation=rng.uniform(0, 360, 3),
+                       scale=rng.uniform(0.5, 1.5, 3))
+    return graph
+
+def full_recompute(graph):
+    """World matrices walking each node's parent chain, no caching"""
+    n = graph.count
+    local = Transform_3D.trs(graph.translations[:n], graph.rotations[:n], graph.scales[:n]).astype(np.float64)
+    world = []
+    for index in range(n):
+        matrix = np.eye(4)
+        node = index
+        while node >= 0:
+            matrix = local[node] @ matrix
+            node = graph.parents[node]
+        world.append(matrix)
+    return np.array(world)
+
+def subtree_size(graph, nodes):
+    """Nodes in the subtrees of nodes (what update() has to recompute)"""
+    inside = np.zeros(graph.count, dtype=bool)
+    inside[nodes] = True
+    for index in range(graph.count):  # Parents come before their children
+        if graph.parents[index] >= 0 and inside[graph.parents[index]]:
+            inside[index] = True
+    return int(inside.sum())
+
+def test_scene_graph_incremental_update_matches_full_recompute():
+    rng = np.random.default_rng(17)
+    graph = random_graph(rng, 300)
+    assert np.allclose(graph.world_matrices(), full_recompute(graph), atol=1e-4)
+    assert graph.update() == 0  # Nothing changed since
+
+    for _ in range(20):
+        nodes = rng.choice(graph.count, size=int(rng.integers(1, 6)), replace=False)
+        for index in nodes:
+            part = rng.integers(3)
+            value = rng.uniform(-2, 2, 3) if part == 0 else rng.uniform(0, 360, 3) if part == 1 else rng.uniform(0.5, 1.5, 3)
+            graph.set_transform(graph.node(int(index)), **{('translation', 'rotation', 'scale')[part]: value})
+        assert graph.update() == subtree_size(graph, nodes)
+        assert np.allclose(graph.world[:graph.count], full_recompute(graph), atol=1e-4)
+
+    # Vectorized setter and the flattened instances follow too
+    nodes = rng.choice(graph.count, size=10, replace=False)
+    graph.set_transforms(nodes, translations=rng.uniform(-2, 2, (10, 3)), scales=rng.uniform(0.5, 1.5, 10))
+    instances = graph.instances()
+    renderable = np.flatnonzero(graph.shapes[:graph.count] >= 0)
+    assert np.allclose(instances.matrices[:instances.count], full_recompute(graph)[renderable], atol=1e-4)
+
+def test_scene_node_properties():
+    graph = SceneGraph()
+    root = graph.add_node(translation=(1.0, 0.0, 0.0))
+    child = root.add_child(shape='cube', translation=(0.0, 2.0, 0.0), scale=2.0)
+    assert child.parent == root and root.parent is None
+    assert np.allclose(child.world_matrix[:3, 3], [1.0, 2.0, 0.0])
+    root.rotation = (0.0, 0.0, 90.0)  # The child's offset turns with its parent
+    assert np.allclose(child.world_matrix[:3, 3], [-1.0, 0.0, 0.0], atol=1e-6)
+    assert graph.recomputed == 2
+    assert np.allclose(child.scale, 2.0)
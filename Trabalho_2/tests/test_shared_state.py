@@ -0,0 +1,87 @@
+"""
+Estado3D in shared memory (Shared_3D.SharedEstado3D): seqlock round trip,
+defaults before the first write and a writer stalled mid-write.
+"""
+import struct
+
+import pytest
+
+import Shared_3D
+from Aux_3D import Estado3D
+from Shared_3D import SharedEstado3D
+
+@pytest.fixture
+def shared():
+    owner = SharedEstado3D(create=True)
+    reader = SharedEstado3D(owner.name)
+    yield owner, reader
+    reader.close()
+    owner.close()
+
+def synced(estado):
+    return (estado.light_pos, estado.shape, estado.material, estado.camera_angle, estado.lighting_model,
+            estado.rotation_x, estado.rotation_y, estado.rotation_z,
+            estado.translation_x, estado.translation_y, estado.translation_z)
+
+def test_first_read_gives_defaults(shared):
+    _, reader = shared
+    estado = Estado3D()
+    estado.shape, estado.rotation_x = 'torus', 45.0
+    assert reader.read(estado)  # The block is never all zeros
+    assert synced(estado) == synced(Estado3D())
+    assert reader.latency_ns == 0  # Defaults have no input behind them
+    assert not reader.read(estado)  # Nothing new
+
+def test_round_trip(shared):
+    owner, reader = shared
+    written = Estado3D()
+    written.light_pos = [1.0, -2.0, 0.5, 0.0]
+    written.shape, written.material = 'pyramid', 'blue'
+    written.camera_angle, written.lighting_model = 'diagonal', 'gouraud'
+    written.rotation_x, written.rotation_y, written.rotation_z = 10.0, 20.0, 30.0
+    written.translation_x, written.translation_y, written.translation_z = 0.1, 0.2, -3.0
+    assert owner.write(written, timestamp_ns=1)
+
+    estado = Estado3D()
+    assert reader.read(estado)
+    assert synced(estado) == synced(written)
+    assert reader.timestamp_ns == 1
+    assert reader.latency_ns > 0
+
+def test_identical_write_is_skipped(shared):
+    owner, reader = shared
+    version = owner.version
+    assert not owner.write(Estado3D())  # Same as the defaults already stored
+    assert owner.version == version
+    reader.read(Estado3D())
+    assert not reader.read(Estado3D())
+    assert reader.read(Estado3D(), force=True)
+
+def test_unknown_names_fall_back_to_the_first_option(shared):
+    owner, reader = shared
+    written = Estado3D()
+    written.shape, written.material = 'teapot', 'chrome'
+    owner.write(written)
+    estado = Estado3D()
+    reader.read(estado)
+    assert (estado.shape, estado.material) == (Shared_3D.SHAPES[0], Shared_3D.MATERIALS[0])
+
+def test_stalled_writer_keeps_estado(shared, monkeypatch):
+    owner, reader = shared
+    monkeypatch.setattr(Shared_3D, 'MAX_READ_RETRIES', 5)
+    written = Estado3D()
+    written.shape = 'cube'
+    owner.write(written)
+    # Writer died between the two version stores: version stays odd
+    struct.pack_into(Shared_3D.VERSION_FORMAT, owner.buf, 0, owner.version + 1)
+
+    estado = Estado3D()
+    assert not reader.read(estado)
+    assert estado.shape == 'sphere'
+    assert reader.retries == 5
+    assert reader.last_version == 0
+
+    # Once the write completes the next read picks it up
+    struct.pack_into(Shared_3D.VERSION_FORMAT, owner.buf, 0, owner.version + 1)
+    assert reader.read(estado)
+    assert estado.shape == 'cube'
@@ -0,0 +1,65 @@
+"""
+GUI -> 3D state sync protocol (Aux_3D.StateSender / StateReceiver):
+one sequenced delta per flush, stale fields dropped per field.
+"""
+import queue
+
+from Aux_3D import Estado3D, StateSender, StateReceiver
+
+def state_message(seq, **fields):
+    return {'type': 'state', 'seq': seq, 'fields': fields, 't': 0}
+
+def test_flush_sends_only_changed_fields_once():
+    gui = Estado3D()
+    cmd_queue = queue.Queue()
+    sender = StateSender(cmd_queue, gui)
+    assert not sender.flush()  # Nothing changed yet
+
+    gui.shape = 'torus'
+    gui.rotation_x += 10.0
+    gui.shape = 'cube'  # Several changes in one frame -> one message, last value
+    assert sender.flush(timestamp_ns=123)
+    msg = cmd_queue.get_nowait()
+    assert msg['seq'] == 1 and msg['t'] == 123
+    assert msg['fields'] == {'shape': 'cube', 'rotation_x': gui.rotation_x}
+    assert not sender.flush()
+    assert cmd_queue.empty()
+
+def test_receiver_applies_messages_in_order():
+    gui, renderer = Estado3D(), Estado3D()
+    cmd_queue = queue.Queue()
+    sender, receiver = StateSender(cmd_queue, gui), StateReceiver(renderer)
+    gui.material = 'blue'
+    sender.flush()
+    gui.light_pos[0] = 2.0
+    sender.flush()
+
+    while not cmd_queue.empty():
+        assert receiver.apply(cmd_queue.get_nowait())
+    assert renderer.material == 'blue'
+    assert renderer.light_pos == gui.light_pos
+    assert receiver.dropped == 0
+
+def test_receiver_drops_stale_fields_only():
+    estado = Estado3D()
+    receiver = StateReceiver(estado)
+    assert receiver.apply(state_message(2, shape='torus', rotation_y=5.0))
+    # Older message: its shape is stale, its material was never written by a newer one
+    assert receiver.apply(state_message(1, shape='cube', material='blue'))
+    assert estado.shape == 'torus'
+    assert estado.material == 'blue'
+    assert estado.rotation_y == 5.0
+    assert receiver.dropped == 1
+
+    # Same sequence number again (duplicate) is stale too
+    assert not receiver.apply(state_message(2, shape='cube'))
+    assert estado.shape == 'torus'
+    assert receiver.dropped == 2
+
+def test_receiver_ignores_unknown_fields_and_unchanged_values():
+    estado = Estado3D()
+    receiver = StateReceiver(estado)
+    assert not receiver.apply(state_message(1, scene='not synced'))
+    assert estado.scene is None
+    assert not receiver.apply(state_message(2, shape=estado.shape))
+    assert receiver.dropped == 0
@@ -0,0 +1,63 @@
+"""
+NumPy transform matrices (Transform_3D) against the matrices the GLU / GL
+calls they replace build (see the gluPerspective, gluLookAt and glRotatef
+man pages).
+"""
+import numpy as np
+import pytest
+
+import Transform_3D
+
+def glu_perspective(fovy, aspect, near, far):
+    f = 1.0 / np.tan(np.radians(fovy) / 2)
+    return np.array([[f / aspect, 0, 0, 0],
+                     [0, f, 0, 0],
+                     [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+                     [0, 0, -1, 0]])
+
+def test_perspective_known_values():
+    # f = 1: z from [-1, -3] maps to [-1, 1]
+    assert np.allclose(Transform_3D.perspective(90.0, 1.0, 1.0, 3.0),
+                       [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, -2, -3], [0, 0, -1, 0]])
+    for args in [(45.0, 700 / 700, 0.1, 100.0), (60.0, 2.0, 0.5, 10.0), (30.0, 0.75, 1.0, 1000.0)]:
+        assert np.allclose(Transform_3D.perspective(*args), glu_perspective(*args), rtol=1e-5)
+
+def test_perspective_maps_near_and_far_planes():
+    projection = Transform_3D.perspective(45.0, 1.5, 0.1, 100.0).astype(np.float64)
+    for z, ndc in [(-0.1, -1.0), (-100.0, 1.0)]:
+        clip = projection @ [0.0, 0.0, z, 1.0]
+        assert clip[2] / clip[3] == pytest.approx(ndc, abs=1e-4)
+
+@pytest.mark.parametrize('eye, up, expected', [
+    # Main_3d camera views: front and side
+    ((0, 0, 8), (0, 1, 0), [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, -8], [0, 0, 0, 1]]),
+    ((8, 0, 0), (0, 1, 0), [[0, 0, -1, 0], [0, 1, 0, 0], [1, 0, 0, -8], [0, 0, 0, 1]]),
+    ((0, 8, 0), (0, 0, -1), [[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, -8], [0, 0, 0, 1]]),
+])
+def test_look_at_known_values(eye, up, expected):
+    assert np.allclose(Transform_3D.look_at(eye, (0, 0, 0), up), expected, atol=1e-6)
+
+def test_look_at_puts_center_ahead():
+    rng = np.random.default_rng(20)
+    for _ in range(50):
+        eye, center = rng.uniform(-10, 10, 3), rng.uniform(-10, 10, 3)
+        up = rng.uniform(-1, 1, 3)
+        view = Transform_3D.look_at(eye, center, up).astype(np.float64)
+        assert np.allclose(view[:3, :3] @ view[:3, :3].T, np.eye(3), atol=1e-5)  # Rigid
+        assert np.allclose(view @ np.append(eye, 1.0), [0, 0, 0, 1], atol=1e-4)
+        assert np.allclose(view @ np.append(center, 1.0), [0, 0, -np.linalg.norm(center - eye), 1], atol=1e-4)
+        assert (view[1, :3] @ up) >= -1e-6  # up stays up
+
+def test_rotations_follow_gl_rotate():
+    # glRotatef(90, axis): counterclockwise looking down the axis
+    assert np.allclose(Transform_3D.rotate_x(90) @ [0, 1, 0, 1], [0, 0, 1, 1], atol=1e-6)
+    assert np.allclose(Transform_3D.rotate_y(90) @ [0, 0, 1, 1], [1, 0, 0, 1], atol=1e-6)
+    assert np.allclose(Transform_3D.rotate_z(90) @ [1, 0, 0, 1], [0, 1, 0, 1], atol=1e-6)
+    # Batched Euler angles: Rx @ Ry @ Rz, like the glRotatef sequence in render_3d_to_texture
+    angles = np.array([[10.0, 20.0, 30.0], [-45.0, 90.0, 5.0]])
+    expected = [Transform_3D.rotate_x(a) @ Transform_3D.rotate_y(b) @ Transform_3D.rotate_z(c) for a, b, c in angles]
+    assert np.allclose(Transform_3D.rotate_xyz(angles), expected)
+
+def test_to_gl_is_column_major():
+    matrix = Transform_3D.translate([1.0, 2.0, 3.0])
+    assert np.array_equal(Transform_3D.to_gl(matrix).reshape(-1)[12:15], [1.0, 2.0, 3.0])